@@ -5,7 +5,11 @@ from .models import (
     WalletUser,
     Transaction,
     Asset,
+    AssetPrice,
     EconomicIndex,
+    EconomicIndexObservation,
+    SupabaseOutbox,
+    WalletDailySnapshot,
 )
 
 admin.site.register(KeiboUser)
@@ -17,6 +21,13 @@ class EconomicIndexAdmin(admin.ModelAdmin):
     search_fields = ['id']
 
 
+@admin.register(EconomicIndexObservation)
+class EconomicIndexObservationAdmin(admin.ModelAdmin):
+    list_display = ['series', 'date', 'value']
+    list_filter = ['series']
+    search_fields = ['series']
+
+
 @admin.register(Asset)
 class AssetAdmin(admin.ModelAdmin):
     list_display = ['id', 'category', 'exchange_rate']
@@ -24,6 +35,12 @@ class AssetAdmin(admin.ModelAdmin):
     search_fields = ['id']
 
 
+@admin.register(AssetPrice)
+class AssetPriceAdmin(admin.ModelAdmin):
+    list_display = ['asset', 'date', 'exchange_rate']
+    list_filter = ['asset']
+
+
 @admin.register(Wallet)
 class WalletAdmin(admin.ModelAdmin):
     list_display = [
@@ -47,14 +64,20 @@ class WalletUserAdmin(admin.ModelAdmin):
 
 @admin.register(Transaction)
 class TransactionAdmin(admin.ModelAdmin):
-    list_display = [
-        'wallet',
-        'executed_at',
-        'settled_at',
-        'category',
-        'amount',
-        'tags'
-    ]
+    list_display = ['wallet', 'executed_at', 'settled_at', 'category', 'amount', 'tags']
     list_filter = ['executed_at']
     search_fields = ['wallet__name']
     raw_id_fields = ['wallet']
+
+
+@admin.register(WalletDailySnapshot)
+class WalletDailySnapshotAdmin(admin.ModelAdmin):
+    list_display = ['wallet', 'date', 'closing_balance', 'inflow', 'outflow']
+    list_filter = ['date']
+    raw_id_fields = ['wallet']
+
+
+@admin.register(SupabaseOutbox)
+class SupabaseOutboxAdmin(admin.ModelAdmin):
+    list_display = ['table', 'row_id', 'queued_at', 'attempts', 'next_attempt_at']
+    list_filter = ['table']
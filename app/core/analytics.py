@@ -0,0 +1,227 @@
+from datetime import date
+from typing import NamedTuple
+import numpy as np
+from django.db import connection
+from django.utils import timezone
+from .cache import cached_for_user, get_all_assets
+from .models import Transaction, Wallet, WalletUser
+from .valuation import get_deflator
+
+DEFAULT_MONTHS = 24
+MAX_MONTHS = 12 * 20
+DEFAULT_WINDOW = 3
+DEFAULT_HORIZON = 6
+MAX_HORIZON = 24
+# Weight of the latest month in the exponential smoothing
+SMOOTHING_ALPHA = 0.4
+
+# The spending of a user as four arrays (one row, one round trip), summed
+# per day, category and asset since nothing finer is used: UTC day number
+# since the epoch, category, asset and outflow in the asset
+_SPENDING_COLUMNS_SQL = """
+SELECT
+    COALESCE(array_agg(day), '{{}}'),
+    COALESCE(array_agg(category), '{{}}'),
+    COALESCE(array_agg(asset_id), '{{}}'),
+    COALESCE(array_agg(outflow), '{{}}')
+FROM (
+    SELECT
+        FLOOR(EXTRACT(EPOCH FROM t.executed_at) / 86400)::int AS day,
+        t.category,
+        w.asset_id,
+        SUM(-t.amount)::float8 AS outflow
+    FROM "{transaction}" t
+    JOIN "{wallet_user}" wu ON wu.wallet_id = t.wallet_id
+    JOIN "{wallet}" w ON w.id = t.wallet_id
+    WHERE wu.user_id = %s AND t.executed_at >= %s AND t.amount < 0
+    GROUP BY day, t.category, w.asset_id
+) per_day
+""".format(
+    transaction=Transaction._meta.db_table,
+    wallet_user=WalletUser._meta.db_table,
+    wallet=Wallet._meta.db_table,
+)
+
+
+class SpendingColumns(NamedTuple):
+    days: np.ndarray  # int64 days since 1970-01-01
+    categories: np.ndarray  # int64 index into category_names
+    assets: np.ndarray  # int64 index into asset_names
+    spending: np.ndarray  # float64, in the asset (see in_usd)
+    category_names: list
+    asset_names: list
+
+
+def month_number(days):
+    # Months since 1970-01 of day numbers
+    return days.astype('datetime64[D]').astype('datetime64[M]').astype(np.int64)
+
+
+def month_label(month):
+    return str(np.datetime64(int(month), 'M'))
+
+
+def _codes(values):
+    names, codes = np.unique(np.array(values, dtype=object), return_inverse=True)
+    return [str(name) for name in names], codes.astype(np.int64)
+
+
+def load_spending_columns(user_id, since) -> SpendingColumns:
+    with connection.cursor() as cursor:
+        cursor.execute(_SPENDING_COLUMNS_SQL, [user_id, since])
+        days, categories, assets, spending = cursor.fetchone()
+    category_names, category_codes = _codes(categories)
+    asset_names, asset_codes = _codes(assets)
+    return SpendingColumns(
+        days=np.array(days, dtype=np.int64),
+        categories=category_codes,
+        assets=asset_codes,
+        spending=np.array(spending, dtype=np.float64),
+        category_names=category_names,
+        asset_names=asset_names,
+    )
+
+
+def in_usd(columns: SpendingColumns) -> SpendingColumns:
+    # Spending at the current rate of each asset (0 for a deleted asset)
+    rates = {asset['id']: asset['exchange_rate'] for asset in get_all_assets()}
+    asset_rates = np.array(
+        [float(rates.get(name) or 0) for name in columns.asset_names],
+        dtype=np.float64,
+    )
+    return columns._replace(spending=columns.spending * asset_rates[columns.assets])
+
+
+def deflate(days, amounts, series):
+    """
+    Express amounts in prices of the latest year of an annual inflation
+    series. Years after the latest observation keep its price level, years
+    before the first one use the first.
+    """
+    deflator = get_deflator(series)
+    if deflator is None:
+        return amounts
+    return amounts * (deflator.values[-1] / deflator.at(days))
+
+
+def monthly_spending(columns: SpendingColumns, spending, first_month, n_months):
+    # (months, categories) matrix of the spending
+    n_categories = len(columns.category_names)
+    cells = (
+        month_number(columns.days) - first_month
+    ) * n_categories + columns.categories
+    in_range = (cells >= 0) & (cells < n_months * n_categories)
+    return np.bincount(
+        cells[in_range], weights=spending[in_range], minlength=n_months * n_categories
+    ).reshape(n_months, n_categories)
+
+
+def rolling_mean(matrix, window):
+    # Trailing mean along the rows, over the available rows for the first ones
+    totals = np.vstack([np.zeros((1, matrix.shape[1])), np.cumsum(matrix, axis=0)])
+    ends = np.arange(1, matrix.shape[0] + 1)
+    starts = np.maximum(ends - window, 0)
+    return (totals[ends] - totals[starts]) / (ends - starts)[:, None]
+
+
+def seasonal_index(matrix, months_of_year):
+    """
+    Average of each calendar month over the mean month, per column.
+    1 means a typical month, calendar months without data are neutral.
+    """
+    sums = np.zeros((12, matrix.shape[1]))
+    np.add.at(sums, months_of_year, matrix)
+    counts = np.bincount(months_of_year, minlength=12)[:, None]
+    overall = matrix.mean(axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        index = (sums / counts) / overall
+    return np.where(np.isfinite(index) & (counts > 0), index, 1.0)
+
+
+def smoothed_level(matrix, alpha=SMOOTHING_ALPHA):
+    """
+    Last level of simple exponential smoothing along the rows, computed as a
+    weighted sum: level = sum(alpha * (1 - alpha)^(n-1-t) * y_t) with the
+    first row as the initial level.
+    """
+    n = matrix.shape[0]
+    weights = alpha * (1 - alpha) ** np.arange(n - 1, -1, -1, dtype=np.float64)
+    weights[0] = (1 - alpha) ** (n - 1)
+    return weights @ matrix
+
+
+def analyze_spending(
+    columns: SpendingColumns,
+    first_month,
+    n_months,
+    window=DEFAULT_WINDOW,
+    horizon=DEFAULT_HORIZON,
+    spending=None,
+) -> dict:
+    """
+    :param spending: Replaces the spending of the columns, e.g. deflated.
+    """
+    spending = columns.spending if spending is None else spending
+    monthly = monthly_spending(columns, spending, first_month, n_months)
+    months = first_month + np.arange(n_months)
+    seasonal = seasonal_index(monthly, months % 12)
+    # Smooth the seasonally adjusted series, then put the season back. A
+    # calendar month without spending (index 0) adds nothing to the level.
+    factors = seasonal[months % 12]
+    adjusted = np.divide(
+        monthly, factors, out=np.zeros(monthly.shape), where=factors > 0
+    )
+    level = smoothed_level(adjusted)
+    future_months = months[-1] + 1 + np.arange(horizon)
+    forecast = level[None, :] * seasonal[future_months % 12]
+
+    # 1970-01-01 was a Thursday, 0 is Monday
+    weekday_totals = np.bincount(
+        (columns.days + 3) % 7, weights=spending, minlength=7
+    ).astype(np.float64)
+    total = weekday_totals.sum()
+    weekday_share = weekday_totals / total if total else weekday_totals
+
+    return {
+        'categories': columns.category_names,
+        'months': [month_label(month) for month in months],
+        'monthly': monthly.round(2).tolist(),
+        'rolling_mean': rolling_mean(monthly, window).round(2).tolist(),
+        # 12 rows, January first
+        'seasonality': seasonal.round(3).tolist(),
+        'weekday_share': weekday_share.round(4).tolist(),
+        'forecast': {
+            'months': [month_label(month) for month in future_months],
+            'by_category': forecast.round(2).tolist(),
+            'total': forecast.sum(axis=1).round(2).tolist(),
+        },
+    }
+
+
+def get_spending_analytics(
+    user_id,
+    months=DEFAULT_MONTHS,
+    window=DEFAULT_WINDOW,
+    horizon=DEFAULT_HORIZON,
+    deflator=None,
+) -> dict:
+    """
+    Spending of a user per month and category over the last months (the
+    current one included), with trailing averages, seasonality and forecast.
+    :param deflator: Annual inflation series used to express the amounts in
+    prices of its latest year.
+    The spending per day is cached per user until their transactions
+    change, the rates and the deflator are applied on every call.
+    """
+    today = timezone.now().date()
+    first_month = (today.year - 1970) * 12 + today.month - 1 - months + 1
+    since = date(1970 + first_month // 12, first_month % 12 + 1, 1)
+    columns = cached_for_user(
+        user_id,
+        f'spending_columns:{since.isoformat()}',
+        lambda: load_spending_columns(user_id, since),
+        depends_on=(),
+    )
+    columns = in_usd(columns)
+    spending = deflate(columns.days, columns.spending, deflator) if deflator else None
+    return analyze_spending(columns, first_month, months, window, horizon, spending)
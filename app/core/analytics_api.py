@@ -0,0 +1,61 @@
+from rest_framework import status
+from rest_framework.decorators import (
+    api_view,
+    authentication_classes,
+    permission_classes,
+)
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from .authentication import TokenUserJWTAuthentication
+from .analytics import (
+    DEFAULT_HORIZON,
+    DEFAULT_MONTHS,
+    DEFAULT_WINDOW,
+    MAX_HORIZON,
+    MAX_MONTHS,
+    get_spending_analytics,
+)
+from .api_index import INFLATION_BY_CURRENCY
+
+
+def bounded_int_param(params, name, default, minimum, maximum):
+    try:
+        value = int(params.get(name, default))
+    except ValueError:
+        raise ValueError(f'{name} should be an integer.')
+    if not minimum <= value <= maximum:
+        raise ValueError(f'{name} should be between {minimum} and {maximum}.')
+    return value
+
+
+@api_view(['GET'])
+@authentication_classes([TokenUserJWTAuthentication])
+@permission_classes([IsAuthenticated])
+def get_spending(request):
+    # ?months=24&window=3&horizon=6&deflate=usd
+    params = request.query_params
+    try:
+        months = bounded_int_param(params, 'months', DEFAULT_MONTHS, 1, MAX_MONTHS)
+        window = bounded_int_param(params, 'window', DEFAULT_WINDOW, 1, MAX_MONTHS)
+        horizon = bounded_int_param(params, 'horizon', DEFAULT_HORIZON, 1, MAX_HORIZON)
+    except ValueError as e:
+        return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    deflator = None
+    if params.get('deflate'):
+        deflator = INFLATION_BY_CURRENCY.get(params['deflate'].lower())
+        if deflator is None:
+            return Response(
+                {'detail': f'No inflation series for {params["deflate"]}.'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+    return Response(
+        get_spending_analytics(
+            request.user.id,
+            months=months,
+            window=window,
+            horizon=horizon,
+            deflator=deflator,
+        )
+    )
@@ -7,20 +7,26 @@ from djoser.conf import settings
 from djoser.compat import get_user_email, get_user_email_field_name
 from djoser.utils import ActionViewMixin
 from django.http import JsonResponse
-from ..serializers import KeiboUserSerializer
+from ..serializers import KeiboUserSerializer, UserSearchResultSerializer
+from ..metrics import query_budget
 from ..models import KeiboUser
+from ..user_search import SEARCH_LIMIT, SEARCH_MAX_LIMIT, search_users as find_users
 
 
+@query_budget(3)
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def search_users(request, keyword=None):
-    # keyword = request.query_params.get('keyword', '')
-    # Filter users based on the keyword in email
+    # ?limit=10 (at most SEARCH_MAX_LIMIT)
     if keyword == None:
         return Response([], status=status.HTTP_200_OK)
-    users = KeiboUser.objects.filter(email__icontains=keyword, is_active=True)
-    # Serialize the queryset
-    serializer = KeiboUserSerializer(users, many=True)
+    try:
+        limit = int(request.query_params.get('limit', SEARCH_LIMIT))
+    except ValueError:
+        limit = SEARCH_LIMIT
+    limit = min(max(limit, 1), SEARCH_MAX_LIMIT)
+    users = find_users(keyword, limit)
+    serializer = UserSearchResultSerializer(users, many=True)
 
     return Response(serializer.data, status=status.HTTP_200_OK)
 
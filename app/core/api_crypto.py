@@ -1,7 +1,8 @@
 import requests
 import logging
-from core.lib.supabase.api.update_asset import update_asset
-from core.models import Asset, AssetCategory
+from core.ingestion import ingest_asset_rates, to_exchange_rate
+from core.models import AssetCategory
+from core.providers import CRYPTO_PRICES
 from keibo.settings import (
     API_PROVIDER_KEY_HEADER,
     API_PROVIDER_HOST_HEADER,
@@ -38,9 +39,11 @@ SUPPORTED_CRYPTOS = {
 }
 
 
-def get_crypto_prices(debug=False):
-    url = API_CRYPTO_PRICES
-
+def fetch_crypto_prices():
+    """
+    :raise requests.exceptions.RequestException:
+    :raise ValueError: For a body that isn't JSON.
+    """
     querystring = {
         "ids": ",".join(SUPPORTED_CRYPTOS),
         "vs_currencies": "usd",
@@ -51,42 +54,32 @@ def get_crypto_prices(debug=False):
         API_PROVIDER_HOST_HEADER: API_CRYPTO_PRICES_HOST,
     }
 
+    return CRYPTO_PRICES.get_json(
+        API_CRYPTO_PRICES, params=querystring, headers=headers
+    )
+
+
+def get_crypto_prices(debug=False):
     try:
-        response = requests.get(
-            url, headers=headers, params=querystring
-        )  # type: ignore
-        response.raise_for_status()  # Raises a HTTPError if the response status is 4xx, 5xx
-    except requests.exceptions.RequestException as e:
-        logger.info(f"Request to {url} failed with exception: {e}")
+        data = fetch_crypto_prices()
+    except (requests.exceptions.RequestException, ValueError) as e:
+        logger.info(f"Request to {API_CRYPTO_PRICES} failed with exception: {e}")
         return
 
-    crypto_data = response.json()
+    return ingest_crypto_prices(data, debug)
+
+
+def ingest_crypto_prices(data, debug=False):
+    return ingest_asset_rates(
+        parse_crypto_prices(data), AssetCategory.CRYPTO, "Crypto", debug
+    )
+
 
-    new_assets = 0
-    updated_assets = 0
+def parse_crypto_prices(crypto_data):
+    # {"bitcoin": {"usd": 43000.1}, ...} -> {"bitcoin": Decimal("43000.1"), ...}
+    rates = {}
     for crypto, details in crypto_data.items():
-        rate = details.get("usd")
+        rate = to_exchange_rate(details.get("usd"))
         if rate is not None:
-            crypto = crypto.lower()
-            update_asset(crypto, rate)
-            try:
-                asset = Asset.objects.get(id=crypto)
-                if asset.exchange_rate != rate:
-                    if debug:
-                        logger.info(
-                            f"Crypto updated: {crypto} to usd ratio (price) : {rate}$"
-                        )
-                    asset.exchange_rate = rate
-                    asset.save()
-                    updated_assets += 1
-            except Asset.DoesNotExist:
-                if debug:
-                    logger.info(
-                        f"Crypto added: {crypto} to usd ratio (price) : {rate}$"
-                    )
-                new_assets += 1
-                Asset.objects.create(
-                    id=crypto, exchange_rate=rate, category=AssetCategory.CRYPTO
-                )
-    if debug:
-        logger.info(f"Crypto: added {new_assets} and updated {updated_assets} assets!")
+            rates[crypto.lower()] = rate
+    return rates
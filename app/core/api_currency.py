@@ -1,8 +1,9 @@
 import requests
 import logging
 from decimal import Decimal
-from core.lib.supabase.api.update_asset import update_asset
-from core.models import Asset, AssetCategory
+from core.ingestion import ingest_asset_rates, to_exchange_rate
+from core.models import AssetCategory
+from core.providers import EXCHANGE_RATES
 from keibo.settings import (
     API_PROVIDER_KEY_HEADER,
     API_PROVIDER_HOST_HEADER,
@@ -29,23 +30,37 @@ SUPPORTED_CURRENCIES = {
 }
 
 
-def get_exchange_rates(debug=False):
-    url = API_EXCHANGE_RATES
-
+def fetch_exchange_rates():
+    """
+    :raise requests.exceptions.RequestException:
+    :raise ValueError: For a body that isn't JSON.
+    """
     headers = {
         API_PROVIDER_KEY_HEADER: API_PROVIDER_KEY,
         API_PROVIDER_HOST_HEADER: API_EXCHANGE_RATES_HOST,
     }
 
+    return EXCHANGE_RATES.get_json(API_EXCHANGE_RATES, headers=headers)
+
+
+def get_exchange_rates(debug=False):
     try:
-        response = requests.get(url, headers=headers)  # type: ignore
+        data = fetch_exchange_rates()
+    except (requests.exceptions.RequestException, ValueError) as e:
+        logger.info(f"Request to {API_EXCHANGE_RATES} failed with exception: {e}")
+        return
+
+    return ingest_exchange_rates(data, debug)
+
 
-        response.raise_for_status()  # Raises a HTTPError if the response status is 4xx, 5xx
-    except requests.exceptions.RequestException as e:
-        logger.info(f"Request to {url} failed with exception: {e}")
+def ingest_exchange_rates(data, debug=False):
+    rates = parse_exchange_rates(data)
+    if rates is None:
         return
+    return ingest_asset_rates(rates, AssetCategory.CASH, "Currencies", debug)
 
-    data = response.json()
+
+def parse_exchange_rates(data):
     rates = data.get("rates")
 
     if not isinstance(rates, dict):
@@ -66,30 +81,15 @@ def get_exchange_rates(debug=False):
             )
             return
 
-    new_assets = 0
-    updated_assets = 0
+    inversed_rates = {}
     for currency, rate in rates.items():
         currency = currency.lower()
         # Register only supported currencies
-        if currency in SUPPORTED_CURRENCIES:
+        if currency in SUPPORTED_CURRENCIES and rate:
             # Inverse the rate to format 1X = ?USD
             # Although it's not ideal for some currencies with so many decimals,
             # it should be standardized this way - just like crypto, equity, funds etc.
-            inversed_rate = 1 / rate
-            if debug:
-                logger.info(f"1 {currency} to usd exchange ratio : {inversed_rate}")
-            update_asset(currency, inversed_rate)
-            try:
-                asset = Asset.objects.get(id=currency)
-                asset.exchange_rate = inversed_rate
-                asset.save()
-                updated_assets += 1
-            except Asset.DoesNotExist:
-                new_assets += 1
-                Asset.objects.create(
-                    id=currency,
-                    exchange_rate=inversed_rate,
-                    category=AssetCategory.CASH,
-                )
-
-    logger.info(f"Currencies: added {new_assets} and updated {updated_assets} assets!")
+            inversed_rate = to_exchange_rate(1 / Decimal(str(rate)))
+            if inversed_rate is not None:
+                inversed_rates[currency] = inversed_rate
+    return inversed_rates
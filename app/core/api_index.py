@@ -1,9 +1,20 @@
-import copy
-import requests
 import logging
-from core.lib.supabase.api.update_eco_index import update_eco_index
-from core.models import EconomicIndex
-from keibo.settings import API_FRED_KEY, API_ECOS_BOK_KR_KEY
+import time
+from django.core.cache import cache
+from core.history import (
+    compute_index_rows,
+    latest_observation_dates,
+    store_index_observations,
+)
+from core.ingestion import ingest_economic_indexes
+from core.lib.concurrent_fetch import describe_fetch_error, fetch_json_concurrently
+from core.providers import ECOS, FRED
+from keibo.settings import (
+    API_FRED_KEY,
+    API_FRED_URL,
+    API_ECOS_BOK_KR_KEY,
+    API_ECOS_URL,
+)
 from datetime import datetime, timedelta
 from decimal import Decimal
 from typing import List
@@ -27,13 +38,6 @@ def get_past_date_in_yyyy_mm(days: int, without_dash=False):
     return date_ago.strftime("%Y-%m")
 
 
-def get_list_item(list, index):
-    if index >= 0:
-        return list[index] if len(list) > abs(index) else None
-    else:
-        return list[index] if len(list) >= abs(index) else None
-
-
 def str_can_be_decimal(string):
     try:
         Decimal(string)
@@ -77,160 +81,280 @@ INFLATION_AED = "FPCPITOTLZGARE"
 # Switzerland Franc
 INFLATION_CHF = "FPCPITOTLZGCHE"
 
-
-def get_stlouisfed_observation(seriesid, interval="monthly", debug=False):
-    observation_start = get_past_date_in_yyyy_mm_dd(
-        4030 if interval == "annual" else 32 if interval == "daily" else 403
+# Annual inflation series of the currencies that have one
+INFLATION_BY_CURRENCY = {
+    "eur": INFLATION_EURO_ZONE,
+    "usd": INFLATION_USD,
+    "krw": INFLATION_KRW,
+    "cny": INFLATION_YUAN,
+    "jpy": INFLATION_YEN,
+    "rub": INFLATION_RUBLE,
+    "gbp": INFLATION_GBP,
+    "idr": INFLATION_IDR,
+    "inr": INFLATION_RUPEE,
+    "aed": INFLATION_AED,
+    "chf": INFLATION_CHF,
+}
+
+# Korea
+BOK_BASE_RATE = "722Y001"
+
+# Sources
+STLOUISFED = "stlouisfed"
+ECOS_BOK_KR = "ecos_bok_kr"
+
+# Every index refreshed by get_all_indexes: (series id, source, interval)
+INDEX_SERIES = [
+    (FED_FUNDS_RATE_ID, STLOUISFED, "monthly"),
+    (ECB_DEPOSIT_FACILITY_RATE, STLOUISFED, "weekly"),
+    (ECB_MAIN_REFINANCING_OPERATION_RATE, STLOUISFED, "weekly"),
+    (ECB_MARGINAL_LENDING_FACILITY_RATE, STLOUISFED, "weekly"),
+    (BOK_BASE_RATE, ECOS_BOK_KR, "monthly"),
+    (INFLATION_EURO_ZONE, STLOUISFED, "annual"),
+    (INFLATION_USD, STLOUISFED, "annual"),
+    (INFLATION_KRW, STLOUISFED, "annual"),
+    (INFLATION_YUAN, STLOUISFED, "annual"),
+    (INFLATION_YEN, STLOUISFED, "annual"),
+    (INFLATION_RUBLE, STLOUISFED, "annual"),
+    (INFLATION_GBP, STLOUISFED, "annual"),
+    (INFLATION_IDR, STLOUISFED, "annual"),
+    (INFLATION_RUPEE, STLOUISFED, "annual"),
+    (INFLATION_AED, STLOUISFED, "annual"),
+    (INFLATION_CHF, STLOUISFED, "annual"),
+]
+
+# Upper bound of simultaneous requests to the index providers
+INDEX_FETCH_MAX_WORKERS = 8
+
+INDEX_CLIENTS = {STLOUISFED: FRED, ECOS_BOK_KR: ECOS}
+
+# Responses are kept per series and window (the observations after the last
+# stored one), so storing a new observation moves to another entry. Per
+# interval: seconds during which the response is used instead of calling the
+# provider, then seconds during which it is still used while a background
+# task (tasks.refresh_indexes) fetches a new one.
+INDEX_RESPONSE_TTLS = {
+    "daily": (60 * 60, 60 * 60 * 6),
+    "weekly": (60 * 60 * 6, 60 * 60 * 24 * 2),
+    "monthly": (60 * 60 * 24, 60 * 60 * 24 * 7),
+    "annual": (60 * 60 * 24 * 7, 60 * 60 * 24 * 30),
+}
+# A series is refreshed by one task at a time
+INDEX_REFRESH_LOCK_TTL = 60 * 10  # seconds
+
+
+def stlouisfed_observation_url(seriesid, interval="monthly", observation_start=None):
+    # Without a stored history, fetch a window long enough for every delta
+    # (annual series are published with a delay of a few years)
+    observation_start = observation_start or get_past_date_in_yyyy_mm_dd(
+        5480 if interval == "annual" else 430
     )
     frequency = (
         "a"
         if interval == "annual"
         else "w" if interval == "weekly" else "d" if interval == "daily" else "m"
     )
-    url = f"https://api.stlouisfed.org/fred/series/observations?series_id={seriesid}&api_key={API_FRED_KEY}&file_type=json&observation_start={observation_start}&frequency={frequency}&sort_order=desc"
-    response = requests.get(url)
-    data = response.json()
+    return f"{API_FRED_URL}?series_id={seriesid}&api_key={API_FRED_KEY}&file_type=json&observation_start={observation_start}&frequency={frequency}&sort_order=desc"
+
+
+def parse_stlouisfed_observations(seriesid, data, debug=False):
     observations = data["observations"]
     if debug:
         for item in observations:
-            logger.info(f"{item['date']} : {item['value']}%")
-
-    latest_rate = None
+            logger.info(f"{seriesid} {item['date']} : {item['value']}%")
     # if the data hasn't been updated on the api provider end, it returns a dot instead of numeric value.
     # it is necessary to skip these values if exists.
-    offset = 0
-    for item in observations:
-        if str_can_be_decimal(item["value"]):
-            latest_rate = Decimal(item["value"])
-            break
-        else:
-            offset += 1
-    if latest_rate == None:
-        logger.info(f"Could not fetch the current value of ({seriesid}) index!")
-        return
-    yesterday, last_week, last_month, last_year, last_decade = (
-        None,
-        None,
-        None,
-        None,
-        None,
-    )
-    daily_delta, weekly_delta, monthly_delta, yearly_delta, decennial_delta = (
-        None,
-        None,
-        None,
-        None,
-        None,
-    )
-    if interval == "annual":
-        last_year = get_list_item(observations, offset + 1)
-        last_decade = get_list_item(observations, offset + 9)
-    if interval == "monthly":
-        last_month = get_list_item(observations, offset + 1)
-        last_year = get_list_item(observations, offset + 12)
-    elif interval == "weekly":
-        last_week = get_list_item(observations, offset + 1)
-        last_month = get_list_item(observations, offset + 3)
-        last_year = get_list_item(observations, offset + 51)
-    elif interval == "daily":
-        yesterday = get_list_item(observations, offset + 1)
-        last_week = get_list_item(observations, offset + 6)
-        last_month = get_list_item(observations, offset + 29)
-        last_year = get_list_item(observations, offset + 364)
-    if yesterday:
-        if str_can_be_decimal(yesterday["value"]):
-            daily_delta = latest_rate - Decimal(yesterday["value"])
-    if last_week:
-        if str_can_be_decimal(last_week["value"]):
-            weekly_delta = latest_rate - Decimal(last_week["value"])
-    if last_month:
-        if str_can_be_decimal(last_month["value"]):
-            monthly_delta = latest_rate - Decimal(last_month["value"])
-    if last_year:
-        if str_can_be_decimal(last_year["value"]):
-            yearly_delta = latest_rate - Decimal(last_year["value"])
-    if last_decade:
-        if str_can_be_decimal(last_decade["value"]):
-            decennial_delta = latest_rate - Decimal(last_decade["value"])
-
-    created = False
-
-    kwargs = {"id": seriesid, "value": latest_rate}
-    if daily_delta != None:
-        kwargs["daily_delta"] = daily_delta
-    if weekly_delta != None:
-        kwargs["weekly_delta"] = weekly_delta
-    if monthly_delta != None:
-        kwargs["monthly_delta"] = monthly_delta
-    if yearly_delta != None:
-        kwargs["yearly_delta"] = yearly_delta
-    if decennial_delta != None:
-        kwargs["decennial_delta"] = decennial_delta
-    # START - SUPA PLUGIN
-    update_eco_index(kwargs)
-    # END - SUPA PLUGIN
-    try:
-        index = EconomicIndex.objects.get(id=seriesid)
-        for key, value in kwargs.items():
-            setattr(index, key, value)
-        index.save()
-    except EconomicIndex.DoesNotExist:
-        created = True
-        index = EconomicIndex.objects.create(**kwargs)
-    logger.info(
-        f"Successfully {'created' if created else 'updated'} economic index ({seriesid}) : ({latest_rate})%"
-    )
+    return [
+        (datetime.strptime(item["date"], "%Y-%m-%d").date(), Decimal(item["value"]))
+        for item in observations
+        if str_can_be_decimal(item["value"])
+    ]
 
 
-def get_ecos_bok_kr(asset_class, debug=False):
-    year_ago = get_past_date_in_yyyy_mm(365, True)
+def get_stlouisfed_observation(seriesid, interval="monthly", debug=False):
+    update_indexes([(seriesid, STLOUISFED, interval)], debug)
+
+
+def ecos_bok_kr_url(asset_class, start_month=None):
+    start_month = start_month or get_past_date_in_yyyy_mm(430, True)
     today = get_past_date_in_yyyy_mm(0, True)
-    url = f"https://ecos.bok.or.kr/api/StatisticSearch/{API_ECOS_BOK_KR_KEY}/json/kr/1/12/{asset_class}/M/{year_ago}/{today}"
-    response = requests.get(url)
-    result = response.json()
+    return f"{API_ECOS_URL}/{API_ECOS_BOK_KR_KEY}/json/kr/1/100/{asset_class}/M/{start_month}/{today}"
+
+
+def parse_ecos_bok_kr(asset_class, result, debug=False):
+    if "StatisticSearch" not in result:
+        # No row in the requested months
+        return []
     rows: List = result["StatisticSearch"]["row"]
-    rows.reverse()
     if debug:
         for row in rows:
-            logger.info(f"{row['TIME']} : {row['DATA_VALUE']}")
-    latest_rate = get_list_item(rows, 0)
-    last_month = get_list_item(rows, 1)
-    last_year = get_list_item(rows, 11)
-    monthly_delta, yearly_delta = None, None
-    if latest_rate == None or not str_can_be_decimal(latest_rate["DATA_VALUE"]):
-        logger.info(
-            f"get_ecos_bok_kr - failed to get the latest_rate for {asset_class}%"
-        )
+            logger.info(f"{asset_class} {row['TIME']} : {row['DATA_VALUE']}")
+    return [
+        (datetime.strptime(row["TIME"], "%Y%m").date(), Decimal(row["DATA_VALUE"]))
+        for row in rows
+        if str_can_be_decimal(row["DATA_VALUE"])
+    ]
+
+
+def get_ecos_bok_kr(asset_class, debug=False):
+    update_indexes([(asset_class, ECOS_BOK_KR, "monthly")], debug)
+
+
+def index_url(seriesid, source, interval, last_date=None):
+    # Only ask for the observations that come after the stored history
+    if source == ECOS_BOK_KR:
+        start_month = None
+        if last_date:
+            next_month = (last_date.replace(day=1) + timedelta(days=32)).replace(day=1)
+            start_month = next_month.strftime("%Y%m")
+        return ecos_bok_kr_url(seriesid, start_month)
+    observation_start = None
+    if last_date:
+        observation_start = (last_date + timedelta(days=1)).strftime("%Y-%m-%d")
+    return stlouisfed_observation_url(seriesid, interval, observation_start)
+
+
+def parse_index(seriesid, source, data, debug=False):
+    if source == ECOS_BOK_KR:
+        return parse_ecos_bok_kr(seriesid, data, debug)
+    return parse_stlouisfed_observations(seriesid, data, debug)
+
+
+def index_response_key(seriesid, interval, last_date=None):
+    window = last_date.isoformat() if last_date else "full"
+    return f"index_response:{seriesid}:{interval}:{window}"
+
+
+def _refresh_lock_key(seriesid):
+    return f"index_refresh:{seriesid}"
+
+
+def get_cached_responses(keys: dict) -> tuple:
+    """
+    :param keys: (series id, source, interval) -> index_response_key.
+    :return: The cached documents, fresh or stale, and the series among
+    them that are stale.
+    """
+    entries = cache.get_many(list(keys.values()))
+    now = time.time()
+    documents, stale = {}, []
+    for item, key in keys.items():
+        entry = entries.get(key)
+        if entry is None:
+            continue
+        documents[item[0]] = entry["document"]
+        if now - entry["fetched_at"] > INDEX_RESPONSE_TTLS[item[2]][0]:
+            stale.append(item)
+    return documents, stale
+
+
+def cache_responses(keys: dict, documents: dict):
+    now = time.time()
+    for item, key in keys.items():
+        document = documents.get(item[0])
+        if document is None or isinstance(document, Exception):
+            continue
+        fresh, stale = INDEX_RESPONSE_TTLS[item[2]]
+        cache.set(key, {"fetched_at": now, "document": document}, fresh + stale)
+
+
+def schedule_refresh(series):
+    # Series already being refreshed are left to their task
+    series = [
+        item
+        for item in series
+        if cache.add(_refresh_lock_key(item[0]), 1, INDEX_REFRESH_LOCK_TTL)
+    ]
+    if not series:
         return
-    latest_rate = Decimal(latest_rate["DATA_VALUE"])
-    if last_month:
-        if str_can_be_decimal(last_month["DATA_VALUE"]):
-            monthly_delta = latest_rate - Decimal(last_month["DATA_VALUE"])
-    if last_year:
-        if str_can_be_decimal(last_year["DATA_VALUE"]):
-            yearly_delta = latest_rate - Decimal(last_year["DATA_VALUE"])
-
-    created = False
-
-    kwargs = {"id": asset_class, "value": latest_rate}
-    if monthly_delta:
-        kwargs["monthly_delta"] = monthly_delta
-    if yearly_delta:
-        kwargs["yearly_delta"] = yearly_delta
-    # START - SUPA PLUGIN
-    update_eco_index(kwargs)
-    # END - SUPA PLUGIN
+    from core.tasks import refresh_indexes
+
     try:
-        index = EconomicIndex.objects.get(id=asset_class)
-        for key, value in kwargs.items():
-            setattr(index, key, value)
-        index.save()
-    except EconomicIndex.DoesNotExist:
-        created = True
-        EconomicIndex.objects.create(**kwargs)
-    logger.info(
-        f"Successfully {'created' if created else 'updated'} economic index ({asset_class}) : ({latest_rate})%"
+        refresh_indexes.delay(series)
+    except Exception as e:
+        cache.delete_many([_refresh_lock_key(item[0]) for item in series])
+        logger.warning(f"Could not schedule the refresh of economic indexes: {e}")
+
+
+def fetch_index_documents(series, clients=None, refresh=False) -> dict:
+    """
+    The provider documents of the new observations of the given series,
+    fetched concurrently.
+    The provider is only called for the series without a cached response
+    (see INDEX_RESPONSE_TTLS): a stale one is used as is and refreshed by a
+    background task.
+    :param series: (series id, source, interval) tuples, see INDEX_SERIES.
+    :param clients: Replace the provider clients of INDEX_CLIENTS.
+    :param refresh: Call the provider for every series, cached or not.
+    :return: series id -> document, or the exception raised fetching it.
+    """
+    series = [tuple(item) for item in series]
+    clients = {**INDEX_CLIENTS, **(clients or {})}
+    last_dates = latest_observation_dates([seriesid for seriesid, _, _ in series])
+    keys = {
+        item: index_response_key(item[0], item[2], last_dates.get(item[0]))
+        for item in series
+    }
+    documents, stale = {}, []
+    if not refresh:
+        documents, stale = get_cached_responses(keys)
+    missing = [item for item in series if item[0] not in documents]
+    fetched = fetch_json_concurrently(
+        {
+            seriesid: (
+                clients[source],
+                index_url(seriesid, source, interval, last_dates.get(seriesid)),
+            )
+            for seriesid, source, interval in missing
+        },
+        max_workers=INDEX_FETCH_MAX_WORKERS,
     )
+    cache_responses(keys, fetched)
+    documents.update(fetched)
+    if refresh:
+        cache.delete_many([_refresh_lock_key(seriesid) for seriesid, _, _ in series])
+    elif stale:
+        schedule_refresh(stale)
+    return documents
+
+
+def ingest_index_documents(series, documents: dict, debug=False):
+    """
+    Append the observations of the fetched documents to the stored history,
+    and refresh the EconomicIndex rows of the series that moved in one
+    batched upsert.
+    A series that failed to download (its exception or None in place of its
+    document) or to parse is logged and skipped.
+    """
+    observations = {}
+    for seriesid, source, interval in series:
+        data = documents.get(seriesid)
+        if data is None:
+            continue
+        if isinstance(data, Exception):
+            logger.info(
+                f"Request for economic index ({seriesid}) failed with {describe_fetch_error(data)}"
+            )
+            continue
+        try:
+            observations[seriesid] = parse_index(seriesid, source, data, debug)
+        except (KeyError, TypeError, ValueError) as e:
+            logger.info(f"Unexpected data format for economic index ({seriesid}): {e}")
+
+    moved = store_index_observations(observations)
+    intervals = {seriesid: interval for seriesid, _, interval in series}
+    rows = compute_index_rows({seriesid: intervals[seriesid] for seriesid in moved})
+    return ingest_economic_indexes(rows, debug)
+
+
+def update_indexes(series, debug=False, clients=None, refresh=False):
+    """
+    Fetch the new observations of the given series and store them, see
+    fetch_index_documents and ingest_index_documents.
+    """
+    series = [tuple(item) for item in series]
+    documents = fetch_index_documents(series, clients, refresh)
+    return ingest_index_documents(series, documents, debug)
 
 
 def get_fed_funds_rate(debug=False):
@@ -253,7 +377,7 @@ def get_ecb_lfr(debug=False):
 
 
 def get_bok_interest_rates(debug=False):
-    get_ecos_bok_kr("722Y001", debug)
+    get_ecos_bok_kr(BOK_BASE_RATE, debug)
 
 
 def get_inflation_euro(debug=False):
@@ -301,19 +425,4 @@ def get_inflation_chf(debug=False):
 
 
 def get_all_indexes(debug=False):
-    get_fed_funds_rate(debug)
-    get_ecb_dfr(debug)
-    get_ecb_mror(debug)
-    get_ecb_lfr(debug)
-    get_bok_interest_rates(debug)
-    get_inflation_euro(debug)
-    get_inflation_usd(debug)
-    get_inflation_krw(debug)
-    get_inflation_yuan(debug)
-    get_inlfation_yen(debug)
-    get_inflation_ruble(debug)
-    get_inflation_gbp(debug)
-    get_inflation_idr(debug)
-    get_inflation_rupee(debug)
-    get_inflation_aed(debug)
-    get_inflation_chf(debug)
+    return update_indexes(INDEX_SERIES, debug)
@@ -1,5 +1,84 @@
+import logging
 from django.conf import settings
+from django.db import DatabaseError, transaction
+from django.utils.translation import gettext_lazy as _
 from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+from .cache import cached_shared, invalidate
+from .lib.lru import ExpiringLRU
+from .models import KeiboUser
+
+logger = logging.getLogger(__name__)
+
+# Users resolved from tokens: per process, keyed by (user id, token jti),
+# in front of the shared cache, versioned per user. Saving a user drops the
+# local copies and bumps the version (see KeiboUser.save), other processes
+# drop their copy within the TTL.
+USER_CACHE_SIZE = 4096
+USER_LOCAL_TTL = 5  # seconds
+USER_SHARED_TTL = 60 * 10  # seconds
+
+_users = ExpiringLRU(USER_CACHE_SIZE, USER_LOCAL_TTL)
+# Never cached, loaded from the database when used (e.g. check_password)
+_SECRET_FIELDS = {'password'}
+_USER_FIELDS = [
+    field.attname
+    for field in KeiboUser._meta.concrete_fields
+    if field.attname not in _SECRET_FIELDS
+]
+
+
+def _user_namespace(user_id):
+    return f'auth_user:{user_id}'
+
+
+def get_user_fields(user_id, jti=None):
+    """
+    Field values of a user, as stored in the database, secrets excepted.
+    Read from the database when the shared cache is unavailable.
+    :return: None when the user doesn't exist.
+    """
+    fields = _users.get((user_id, jti))
+    if fields is not None:
+        return fields
+
+    def load():
+        return KeiboUser.objects.filter(pk=user_id).values(*_USER_FIELDS).first()
+
+    try:
+        fields = cached_shared(
+            _user_namespace(user_id), 'fields', load, timeout=USER_SHARED_TTL
+        )
+    except DatabaseError:
+        raise
+    except Exception as e:
+        logger.warning(f"Could not read user {user_id} from the cache: {e}")
+        fields = load()
+    if fields is None:
+        return None
+    _users.set((user_id, jti), fields)
+    return fields
+
+
+def forget_user(user_id):
+    forget_users([user_id])
+
+
+def forget_users(user_ids):
+    # Runs once the change is visible: a lookup racing the change can only
+    # cache the old row under the old version
+    user_ids = set(user_ids)
+    if not user_ids:
+        return
+
+    def forget():
+        for user_id in user_ids:
+            invalidate(_user_namespace(user_id))
+        _users.discard(lambda key: key[0] in user_ids)
+
+    transaction.on_commit(forget)
 
 
 class CustomJWTAuthentication(JWTAuthentication):
@@ -18,5 +97,38 @@ class CustomJWTAuthentication(JWTAuthentication):
             validated_token = self.get_validated_token(raw_token)
 
             return self.get_user(validated_token), validated_token
-        except:
+        except AuthenticationFailed:
+            # Invalid token or user: the request goes on unauthenticated
             return None
+
+    def get_user(self, validated_token):
+        # Same checks as JWTAuthentication.get_user, without a query per request
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        fields = get_user_fields(user_id, validated_token.get(api_settings.JTI_CLAIM))
+        if fields is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+        if not fields['is_active']:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        return self.make_user(fields, validated_token)
+
+    def make_user(self, fields, validated_token):
+        # An instance as if loaded from the database, it can be saved back.
+        # The secret fields are deferred, a save leaves them untouched.
+        return KeiboUser.from_db(
+            'default', _USER_FIELDS, [fields[name] for name in _USER_FIELDS]
+        )
+
+
+class TokenUserJWTAuthentication(CustomJWTAuthentication):
+    """
+    For endpoints that only need request.user.id: the user is checked
+    (exists, active) the same way, but request.user is a TokenUser built
+    from the token rather than a KeiboUser.
+    """
+
+    def make_user(self, fields, validated_token):
+        return TokenUser(validated_token)
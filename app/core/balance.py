@@ -0,0 +1,49 @@
+from decimal import Decimal
+from django.db import connection
+from .cache import invalidate_wallet_users_on_commit
+from .live import publish_wallet_balances
+from .models import Wallet
+
+# Balance mutations are applied by the database (balance = balance + delta)
+# so concurrent writers never overwrite each other's result, and only the
+# balance column is written. RETURNING hands back the new balance, so
+# callers don't need to read the wallet again.
+_APPLY_DELTA_SQL = (
+    f'UPDATE "{Wallet._meta.db_table}" SET "balance" = "balance" + %s '
+    'WHERE "id" = %s RETURNING "balance"'
+)
+
+
+def apply_balance_delta(wallet_id, delta: Decimal):
+    """
+    Add delta to the balance of a wallet.
+    The new balance is pushed to the live subscribers of the wallet, and the
+    cached entries of its users are dropped, on commit.
+    :return: The new balance, or None if the wallet does not exist.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(_APPLY_DELTA_SQL, [delta, wallet_id])
+        row = cursor.fetchone()
+    if row is None:
+        return None
+    publish_wallet_balances({wallet_id: row[0]})
+    invalidate_wallet_users_on_commit([wallet_id])
+    return row[0]
+
+
+def apply_balance_deltas(deltas: dict) -> dict:
+    """
+    Apply several balance deltas, keyed by wallet id.
+    Wallets are updated in a stable order so that two concurrent callers
+    touching the same wallets can't deadlock on each other's row locks.
+    :return: The new balances keyed by wallet id (missing wallets are omitted).
+    """
+    new_balances = {}
+    for wallet_id in sorted(deltas, key=str):
+        delta = deltas[wallet_id]
+        if not delta:
+            continue
+        new_balance = apply_balance_delta(wallet_id, delta)
+        if new_balance is not None:
+            new_balances[wallet_id] = new_balance
+    return new_balances
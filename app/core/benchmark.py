@@ -0,0 +1,531 @@
+"""
+Benchmarks of the API hot paths and of the ingestion of provider data,
+run in process against the configured Postgres and Redis (see the
+benchmark management command).
+"""
+
+import json
+import random
+import threading
+import time
+import tracemalloc
+from contextlib import ExitStack, contextmanager
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, List
+from unittest import mock
+from urllib.parse import urlparse
+import numpy as np
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction
+from django.test import Client
+from rest_framework_simplejwt.tokens import AccessToken
+from . import api_crypto, api_currency, api_index, providers
+from .api_crypto import SUPPORTED_CRYPTOS
+from .api_currency import SUPPORTED_CURRENCIES
+from .metrics import RequestMetrics
+from .models import (
+    Asset,
+    AssetCategory,
+    KeiboUser,
+    Transaction,
+    Wallet,
+    WalletUser,
+)
+from .snapshots import rebuild_wallet_snapshots, snapshot_date
+from .transaction_export import COLUMNAR, CSV, NDJSON
+
+EMAIL_DOMAIN = 'bench.keibo.test'
+CATEGORIES = ['food', 'rent', 'transport', 'leisure', 'health', 'salary', 'gift']
+
+# Transactions drawn in the database: random wallet, day over the last two
+# years, category and amount (mostly expenses). setseed() makes random()
+# repeatable within the session.
+_SEED_TRANSACTIONS_SQL = """
+INSERT INTO "{transaction}"
+    (id, wallet_id, executed_at, category, description, amount, tags)
+SELECT
+    gen_random_uuid(),
+    (%(wallet_ids)s::uuid[])[1 + floor(random() * %(wallets)s)::int],
+    now() - random() * interval '730 days',
+    (%(categories)s::varchar[])[1 + floor(random() * %(n_categories)s)::int],
+    '',
+    round((random() * 200 - 150)::numeric, 2),
+    '{{}}'
+FROM generate_series(1, %(count)s)
+""".format(transaction=Transaction._meta.db_table)
+
+_SEED_BALANCES_SQL = """
+UPDATE "{wallet}" w SET balance = w.balance + t.total
+FROM (
+    SELECT wallet_id, SUM(amount) AS total FROM "{transaction}"
+    WHERE wallet_id = ANY(%s::uuid[]) GROUP BY wallet_id
+) t
+WHERE w.id = t.wallet_id
+""".format(wallet=Wallet._meta.db_table, transaction=Transaction._meta.db_table)
+
+
+@dataclass
+class Scale:
+    users: int = 50
+    wallets_per_user: int = 3
+    # Wallets each shared with `members_per_shared_wallet` other users
+    shared_wallets: int = 20
+    members_per_shared_wallet: int = 3
+    transactions: int = 100_000
+    assets: int = 20
+    # In one more wallet of the first user, read by the export benchmarks
+    large_wallet_transactions: int = 100_000
+    seed: int = 0
+
+
+@dataclass
+class Dataset:
+    users: List[KeiboUser]
+    # wallet ids owned by each user, in the order of users
+    wallets: List[List[str]]
+    shared_wallets: List[str]
+    assets: List[str]
+    large_wallet: str = None
+
+
+def seed(scale: Scale) -> Dataset:
+    """
+    Synthetic users, wallets (owned and shared), assets and transactions,
+    with their balances and daily snapshots. Meant to run in a transaction
+    that gets rolled back.
+    """
+    rng = random.Random(scale.seed)
+    assets = [
+        Asset(
+            id=f'bench-{i}',
+            category=AssetCategory.CASH,
+            exchange_rate=Decimal(str(round(rng.uniform(0.001, 2), 6))),
+        )
+        for i in range(scale.assets)
+    ]
+    Asset.objects.bulk_create(assets)
+    asset_ids = [asset.id for asset in assets]
+
+    # Hashing is slow on purpose, every user shares one password
+    password = make_password(None)
+    users = KeiboUser.objects.bulk_create(
+        KeiboUser(
+            email=f'user-{i:06d}@{EMAIL_DOMAIN}',
+            first_name=f'First{i}',
+            last_name=f'Last{i}',
+            password=password,
+        )
+        for i in range(scale.users)
+    )
+
+    owned = [
+        [
+            Wallet(name=f'Wallet {j}', asset_id=rng.choice(asset_ids))
+            for j in range(scale.wallets_per_user)
+        ]
+        for _ in users
+    ]
+    shared = [
+        Wallet(name=f'Shared {j}', asset_id=rng.choice(asset_ids))
+        for j in range(scale.shared_wallets)
+    ]
+    Wallet.objects.bulk_create([wallet for row in owned for wallet in row] + shared)
+
+    memberships = [
+        WalletUser(user=user, wallet=wallet, role=4)
+        for user, row in zip(users, owned)
+        for wallet in row
+    ]
+    for wallet in shared:
+        owner, *members = rng.sample(
+            users, min(len(users), 1 + scale.members_per_shared_wallet)
+        )
+        memberships.append(WalletUser(user=owner, wallet=wallet, role=4))
+        memberships.extend(
+            WalletUser(user=member, wallet=wallet, role=rng.randint(1, 3))
+            for member in members
+        )
+    WalletUser.objects.bulk_create(memberships)
+
+    wallet_ids = [str(wallet.id) for row in owned for wallet in row] + [
+        str(wallet.id) for wallet in shared
+    ]
+    large_wallet = None
+    if scale.large_wallet_transactions:
+        large_wallet = Wallet.objects.create(name='Large', asset_id=asset_ids[0])
+        WalletUser.objects.create(user=users[0], wallet=large_wallet, role=4)
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT setseed(%s)', [(scale.seed % 1000) / 1000])
+        for ids, count in [
+            (wallet_ids, scale.transactions),
+            (
+                [str(large_wallet.id)] if large_wallet else [],
+                scale.large_wallet_transactions,
+            ),
+        ]:
+            if not ids:
+                continue
+            cursor.execute(
+                _SEED_TRANSACTIONS_SQL,
+                {
+                    'wallet_ids': ids,
+                    'wallets': len(ids),
+                    'categories': CATEGORIES,
+                    'n_categories': len(CATEGORIES),
+                    'count': count,
+                },
+            )
+        if large_wallet:
+            wallet_ids.append(str(large_wallet.id))
+        cursor.execute(_SEED_BALANCES_SQL, [wallet_ids])
+        # Fresh statistics, as after autovacuum on a real table
+        cursor.execute(f'ANALYZE "{Transaction._meta.db_table}"')
+    rebuild_wallet_snapshots(wallet_ids)
+
+    return Dataset(
+        users=users,
+        wallets=[[str(wallet.id) for wallet in row] for row in owned],
+        shared_wallets=[str(wallet.id) for wallet in shared],
+        assets=asset_ids,
+        large_wallet=str(large_wallet.id) if large_wallet else None,
+    )
+
+
+class _ProviderHandler(BaseHTTPRequestHandler):
+    # Answers like the providers, with rates moving a little on every call.
+    # Keep-alive, as the providers do.
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path.startswith('/crypto'):
+            body = {
+                crypto: {'usd': round(random.uniform(0.1, 50000), 4)}
+                for crypto in SUPPORTED_CRYPTOS
+            }
+        elif url.path.startswith('/rates'):
+            body = {
+                'rates': {
+                    currency.upper(): round(random.uniform(0.5, 1500), 6)
+                    for currency in SUPPORTED_CURRENCIES
+                }
+            }
+        elif url.path.startswith('/fred'):
+            today = date.today()
+            body = {
+                'observations': [
+                    {
+                        'date': (today - timedelta(days=30 * i)).isoformat(),
+                        'value': f'{random.uniform(0, 6):.2f}',
+                    }
+                    for i in range(24)
+                ]
+            }
+        elif url.path.startswith('/ecos'):
+            today = date.today()
+            month = today.year * 12 + today.month - 1
+            body = {
+                'StatisticSearch': {
+                    'row': [
+                        {
+                            'TIME': f'{(month - i) // 12}{(month - i) % 12 + 1:02d}',
+                            'DATA_VALUE': f'{random.uniform(0, 6):.2f}',
+                        }
+                        for i in range(24)
+                    ]
+                }
+            }
+        else:
+            self.send_error(404)
+            return
+        payload = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _ProviderServer(ThreadingHTTPServer):
+    # The index fetches connect all at once
+    request_queue_size = 64
+    daemon_threads = True
+
+
+_STUB_HEADERS = {
+    'API_PROVIDER_KEY_HEADER': 'X-Provider-Key',
+    'API_PROVIDER_HOST_HEADER': 'X-Provider-Host',
+    'API_PROVIDER_KEY': 'stub',
+}
+
+
+@contextmanager
+def provider_stub():
+    """
+    Local HTTP server standing for the rate and index providers, the
+    provider modules pointing to it for the duration of the block.
+    """
+    server = _ProviderServer(('127.0.0.1', 0), _ProviderHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    base = f'http://127.0.0.1:{server.server_port}'
+    try:
+        with ExitStack() as stack:
+            # Without the rate limits of the real providers
+            for client in (
+                providers.CRYPTO_PRICES,
+                providers.EXCHANGE_RATES,
+                providers.FRED,
+                providers.ECOS,
+            ):
+                stack.enter_context(mock.patch.object(client, 'rate_limiter', None))
+            stack.enter_context(
+                mock.patch.multiple(
+                    api_crypto, API_CRYPTO_PRICES=f'{base}/crypto', **_STUB_HEADERS
+                )
+            )
+            stack.enter_context(
+                mock.patch.multiple(
+                    api_currency, API_EXCHANGE_RATES=f'{base}/rates', **_STUB_HEADERS
+                )
+            )
+            stack.enter_context(
+                mock.patch.multiple(
+                    api_index, API_FRED_URL=f'{base}/fred', API_ECOS_URL=f'{base}/ecos'
+                )
+            )
+            yield base
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+@dataclass
+class Output:
+    # Returned by the calls producing rows, for Result.summary to report
+    # their throughput
+    status_code: int
+    rows: int
+    bytes: int
+
+
+@dataclass
+class Result:
+    name: str
+    latencies: list = field(default_factory=list)
+    queries: list = field(default_factory=list)
+    statuses: dict = field(default_factory=dict)
+    # exception name -> first message
+    errors: dict = field(default_factory=dict)
+    elapsed: float = 0.0
+    rows: int = 0
+    bytes: int = 0
+    # Of one more call, traced (see measure)
+    peak_memory: int = None
+
+    def summary(self) -> dict:
+        latencies = np.array(self.latencies) * 1000
+        queries = np.array(self.queries)
+        summary = {
+            'iterations': len(latencies),
+            'throughput_per_s': round(len(latencies) / self.elapsed, 2),
+            'mean_ms': round(float(latencies.mean()), 3),
+            'p50_ms': round(float(np.percentile(latencies, 50)), 3),
+            'p99_ms': round(float(np.percentile(latencies, 99)), 3),
+            'max_ms': round(float(latencies.max()), 3),
+            'queries': {
+                'min': int(queries.min()),
+                'mean': round(float(queries.mean()), 2),
+                'max': int(queries.max()),
+            },
+            'statuses': self.statuses,
+            'errors': self.errors,
+        }
+        if self.rows:
+            summary['rows_per_s'] = round(self.rows / sum(self.latencies))
+            summary['mb_per_s'] = round(self.bytes / sum(self.latencies) / 1e6, 2)
+        if self.peak_memory is not None:
+            summary['peak_memory_kb'] = round(self.peak_memory / 1024)
+        return summary
+
+
+def _run(call, i, counter):
+    # In a savepoint, so a failing call leaves the transaction usable
+    savepoint = transaction.savepoint()
+    try:
+        with connection.execute_wrapper(counter):
+            response = call(i)
+    except Exception as e:
+        transaction.savepoint_rollback(savepoint)
+        return e
+    transaction.savepoint_commit(savepoint)
+    return response
+
+
+def measure(
+    name, call: Callable[[int], object], iterations, warmup, trace_memory=False
+) -> Result:
+    """
+    Runs call(i) `warmup` times, then `iterations` times timing each call
+    and counting its queries. Must run in a transaction.
+    :param call: Returns a response or an Output, or anything else whose
+    status is then "ok". An exception counts as the status "error".
+    :param trace_memory: Run one more call with tracemalloc (which slows
+    it down, so it isn't timed) to report the peak of Python allocations.
+    """
+    for i in range(warmup):
+        _run(call, i, RequestMetrics())
+    result = Result(name)
+    started = time.perf_counter()
+    for i in range(iterations):
+        counter = RequestMetrics()
+        start = time.perf_counter()
+        response = _run(call, warmup + i, counter)
+        result.latencies.append(time.perf_counter() - start)
+        result.queries.append(counter.queries)
+        if isinstance(response, Exception):
+            status = 'error'
+            result.errors.setdefault(type(response).__name__, str(response)[:200])
+        else:
+            status = str(getattr(response, 'status_code', 'ok'))
+        if isinstance(response, Output):
+            result.rows += response.rows
+            result.bytes += response.bytes
+        result.statuses[status] = result.statuses.get(status, 0) + 1
+    result.elapsed = time.perf_counter() - started
+
+    if trace_memory:
+        tracemalloc.start()
+        try:
+            _run(call, warmup + iterations, RequestMetrics())
+            result.peak_memory = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return result
+
+
+def search_keyword(rng, users):
+    # From the email prefix of one user up to the one of thousands of them
+    email = f'user-{rng.randrange(users):06d}'
+    return email[: len(email) - rng.randint(0, 4)]
+
+
+def api_benchmarks(dataset: Dataset, seed=0) -> dict:
+    """
+    name -> call(i) of the benchmarked endpoints, cycling through the users
+    with their own token.
+    """
+    rng = random.Random(seed)
+    clients = []
+    for user in dataset.users:
+        client = Client()
+        client.defaults['HTTP_AUTHORIZATION'] = f'Bearer {AccessToken.for_user(user)}'
+        clients.append(client)
+    n = len(clients)
+
+    def wallet_of(i):
+        return dataset.wallets[i % n][i % len(dataset.wallets[i % n])]
+
+    return {
+        'get_wallets': lambda i: clients[i % n].get('/api/get_wallets/'),
+        'get_transactions': lambda i: clients[i % n].get(
+            f'/api/get_transactions/{wallet_of(i)}/'
+        ),
+        'transaction_create': lambda i: clients[i % n].post(
+            '/api/transaction/',
+            {
+                'wallet': wallet_of(i),
+                'amount': str(round(rng.uniform(-100, 50), 2)),
+                'category': rng.choice(CATEGORIES),
+            },
+            content_type='application/json',
+        ),
+        'search_users': lambda i: clients[i % n].get(
+            f'/api/search_users/{search_keyword(rng, n)}/'
+        ),
+    }
+
+
+def consume(response, rows) -> Output:
+    # Reads a streamed response chunk by chunk, like a client would
+    size = 0
+    for chunk in (
+        response.streaming_content if response.streaming else [response.content]
+    ):
+        size += len(chunk)
+    return Output(response.status_code, rows, size)
+
+
+def large_wallet_benchmarks(dataset: Dataset, scale: Scale) -> dict:
+    """
+    name -> call(i) of the benchmarks reading the whole history of the
+    large wallet (exports, balance charts), run fewer times (see the
+    --large-iterations option).
+    """
+    if dataset.large_wallet is None:
+        return {}
+    client = Client()
+    client.defaults['HTTP_AUTHORIZATION'] = (
+        f'Bearer {AccessToken.for_user(dataset.users[0])}'
+    )
+    export_url = f'/api/transaction/export/{dataset.large_wallet}/?file_format='
+    benchmarks = {
+        f'export_{export_format}': lambda i, export_format=export_format: consume(
+            client.get(export_url + export_format), scale.large_wallet_transactions
+        )
+        for export_format in (CSV, NDJSON, COLUMNAR)
+    }
+    # The balance chart of the last year, from the snapshots and by
+    # replaying the transactions, then the cost of rebuilding the snapshots
+    start = date.today() - timedelta(days=365)
+    history_url = f'/api/wallet/history/{dataset.large_wallet}/?from={start}'
+    benchmarks['wallet_history'] = lambda i: client.get(history_url)
+    benchmarks['wallet_history_replay'] = lambda i: replay_wallet_history(
+        dataset.large_wallet, start
+    )
+    benchmarks['snapshots_rebuild'] = lambda i: rebuild_wallet_snapshots(
+        [dataset.large_wallet]
+    )
+    return benchmarks
+
+
+def replay_wallet_history(wallet_id, start) -> list:
+    # Daily closing balances since start, the way they were computed before
+    # the snapshots: every transaction of the wallet is read
+    days, balance, day = [], Decimal(0), None
+    rows = (
+        Transaction.objects.filter(wallet_id=wallet_id)
+        .order_by('executed_at')
+        .values_list('executed_at', 'amount')
+        .iterator(chunk_size=5000)
+    )
+    for executed_at, amount in rows:
+        executed_on = snapshot_date(executed_at)
+        if day is not None and executed_on != day and day >= start:
+            days.append((day, balance))
+        day = executed_on
+        balance += amount
+    if day is not None and day >= start:
+        days.append((day, balance))
+    return days
+
+
+def ingestion_benchmarks() -> dict:
+    # To run within provider_stub()
+    return {
+        'ingest_crypto_prices': lambda i: api_crypto.get_crypto_prices(),
+        'ingest_exchange_rates': lambda i: api_currency.get_exchange_rates(),
+        'ingest_indexes': lambda i: api_index.update_indexes(
+            api_index.INDEX_SERIES, refresh=True
+        ),
+        # Beat runs between two publications, answered from the cached responses
+        'ingest_indexes_cached': lambda i: api_index.update_indexes(
+            api_index.INDEX_SERIES
+        ),
+    }
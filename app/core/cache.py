@@ -0,0 +1,246 @@
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.core.cache import cache
+from django.db import transaction
+from .models import Asset, EconomicIndex, WalletUser
+
+# Two tiers: a per-process dict with a short TTL in front of the shared
+# cache (Redis). Entries of a namespace are versioned, so invalidating it
+# is a single INCR that orphans every key written under the old version.
+LOCAL_TTL = 5  # seconds
+SHARED_TTL = 60 * 60  # seconds
+
+ASSETS = 'asset'
+ECONOMIC_INDEXES = 'economic_index'
+# Per-user entries live in the namespace 'user:<id>' (see cached_for_user)
+USERS = 'user'
+
+ALL = '__all__'
+
+_MISSING = object()
+_local = {}
+_memos = {}
+_local_lock = threading.Lock()
+_stats = Counter()
+_tracked_stats = ContextVar('tracked_cache_stats', default=None)
+
+
+def cache_stats() -> dict:
+    # Hit/miss counters of both tiers since the process started
+    with _local_lock:
+        return dict(_stats)
+
+
+@contextmanager
+def tracked_cache_stats():
+    """
+    Hit/miss counters of the lookups made within the block by the current
+    thread (or task) only, unlike cache_stats.
+    """
+    stats = Counter()
+    token = _tracked_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _tracked_stats.reset(token)
+
+
+def _count_locked(stat):
+    _stats[stat] += 1
+    tracked = _tracked_stats.get()
+    if tracked is not None:
+        tracked[stat] += 1
+
+
+def _count(stat):
+    with _local_lock:
+        _count_locked(stat)
+
+
+def _version_key(namespace):
+    return f'cache_version:{namespace}'
+
+
+def _namespace_version(namespace):
+    version = cache.get(_version_key(namespace))
+    if version is None:
+        cache.add(_version_key(namespace), 1, timeout=None)
+        version = cache.get(_version_key(namespace), 1)
+    return version
+
+
+def cached(namespace, name, loader):
+    """
+    Read-through lookup of one entry of a namespace.
+    :param loader: Called on a miss of both tiers, its result gets cached (None included).
+    """
+    local_key = (namespace, name)
+    now = time.monotonic()
+    with _local_lock:
+        entry = _local.get(local_key)
+        if entry is not None and entry[0] > now:
+            _count_locked('local_hit')
+            return entry[1]
+        _count_locked('local_miss')
+
+    shared_key = f'{namespace}:{_namespace_version(namespace)}:{name}'
+    value = cache.get(shared_key, _MISSING)
+    if value is _MISSING:
+        _count('shared_miss')
+        value = loader()
+        cache.set(shared_key, value, SHARED_TTL)
+    else:
+        _count('shared_hit')
+
+    with _local_lock:
+        _local[local_key] = (now + LOCAL_TTL, value)
+    return value
+
+
+def invalidate(namespace):
+    # Other processes drop their local copies within LOCAL_TTL
+    try:
+        cache.incr(_version_key(namespace))
+    except ValueError:
+        # The version key was evicted or never written
+        cache.add(_version_key(namespace), 1, timeout=None)
+    with _local_lock:
+        for local_key in [key for key in _local if key[0] == namespace]:
+            del _local[local_key]
+        for memo_key in [key for key in _memos if key[0] == namespace]:
+            del _memos[memo_key]
+
+
+def memoized(namespace, name, builder):
+    """
+    Per-process entry kept as long as the version of its namespace, never
+    written to the shared cache: for values costly to build and to pickle,
+    like lookup tables. Each lookup reads the namespace version.
+    """
+    memo_key = (namespace, name)
+    version = _namespace_version(namespace)
+    with _local_lock:
+        entry = _memos.get(memo_key)
+        if entry is not None and entry[0] == version:
+            _count_locked('memo_hit')
+            return entry[1]
+        _count_locked('memo_miss')
+
+    value = builder()
+    with _local_lock:
+        _memos[memo_key] = (version, value)
+    return value
+
+
+def _asset_values(queryset):
+    return list(queryset.values('id', 'category', 'exchange_rate'))
+
+
+def get_all_assets() -> list:
+    return cached(ASSETS, ALL, lambda: _asset_values(Asset.objects.order_by('id')))
+
+
+def get_asset(asset_id):
+    def load():
+        values = _asset_values(Asset.objects.filter(id=asset_id))
+        return values[0] if values else None
+
+    return cached(ASSETS, asset_id, load)
+
+
+def _economic_index_values(queryset):
+    return list(queryset.values())
+
+
+def get_all_economic_indexes() -> list:
+    return cached(
+        ECONOMIC_INDEXES,
+        ALL,
+        lambda: _economic_index_values(EconomicIndex.objects.order_by('id')),
+    )
+
+
+def get_economic_index(index_id):
+    def load():
+        values = _economic_index_values(EconomicIndex.objects.filter(id=index_id))
+        return values[0] if values else None
+
+    return cached(ECONOMIC_INDEXES, index_id, load)
+
+
+_SNAPSHOT_LOADERS = {
+    ASSETS: get_all_assets,
+    ECONOMIC_INDEXES: get_all_economic_indexes,
+}
+
+
+def refresh_on_commit(namespace):
+    # Runs once the writes are visible, so the old rows can't be cached again.
+    # The "all" snapshot is rebuilt right away for the next readers.
+    def refresh():
+        invalidate(namespace)
+        _SNAPSHOT_LOADERS[namespace]()
+
+    transaction.on_commit(refresh)
+
+
+def _user_namespace(user_id):
+    return f'{USERS}:{user_id}'
+
+
+def cached_for_user(user_id, name, loader, depends_on=(ASSETS,)):
+    """
+    Read-through lookup of an entry computed for one user.
+    Only the shared tier is used, so a user reads their own writes right
+    away whatever the process serving them.
+    :param depends_on: Namespaces the entry is derived from, invalidating
+    any of them invalidates the entry as well.
+    """
+    return cached_shared(_user_namespace(user_id), name, loader, depends_on)
+
+
+def cached_shared(namespace, name, loader, depends_on=(), timeout=SHARED_TTL):
+    """
+    Read-through lookup of one entry of a namespace in the shared tier only:
+    once the namespace is invalidated, no process reads the old entry, and
+    a loader that ran before the invalidation writes under the old version.
+    :param depends_on: Namespaces the entry is derived from, invalidating
+    any of them invalidates the entry as well.
+    """
+    versions = ':'.join(
+        str(_namespace_version(versioned)) for versioned in (namespace, *depends_on)
+    )
+    shared_key = f'{namespace}:{versions}:{name}'
+    value = cache.get(shared_key, _MISSING)
+    if value is _MISSING:
+        _count('shared_miss')
+        value = loader()
+        cache.set(shared_key, value, timeout)
+    else:
+        _count('shared_hit')
+    return value
+
+
+def invalidate_users(user_ids):
+    for user_id in set(user_ids):
+        invalidate(_user_namespace(user_id))
+
+
+def invalidate_wallet_users_on_commit(wallet_ids):
+    # The entries of every user sharing one of the wallets are dropped once
+    # the change is visible
+    wallet_ids = list(wallet_ids)
+    if not wallet_ids:
+        return
+
+    def invalidate_wallet_users():
+        invalidate_users(
+            WalletUser.objects.filter(wallet_id__in=wallet_ids).values_list(
+                'user_id', flat=True
+            )
+        )
+
+    transaction.on_commit(invalidate_wallet_users)
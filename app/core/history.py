@@ -0,0 +1,124 @@
+from datetime import date
+from django.db import connection
+from django.db.models import Max
+from django.utils import timezone
+from .models import AssetPrice, EconomicIndexObservation
+
+# Lookback of each EconomicIndex delta field
+DELTA_LOOKBACKS = {
+    'daily_delta': '1 day',
+    'weekly_delta': '7 days',
+    'monthly_delta': '1 month',
+    'yearly_delta': '1 year',
+    'decennial_delta': '10 years',
+}
+
+# Deltas that are meaningful for each observation interval
+INTERVAL_DELTAS = {
+    'daily': ['daily_delta', 'weekly_delta', 'monthly_delta', 'yearly_delta'],
+    'weekly': ['weekly_delta', 'monthly_delta', 'yearly_delta'],
+    'monthly': ['monthly_delta', 'yearly_delta'],
+    'annual': ['yearly_delta', 'decennial_delta'],
+}
+
+_OBSERVATION_TABLE = EconomicIndexObservation._meta.db_table
+
+# For every series: its latest observation, and for each lookback the value of
+# the latest observation at or before (latest date - lookback). Each subquery
+# is a single backward step on the (series, date) unique index.
+_PAST_VALUE_SQL = """(
+    SELECT past.value FROM "{table}" past
+    WHERE past.series = latest.series
+    AND past.date <= latest.date - interval '{lookback}'
+    ORDER BY past.date DESC LIMIT 1
+) AS {field}"""
+
+_INDEX_DELTAS_SQL = """
+SELECT latest.series, latest.value, {past_values}
+FROM (
+    SELECT DISTINCT ON (series) series, date, value
+    FROM "{table}"
+    WHERE series = ANY(%s)
+    ORDER BY series, date DESC
+) latest
+""".format(
+    table=_OBSERVATION_TABLE,
+    past_values=', '.join(
+        _PAST_VALUE_SQL.format(table=_OBSERVATION_TABLE, lookback=lookback, field=field)
+        for field, lookback in DELTA_LOOKBACKS.items()
+    ),
+)
+
+
+def latest_observation_dates(series_ids) -> dict:
+    # series id -> date of its most recent stored observation
+    return dict(
+        EconomicIndexObservation.objects.filter(series__in=series_ids)
+        .values('series')
+        .annotate(last_date=Max('date'))
+        .values_list('series', 'last_date')
+    )
+
+
+def store_index_observations(observations: dict) -> set:
+    """
+    Append observations to the history. An observation already stored takes
+    the value of the new one, as providers revise their past figures.
+    :param observations: series id -> list of (date, Decimal value).
+    :return: The series ids that had at least one observation to store.
+    """
+    # A row can only be upserted once per statement, the last one is kept
+    values = {
+        (series, day): value
+        for series, items in observations.items()
+        for day, value in items
+    }
+    if values:
+        EconomicIndexObservation.objects.bulk_create(
+            [
+                EconomicIndexObservation(series=series, date=day, value=value)
+                for (series, day), value in values.items()
+            ],
+            update_conflicts=True,
+            unique_fields=['series', 'date'],
+            update_fields=['value'],
+        )
+    return {series for series, items in observations.items() if items}
+
+
+def compute_index_rows(series_intervals: dict) -> list:
+    """
+    Build EconomicIndex rows (latest value and deltas) from the stored history.
+    :param series_intervals: series id -> observation interval (see INTERVAL_DELTAS).
+    """
+    if not series_intervals:
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute(_INDEX_DELTAS_SQL, [list(series_intervals)])
+        results = cursor.fetchall()
+
+    rows = []
+    for series, value, *past_values in results:
+        kwargs = {'id': series, 'value': value}
+        past = dict(zip(DELTA_LOOKBACKS, past_values))
+        for field in INTERVAL_DELTAS[series_intervals[series]]:
+            if past[field] is not None:
+                kwargs[field] = value - past[field]
+        rows.append(kwargs)
+    return rows
+
+
+def store_asset_prices(rates: dict, day: date = None):
+    # Keeps the last rate of the day as the asset's closing price
+    if not rates:
+        return
+    day = day or timezone.now().date()
+    AssetPrice.objects.bulk_create(
+        [
+            AssetPrice(asset_id=asset_id, date=day, exchange_rate=rate)
+            for asset_id, rate in rates.items()
+        ],
+        update_conflicts=True,
+        unique_fields=['asset', 'date'],
+        update_fields=['exchange_rate'],
+    )
@@ -0,0 +1,168 @@
+import logging
+from decimal import Decimal, InvalidOperation
+from typing import NamedTuple
+from core.lib.supabase.api.update_asset import update_assets
+from core.lib.supabase.api.update_eco_index import update_eco_indexes
+from core.cache import ASSETS, ECONOMIC_INDEXES, refresh_on_commit
+from core.history import store_asset_prices
+from core.live import publish_asset_rates
+from core.models import Asset, EconomicIndex
+from core.ticks import record_ticks_on_commit
+
+logger = logging.getLogger(__name__)
+
+# Asset.exchange_rate is stored with 12 decimal places out of 24 digits
+EXCHANGE_RATE_QUANTUM = Decimal('1e-12')
+EXCHANGE_RATE_LIMIT = Decimal('1e12')
+
+ECONOMIC_INDEX_FIELDS = [
+    'value',
+    'daily_delta',
+    'weekly_delta',
+    'monthly_delta',
+    'yearly_delta',
+    'decennial_delta',
+]
+
+
+class UpsertReport(NamedTuple):
+    added: int
+    updated: int
+    unchanged: int
+    # id -> new value of every added or updated row
+    changed: dict
+
+
+def to_exchange_rate(value):
+    """
+    Convert a provider number into the Decimal stored in Asset.exchange_rate.
+    :return: The quantized rate, or None if the value is not a usable number.
+    """
+    try:
+        rate = Decimal(str(value)).quantize(EXCHANGE_RATE_QUANTUM)
+    except (InvalidOperation, ValueError, TypeError):
+        return None
+    if not rate.is_finite() or abs(rate) >= EXCHANGE_RATE_LIMIT:
+        return None
+    return rate
+
+
+def upsert_assets(rates: dict, category) -> UpsertReport:
+    """
+    Write the exchange rates of many assets at once.
+    Existing rates are read in one query, and only the assets whose rate
+    changed are written, in one INSERT ... ON CONFLICT DO UPDATE statement.
+    :param rates: Quantized exchange rates (see to_exchange_rate) keyed by asset id.
+    :param category: AssetCategory given to assets that don't exist yet.
+    """
+    if not rates:
+        return UpsertReport(0, 0, 0, {})
+
+    existing = dict(
+        Asset.objects.filter(id__in=rates.keys()).values_list('id', 'exchange_rate')
+    )
+    changed = {
+        asset_id: rate
+        for asset_id, rate in rates.items()
+        if existing.get(asset_id) != rate
+    }
+    if changed:
+        Asset.objects.bulk_create(
+            [
+                Asset(id=asset_id, category=category, exchange_rate=rate)
+                for asset_id, rate in changed.items()
+            ],
+            update_conflicts=True,
+            unique_fields=['id'],
+            update_fields=['exchange_rate'],
+        )
+
+    added = sum(1 for asset_id in changed if asset_id not in existing)
+    return UpsertReport(
+        added=added,
+        updated=len(changed) - added,
+        unchanged=len(rates) - len(changed),
+        changed=changed,
+    )
+
+
+def ingest_asset_rates(rates: dict, category, label, debug=False) -> UpsertReport:
+    report = upsert_assets(rates, category)
+    store_asset_prices(rates)
+    record_ticks_on_commit(rates)
+    if report.changed:
+        refresh_on_commit(ASSETS)
+        publish_asset_rates(report.changed)
+    if debug:
+        for asset_id, rate in report.changed.items():
+            logger.info(f"{label} changed: 1 {asset_id} = {rate} usd")
+    update_assets(report.changed)
+    logger.info(
+        f"{label}: added {report.added}, updated {report.updated} "
+        f"and left {report.unchanged} assets unchanged!"
+    )
+    return report
+
+
+def upsert_economic_indexes(rows: list) -> UpsertReport:
+    """
+    Write many economic indexes at once.
+    A delta missing from a row keeps its stored value, like setting only the
+    fetched attributes on the model would.
+    :param rows: EconomicIndex field values, each with its "id".
+    """
+    if not rows:
+        return UpsertReport(0, 0, 0, {})
+
+    existing = EconomicIndex.objects.in_bulk([row['id'] for row in rows])
+    changed = {}
+    for row in rows:
+        stored = existing.get(row['id'])
+        values = {
+            field: getattr(stored, field) if stored else None
+            for field in ECONOMIC_INDEX_FIELDS
+        }
+        values.update(
+            (field, row[field]) for field in ECONOMIC_INDEX_FIELDS if field in row
+        )
+        if stored is None or any(
+            values[field] != getattr(stored, field) for field in ECONOMIC_INDEX_FIELDS
+        ):
+            changed[row['id']] = values
+    if changed:
+        EconomicIndex.objects.bulk_create(
+            [
+                EconomicIndex(id=index_id, **values)
+                for index_id, values in changed.items()
+            ],
+            update_conflicts=True,
+            unique_fields=['id'],
+            update_fields=ECONOMIC_INDEX_FIELDS,
+        )
+
+    added = sum(1 for index_id in changed if index_id not in existing)
+    return UpsertReport(
+        added=added,
+        updated=len(changed) - added,
+        unchanged=len(rows) - len(changed),
+        changed=changed,
+    )
+
+
+def ingest_economic_indexes(rows: list, debug=False) -> UpsertReport:
+    report = upsert_economic_indexes(rows)
+    if report.changed:
+        refresh_on_commit(ECONOMIC_INDEXES)
+    if debug:
+        for index_id, values in report.changed.items():
+            logger.info(f"Economic index changed: {index_id} = {values['value']}")
+    # START - SUPA PLUGIN
+    update_eco_indexes(
+        [{'id': index_id, **values} for index_id, values in report.changed.items()]
+    )
+    # END - SUPA PLUGIN
+    logger.info(
+        f"Economic indexes: added {report.added}, updated {report.updated} "
+        f"and left {report.unchanged} indexes unchanged!"
+    )
+    return report
@@ -0,0 +1,228 @@
+"""
+Compact columnar binary format for streaming tabular exports.
+
+Layout (all integers little-endian):
+    header: b"KBCL" | u8 version | u16 column count
+            then per column: u8 kind | u8 name length | utf-8 name
+    blocks: u32 row count (0 ends the stream) then every column in order
+    footer: u32 0
+
+Column encodings inside a block of n rows:
+    UUID         n * 16 bytes (all zeros for null)
+    INT64        n * int64 (NULL_INT64 for null)
+    DECIMAL      u8 scale | n * int64 unscaled values, or when a value doesn't
+                 fit: u8 255 | string column of the decimal representations
+    DICT_STRING  u16 dictionary size | string column of the dictionary | n * u16 indexes
+    STRING       (n + 1) * u32 offsets | utf-8 data
+    STRING_LIST  (n + 1) * u32 offsets into the items | string column of the items
+"""
+
+import struct
+import uuid
+from array import array
+from decimal import Decimal
+
+MAGIC = b"KBCL"
+VERSION = 1
+
+UUID = 1
+INT64 = 2
+DECIMAL = 3
+DICT_STRING = 4
+STRING = 5
+STRING_LIST = 6
+
+NULL_INT64 = -(2**63)
+_NULL_UUID = bytes(16)
+_STRING_FALLBACK = 255
+_INT64_LIMIT = 2**63 - 1
+
+_U8 = struct.Struct("<B")
+_U16 = struct.Struct("<H")
+_U32 = struct.Struct("<I")
+
+
+def _little_endian(values: array) -> bytes:
+    if array("H", [1]).tobytes()[0] != 1:
+        values.byteswap()
+    return values.tobytes()
+
+
+def _encode_strings(values) -> bytes:
+    offsets = array("I", [0])
+    data = bytearray()
+    for value in values:
+        data += value.encode("utf-8")
+        offsets.append(len(data))
+    return _little_endian(offsets) + bytes(data)
+
+
+def _encode_uuids(values) -> bytes:
+    return b"".join(_NULL_UUID if value is None else value.bytes for value in values)
+
+
+def _encode_int64s(values) -> bytes:
+    return _little_endian(
+        array("q", (NULL_INT64 if value is None else value for value in values))
+    )
+
+
+def _encode_decimals(values, scale) -> bytes:
+    factor = Decimal(10) ** scale
+    unscaled = [int(value * factor) for value in values]
+    if all(abs(value) <= _INT64_LIMIT for value in unscaled):
+        return _U8.pack(scale) + _little_endian(array("q", unscaled))
+    return _U8.pack(_STRING_FALLBACK) + _encode_strings(str(value) for value in values)
+
+
+def _encode_dict_strings(values) -> bytes:
+    dictionary = {}
+    indexes = array(
+        "H", (dictionary.setdefault(value, len(dictionary)) for value in values)
+    )
+    return (
+        _U16.pack(len(dictionary))
+        + _encode_strings(dictionary)
+        + _little_endian(indexes)
+    )
+
+
+def _encode_string_lists(values) -> bytes:
+    offsets = array("I", [0])
+    items = []
+    for value in values:
+        items.extend(value)
+        offsets.append(len(items))
+    return _little_endian(offsets) + _encode_strings(items)
+
+
+class ColumnarWriter:
+    """
+    :param columns: List of (name, kind) or, for DECIMAL, (name, kind, scale).
+    """
+
+    def __init__(self, columns):
+        self.columns = [
+            (column[0], column[1], column[2] if len(column) > 2 else 0)
+            for column in columns
+        ]
+
+    def header(self) -> bytes:
+        header = bytearray(MAGIC + _U8.pack(VERSION) + _U16.pack(len(self.columns)))
+        for name, kind, _ in self.columns:
+            encoded_name = name.encode("utf-8")
+            header += _U8.pack(kind) + _U8.pack(len(encoded_name)) + encoded_name
+        return bytes(header)
+
+    def block(self, rows: list) -> bytes:
+        # rows: tuples with one value per column
+        if not rows:
+            return b""
+        block = bytearray(_U32.pack(len(rows)))
+        for position, (_, kind, scale) in enumerate(self.columns):
+            values = [row[position] for row in rows]
+            if kind == UUID:
+                block += _encode_uuids(values)
+            elif kind == INT64:
+                block += _encode_int64s(values)
+            elif kind == DECIMAL:
+                block += _encode_decimals(values, scale)
+            elif kind == DICT_STRING:
+                block += _encode_dict_strings(values)
+            elif kind == STRING:
+                block += _encode_strings(values)
+            elif kind == STRING_LIST:
+                block += _encode_string_lists(values)
+        return bytes(block)
+
+    def footer(self) -> bytes:
+        return _U32.pack(0)
+
+
+class _Reader:
+    def __init__(self, stream):
+        self.stream = stream
+
+    def read(self, size) -> bytes:
+        data = self.stream.read(size)
+        if len(data) != size:
+            raise ValueError("Truncated columnar stream.")
+        return data
+
+    def unpack(self, fmt: struct.Struct):
+        return fmt.unpack(self.read(fmt.size))[0]
+
+    def array(self, typecode, count) -> list:
+        values = array(typecode)
+        values.frombytes(self.read(values.itemsize * count))
+        if array("H", [1]).tobytes()[0] != 1:
+            values.byteswap()
+        return values.tolist()
+
+    def strings(self, count) -> list:
+        offsets = self.array("I", count + 1)
+        data = self.read(offsets[-1])
+        return [
+            data[start:end].decode("utf-8") for start, end in zip(offsets, offsets[1:])
+        ]
+
+
+def read_columnar(stream):
+    """
+    Decode a columnar stream (any binary file-like object).
+    :return: Iterator of the rows as dicts keyed by column name.
+    """
+    reader = _Reader(stream)
+    if reader.read(len(MAGIC)) != MAGIC or reader.unpack(_U8) != VERSION:
+        raise ValueError("Not a columnar stream.")
+    columns = []
+    for _ in range(reader.unpack(_U16)):
+        kind = reader.unpack(_U8)
+        name = reader.read(reader.unpack(_U8)).decode("utf-8")
+        columns.append((name, kind))
+
+    while True:
+        count = reader.unpack(_U32)
+        if count == 0:
+            return
+        decoded = []
+        for _, kind in columns:
+            if kind == UUID:
+                raw = reader.read(16 * count)
+                values = [
+                    (
+                        None
+                        if raw[i : i + 16] == _NULL_UUID
+                        else uuid.UUID(bytes=raw[i : i + 16])
+                    )
+                    for i in range(0, 16 * count, 16)
+                ]
+            elif kind == INT64:
+                values = [
+                    None if value == NULL_INT64 else value
+                    for value in reader.array("q", count)
+                ]
+            elif kind == DECIMAL:
+                scale = reader.unpack(_U8)
+                if scale == _STRING_FALLBACK:
+                    values = [Decimal(value) for value in reader.strings(count)]
+                else:
+                    values = [
+                        Decimal(value).scaleb(-scale)
+                        for value in reader.array("q", count)
+                    ]
+            elif kind == DICT_STRING:
+                dictionary = reader.strings(reader.unpack(_U16))
+                values = [dictionary[index] for index in reader.array("H", count)]
+            elif kind == STRING:
+                values = reader.strings(count)
+            elif kind == STRING_LIST:
+                offsets = reader.array("I", count + 1)
+                items = reader.strings(offsets[-1])
+                values = [items[start:end] for start, end in zip(offsets, offsets[1:])]
+            else:
+                raise ValueError(f"Unknown column kind {kind}.")
+            decoded.append(values)
+        names = [name for name, _ in columns]
+        for row in zip(*decoded):
+            yield dict(zip(names, row))
@@ -0,0 +1,43 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+import requests
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_WORKERS = 8
+
+
+def describe_fetch_error(error):
+    # Provider urls may carry api keys, so they are left out of the description
+    response = getattr(error, "response", None)
+    if response is not None:
+        return f"{type(error).__name__} (status {response.status_code})"
+    return type(error).__name__
+
+
+def fetch_json_concurrently(
+    requests_by_key: dict, max_workers=DEFAULT_MAX_WORKERS
+) -> dict:
+    """
+    GET many JSON documents in parallel, each through the client of its
+    provider (see core.providers.ProviderClient).
+    A failing request never affects the others: its exception is returned
+    in place of its document.
+    :param requests_by_key: (client, url) pairs keyed by any hashable identifier.
+    :return: The decoded documents (or the raised exceptions) under the same keys.
+    """
+    if not requests_by_key:
+        return {}
+
+    def fetch(request):
+        client, url = request
+        try:
+            return client.get_json(url)
+        except (requests.exceptions.RequestException, ValueError) as e:
+            return e
+
+    with ThreadPoolExecutor(
+        max_workers=min(max_workers, len(requests_by_key))
+    ) as executor:
+        results = executor.map(fetch, requests_by_key.values())
+        return dict(zip(requests_by_key.keys(), results))
@@ -1,10 +1,19 @@
-from core.lib.supabase.supa_client import supa_client
+from core.lib.supabase.outbox import enqueue
 from os import getenv
 
 
 def update_asset(id: str, exchange_rate):
+    update_assets({id: exchange_rate})
+
+
+def update_assets(rates: dict):
+    # Queued in the outbox, sent to Supabase by the flush_supabase_mirror task
     if getenv("USE_SUPABASE_PLUGIN") != "True":
         return
-    supa_client.table("asset").update({"usd_exchange_rate": exchange_rate}).eq(
-        "id", id
-    ).execute()
+    enqueue(
+        "asset",
+        [
+            {"id": id, "usd_exchange_rate": float(exchange_rate)}
+            for id, exchange_rate in rates.items()
+        ],
+    )
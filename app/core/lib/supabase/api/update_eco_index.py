@@ -1,29 +1,33 @@
-from core.lib.supabase.supa_client import supa_client
-import copy
+from core.lib.supabase.outbox import enqueue
 import logging
 from os import getenv
 
 logger = logging.getLogger(__name__)
 
+DECIMAL_FIELDS = [
+    "value",
+    "daily_delta",
+    "weekly_delta",
+    "monthly_delta",
+    "yearly_delta",
+    "decennial_delta",
+]
+
+
+def serializable_eco_index(kwargs):
+    serializable_kwargs = dict(kwargs)
+    for field in DECIMAL_FIELDS:
+        if serializable_kwargs.get(field) is not None:
+            serializable_kwargs[field] = float(serializable_kwargs[field])
+    return serializable_kwargs
+
 
 def update_eco_index(kwargs):
+    update_eco_indexes([kwargs])
+
+
+def update_eco_indexes(rows: list):
+    # Queued in the outbox, sent to Supabase by the flush_supabase_mirror task
     if getenv("USE_SUPABASE_PLUGIN") != "True":
         return
-    serializable_kwargs = copy.copy(kwargs)
-    if "value" in serializable_kwargs:
-        serializable_kwargs["value"] = float(serializable_kwargs["value"])
-    if "daily_delta" in serializable_kwargs:
-        serializable_kwargs["daily_delta"] = float(serializable_kwargs["daily_delta"])
-    if "weekly_delta" in serializable_kwargs:
-        serializable_kwargs["weekly_delta"] = float(serializable_kwargs["weekly_delta"])
-    if "monthly_delta" in serializable_kwargs:
-        serializable_kwargs["monthly_delta"] = float(
-            serializable_kwargs["monthly_delta"]
-        )
-    if "yearly_delta" in serializable_kwargs:
-        serializable_kwargs["yearly_delta"] = float(serializable_kwargs["yearly_delta"])
-    if "decennial_delta" in serializable_kwargs:
-        serializable_kwargs["decennial_delta"] = float(
-            serializable_kwargs["decennial_delta"]
-        )
-    supa_client.table("economic_index").upsert(serializable_kwargs).execute()
+    enqueue("economic_index", [serializable_eco_index(kwargs) for kwargs in rows])
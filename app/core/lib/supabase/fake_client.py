@@ -0,0 +1,66 @@
+class FakeSupabaseResponse:
+    def __init__(self, data):
+        self.data = data
+
+
+class FakeSupabaseQuery:
+    def __init__(self, client, table):
+        self.client = client
+        self.table = table
+        self.rows = []
+        self.values = None
+        self.filters = {}
+
+    def upsert(self, rows):
+        self.rows = rows if isinstance(rows, list) else [rows]
+        return self
+
+    def update(self, values):
+        self.values = values
+        return self
+
+    def eq(self, column, value):
+        self.filters[column] = value
+        return self
+
+    def execute(self):
+        if self.values is not None:
+            self.client.calls.append((self.table, self.values, self.filters))
+        else:
+            self.client.calls.append((self.table, self.rows))
+        if self.client.failures_left > 0:
+            self.client.failures_left -= 1
+            raise ConnectionError("Fake Supabase failure")
+        table = self.client.tables.setdefault(self.table, {})
+        if self.values is not None:
+            # Only the existing rows are updated
+            updated = [
+                row
+                for row in table.values()
+                if all(
+                    row.get(column) == value for column, value in self.filters.items()
+                )
+            ]
+            for row in updated:
+                row.update(self.values)
+            return FakeSupabaseResponse(updated)
+        for row in self.rows:
+            table[row["id"]] = {**table.get(row["id"], {}), **row}
+        return FakeSupabaseResponse(self.rows)
+
+
+class FakeSupabaseClient:
+    """
+    In-memory stand-in for the Supabase client, covering the calls made by
+    the mirror sync: client.table(name).upsert(rows).execute() and
+    client.table(name).update(values).eq(column, value).execute().
+    :param failures: Number of upcoming executes that raise, to exercise retries.
+    """
+
+    def __init__(self, failures=0):
+        self.tables = {}
+        self.calls = []
+        self.failures_left = failures
+
+    def table(self, name):
+        return FakeSupabaseQuery(self, name)
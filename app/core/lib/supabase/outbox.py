@@ -0,0 +1,159 @@
+import logging
+from collections import defaultdict
+from datetime import timedelta
+from django.db import transaction
+from django.utils import timezone
+from core.lib.supabase.supa_client import get_supa_client
+from core.models import SupabaseOutbox
+
+logger = logging.getLogger(__name__)
+
+FLUSH_BATCH_SIZE = 500
+# Retry delays double from RETRY_BASE_DELAY up to RETRY_MAX_DELAY
+RETRY_BASE_DELAY = timedelta(seconds=30)
+RETRY_MAX_DELAY = timedelta(hours=1)
+# Rows being sent are hidden from the other flushes for this long, the rows
+# of a flush that died while sending are retried after it
+CLAIM_TIMEOUT = timedelta(minutes=5)
+# Tables whose queued payloads only carry some of the columns: their rows
+# are updated by id, one request per row, instead of being upserted (which
+# would insert partial rows for the ones missing in Supabase)
+UPDATED_TABLES = {"asset"}
+
+
+def enqueue(table, rows: list):
+    """
+    Queue rows to be upserted into a Supabase table, in one statement.
+    A row already waiting in the outbox gets its payload replaced.
+    A flush is requested once the current transaction commits.
+    :param rows: Row payloads, each with its "id".
+    """
+    if not rows:
+        return
+    now = timezone.now()
+    SupabaseOutbox.objects.bulk_create(
+        [
+            SupabaseOutbox(
+                table=table,
+                row_id=str(row["id"]),
+                payload=row,
+                queued_at=now,
+                attempts=0,
+                next_attempt_at=now,
+            )
+            for row in rows
+        ],
+        update_conflicts=True,
+        unique_fields=["table", "row_id"],
+        update_fields=["payload", "queued_at", "attempts", "next_attempt_at"],
+    )
+    transaction.on_commit(request_flush)
+
+
+def request_flush():
+    from core.tasks import flush_supabase_mirror
+
+    try:
+        flush_supabase_mirror.delay()
+    except Exception as e:
+        # The rows stay queued for the next flush
+        logger.info(f"Could not schedule the Supabase mirror flush: {e}")
+
+
+def retry_delay(attempts):
+    return min(RETRY_BASE_DELAY * 2 ** (attempts - 1), RETRY_MAX_DELAY)
+
+
+def _send(client, table, rows) -> list:
+    """
+    Send the payloads of outbox rows of one table.
+    :return: The rows that failed.
+    """
+    if table not in UPDATED_TABLES:
+        try:
+            client.table(table).upsert([row.payload for row in rows]).execute()
+        except Exception as e:
+            logger.info(f"Supabase upsert of {len(rows)} rows into {table} failed: {e}")
+            return rows
+        return []
+
+    failed = []
+    for row in rows:
+        values = {key: value for key, value in row.payload.items() if key != "id"}
+        try:
+            client.table(table).update(values).eq("id", row.payload["id"]).execute()
+        except Exception as e:
+            logger.info(f"Supabase update of {table} {row.row_id} failed: {e}")
+            failed.append(row)
+    return failed
+
+
+def flush_outbox(client=None, batch_size=FLUSH_BATCH_SIZE):
+    """
+    Send one batch of due outbox rows to Supabase, one upsert per table (one
+    update per row for UPDATED_TABLES).
+    The batch is claimed in a short transaction (rows locked with SKIP
+    LOCKED, then pushed CLAIM_TIMEOUT ahead), so concurrent flushes never
+    send the same row twice and enqueue never waits on a Supabase call.
+    Sent rows are deleted and failed ones rescheduled with backoff, unless
+    they were queued again in the meantime.
+    :return: (number of rows sent, number of rows rescheduled)
+    """
+    client = client or get_supa_client()
+    now = timezone.now()
+    claimed_until = now + CLAIM_TIMEOUT
+    with transaction.atomic():
+        rows = list(
+            SupabaseOutbox.objects.select_for_update(skip_locked=True)
+            .filter(next_attempt_at__lte=now)
+            .order_by("next_attempt_at")[:batch_size]
+        )
+        SupabaseOutbox.objects.filter(id__in=[row.id for row in rows]).update(
+            next_attempt_at=claimed_until
+        )
+
+    by_table = defaultdict(list)
+    for row in rows:
+        by_table[row.table].append(row)
+    failed = []
+    for table, table_rows in by_table.items():
+        failed.extend(_send(client, table, table_rows))
+
+    # A row queued again while being sent has a new next_attempt_at, and
+    # is left for the next flush
+    failed_ids = {row.id for row in failed}
+    SupabaseOutbox.objects.filter(
+        id__in=[row.id for row in rows if row.id not in failed_ids],
+        next_attempt_at=claimed_until,
+    ).delete()
+    if failed:
+        with transaction.atomic():
+            attempts = dict(
+                SupabaseOutbox.objects.select_for_update()
+                .filter(id__in=failed_ids, next_attempt_at=claimed_until)
+                .values_list("id", "attempts")
+            )
+            now = timezone.now()
+            SupabaseOutbox.objects.bulk_update(
+                [
+                    SupabaseOutbox(
+                        id=row_id,
+                        attempts=attempts[row_id] + 1,
+                        next_attempt_at=now + retry_delay(attempts[row_id] + 1),
+                    )
+                    for row_id in attempts
+                ],
+                ["attempts", "next_attempt_at"],
+            )
+    return len(rows) - len(failed), len(failed)
+
+
+def flush_all(client=None, batch_size=FLUSH_BATCH_SIZE):
+    # Drains every due row, stopping at the first batch that fails entirely
+    total_sent, total_failed = 0, 0
+    while True:
+        sent, failed = flush_outbox(client, batch_size)
+        total_sent += sent
+        total_failed += failed
+        if sent == 0:
+            return total_sent, total_failed
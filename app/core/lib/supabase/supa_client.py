@@ -1,14 +1,34 @@
+import threading
 from os import getenv
-from supabase import create_client, Client
 
 # from supabase.lib.client_options import ClientOptions
 
-url: str = getenv("SUPABASE_URL")
-key: str = getenv("SUPABASE_SERVICE_ROLE")
-# service_role: str = getenv("SUPABASE_SERVICE_ROLE")
-# clientOptions = ClientOptions(headers={"Authorization": f"Bearer {service_role}"})
-supa_client: Client = create_client(
-    url,
-    key,
-    # clientOptions,
-)
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_supa_client():
+    # Built on first use, so importing the ingestion modules doesn't open
+    # a Supabase connection (or require the credentials) at startup.
+    global _client
+    with _client_lock:
+        if _client is None:
+            from supabase import create_client
+
+            url: str = getenv("SUPABASE_URL")
+            key: str = getenv("SUPABASE_SERVICE_ROLE")
+            # service_role: str = getenv("SUPABASE_SERVICE_ROLE")
+            # clientOptions = ClientOptions(headers={"Authorization": f"Bearer {service_role}"})
+            _client = create_client(
+                url,
+                key,
+                # clientOptions,
+            )
+        return _client
+
+
+def set_supa_client(client):
+    # Replaces the client, e.g. with a FakeSupabaseClient in tests
+    global _client
+    with _client_lock:
+        _client = client
@@ -0,0 +1,85 @@
+import logging
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+# Handler of LiveWSConsumer receiving the group messages
+LIVE_UPDATE = 'live.update'
+
+
+def wallet_group(wallet_id):
+    return f'wallet.{wallet_id}'
+
+
+def asset_group(asset_id):
+    return f'asset.{asset_id}'
+
+
+def _send(messages):
+    # messages: list of (group, payload)
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    group_send = async_to_sync(channel_layer.group_send)
+    for group, payload in messages:
+        try:
+            group_send(group, {'type': LIVE_UPDATE, 'data': payload})
+        except Exception as e:
+            # Clients resync on reconnect, a lost push must never fail a write
+            logger.warning(f"Live push to {group} failed: {type(e).__name__}")
+
+
+def _publish_on_commit(messages):
+    if messages:
+        transaction.on_commit(lambda: _send(messages))
+
+
+def publish_wallet_changes(changes: dict):
+    """
+    Push the changed fields of wallets to their subscribers once committed.
+    :param changes: wallet id -> {field: new value} (only the changed fields).
+    """
+    _publish_on_commit(
+        [
+            (
+                wallet_group(wallet_id),
+                {'kind': 'wallet', 'id': str(wallet_id), **_jsonable(fields)},
+            )
+            for wallet_id, fields in changes.items()
+            if fields
+        ]
+    )
+
+
+def publish_wallet_balances(balances: dict):
+    # balances: wallet id -> new balance
+    publish_wallet_changes(
+        {wallet_id: {'balance': balance} for wallet_id, balance in balances.items()}
+    )
+
+
+def publish_asset_rates(rates: dict):
+    # rates: asset id -> new exchange rate
+    _publish_on_commit(
+        [
+            (
+                asset_group(asset_id),
+                {'kind': 'asset', 'id': asset_id, 'exchange_rate': float(rate)},
+            )
+            for asset_id, rate in rates.items()
+        ]
+    )
+
+
+def _jsonable(fields):
+    jsonable = {}
+    for field, value in fields.items():
+        if value is None or isinstance(value, (bool, int, float, str)):
+            jsonable[field] = value
+        elif hasattr(value, 'is_finite'):  # Decimal
+            jsonable[field] = float(value)
+        else:
+            jsonable[field] = str(value)
+    return jsonable
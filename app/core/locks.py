@@ -0,0 +1,137 @@
+import logging
+import threading
+import time
+import uuid
+from functools import wraps
+from django_redis import get_redis_connection
+from .metrics import record_task_run
+
+logger = logging.getLogger(__name__)
+
+LEASE_KEY_PREFIX = 'lease:'
+# Renewed every third of it while held, so it only runs out when the
+# holder died (killed worker, lost connection)
+DEFAULT_LEASE_TTL = 60  # seconds
+
+# Renew or release only the lease taken with this token
+_RENEW_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+_RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class Lease:
+    """
+    Exclusive right to run `name`, shared by every process through Redis.
+    Held until released, or for `ttl` seconds after it was taken or last
+    renewed. Used as a context manager once acquired, it is renewed in the
+    background and released on exit.
+    :param token: Of a lease taken elsewhere, to release it.
+    """
+
+    def __init__(self, name, ttl=DEFAULT_LEASE_TTL, token=None):
+        self.name = name
+        self.ttl = ttl
+        self.token = token or uuid.uuid4().hex
+        self.key = f'{LEASE_KEY_PREFIX}{name}'
+        # Set when the lease ran out while held: another run may have started
+        self.lost = False
+        self._redis = get_redis_connection('default')
+        self._stop = threading.Event()
+        self._renewer = None
+
+    def acquire(self) -> bool:
+        return bool(
+            self._redis.set(self.key, self.token, nx=True, px=int(self.ttl * 1000))
+        )
+
+    def renew(self) -> bool:
+        renewed = bool(
+            self._redis.eval(
+                _RENEW_SCRIPT, 1, self.key, self.token, int(self.ttl * 1000)
+            )
+        )
+        if not renewed:
+            self.lost = True
+        return renewed
+
+    def release(self) -> bool:
+        released = bool(self._redis.eval(_RELEASE_SCRIPT, 1, self.key, self.token))
+        if not released:
+            self.lost = True
+        return released
+
+    def _keep_alive(self):
+        while not self._stop.wait(self.ttl / 3):
+            try:
+                if not self.renew():
+                    logger.warning(f"Lease {self.name} ran out while held")
+                    return
+            except Exception as e:
+                # Retried on the next beat, the lease may still be valid
+                logger.warning(f"Could not renew the lease {self.name}: {e}")
+
+    def __enter__(self):
+        self._stop.clear()
+        self._renewer = threading.Thread(
+            target=self._keep_alive, name=f'lease:{self.name}', daemon=True
+        )
+        self._renewer.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._renewer.join()
+        self.release()
+
+
+def single_flight(name=None, ttl=DEFAULT_LEASE_TTL):
+    """
+    Runs the decorated function only while holding its lease, a call made
+    during another run (in any worker) is skipped and returns None.
+    Goes below @shared_task. Runs, skipped runs, runs that lost their lease
+    (and may have overlapped another one) and durations are recorded under
+    the lease name (see core.metrics).
+    :param name: Of the lease, the dotted path of the function by default.
+    """
+
+    def decorator(func):
+        lease_name = name or f'{func.__module__}.{func.__name__}'
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            lease = Lease(lease_name, ttl)
+            if not lease.acquire():
+                logger.info(f"{lease_name} skipped, another run holds its lease")
+                record_run(lease_name, skipped=True)
+                return None
+            start = time.perf_counter()
+            try:
+                with lease:
+                    return func(*args, **kwargs)
+            finally:
+                record_run(
+                    lease_name,
+                    duration=time.perf_counter() - start,
+                    overlapped=lease.lost,
+                )
+
+        return wrapper
+
+    return decorator
+
+
+def record_run(task, **kwargs):
+    # record_task_run that never fails the task, metrics are best effort
+    try:
+        record_task_run(task, **kwargs)
+    except Exception as e:
+        logger.warning(f"Could not record the metrics of {task}: {e}")
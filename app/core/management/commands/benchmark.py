@@ -0,0 +1,125 @@
+"""
+Django command to benchmark the API hot paths and the ingestion of provider data.
+"""
+
+import json
+import logging
+import subprocess
+from dataclasses import asdict, fields
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from core.benchmark import (
+    Scale,
+    api_benchmarks,
+    ingestion_benchmarks,
+    large_wallet_benchmarks,
+    measure,
+    provider_stub,
+    seed,
+)
+
+
+class _Rollback(Exception):
+    pass
+
+
+def current_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    """Django command to benchmark the API and the ingestion."""
+
+    help = (
+        'Seed synthetic data, then report throughput, p50/p99 latency and query '
+        'count of the API hot paths and of the ingestion (against local provider '
+        'stubs) as JSON. The data is rolled back at the end.'
+    )
+
+    def add_arguments(self, parser):
+        for scale_field in fields(Scale):
+            parser.add_argument(
+                f'--{scale_field.name.replace("_", "-")}',
+                type=int,
+                default=scale_field.default,
+            )
+        parser.add_argument('--iterations', type=int, default=200)
+        parser.add_argument('--warmup', type=int, default=20)
+        parser.add_argument(
+            '--large-iterations',
+            type=int,
+            default=5,
+            help='Iterations of the benchmarks reading the large wallet',
+        )
+        parser.add_argument(
+            '--only', nargs='*', help='Names of the benchmarks to run (all by default)'
+        )
+        parser.add_argument('--output', help='JSON file to write (stdout by default)')
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        scale = Scale(**{field.name: options[field.name] for field in fields(Scale)})
+        if scale.users < 1 or scale.wallets_per_user < 1:
+            raise CommandError('At least one user with one wallet is needed.')
+
+        report = {
+            'commit': current_commit(),
+            'started_at': timezone.now().isoformat(),
+            'scale': asdict(scale),
+            'iterations': options['iterations'],
+            'warmup': options['warmup'],
+            'large_iterations': options['large_iterations'],
+            'results': {},
+        }
+        if options['verbosity'] < 2:
+            # The ingestion logs every run
+            logging.disable(logging.INFO)
+        try:
+            # Nothing is committed: on_commit hooks (cache invalidation,
+            # live updates) don't run, and the tables are left as they were
+            with transaction.atomic():
+                self.stderr.write('Seeding...')
+                dataset = seed(scale)
+                with provider_stub():
+                    benchmarks = {
+                        **api_benchmarks(dataset, scale.seed),
+                        **ingestion_benchmarks(),
+                    }
+                    large = large_wallet_benchmarks(dataset, scale)
+                    for name, call in {**benchmarks, **large}.items():
+                        if options['only'] and name not in options['only']:
+                            continue
+                        self.stderr.write(f'Running {name}...')
+                        if name in large:
+                            result = measure(
+                                name,
+                                call,
+                                options['large_iterations'],
+                                warmup=1,
+                                trace_memory=True,
+                            )
+                        else:
+                            result = measure(
+                                name, call, options['iterations'], options['warmup']
+                            )
+                        report['results'][name] = result.summary()
+                raise _Rollback()
+        except _Rollback:
+            pass
+        finally:
+            logging.disable(logging.NOTSET)
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                file.write(output + '\n')
+            self.stderr.write(self.style.SUCCESS(f'Wrote {options["output"]}.'))
+        else:
+            self.stdout.write(output)
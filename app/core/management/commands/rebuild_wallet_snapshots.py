@@ -0,0 +1,25 @@
+"""
+Django command to rebuild the daily snapshots of the wallets from their transactions.
+"""
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.snapshots import rebuild_wallet_snapshots
+
+
+class Command(BaseCommand):
+    """Django command to rebuild wallet daily snapshots."""
+
+    help = 'Rebuild the daily snapshots of some wallets (all of them by default).'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'wallet_ids', nargs='*', help='Ids of the wallets to rebuild'
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        with transaction.atomic():
+            rows = rebuild_wallet_snapshots(options['wallet_ids'] or None)
+        self.stdout.write(self.style.SUCCESS(f'Wrote {rows} snapshots.'))
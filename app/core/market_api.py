@@ -0,0 +1,170 @@
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from .cache import get_all_assets, get_all_economic_indexes
+from .metrics import query_budget
+from .models import (
+    AssetCandle,
+    AssetPrice,
+    CandleResolution,
+    EconomicIndexObservation,
+)
+
+# Most recent candles returned by get_asset_candles
+CANDLES_LIMIT = 1000
+
+
+def float_or_none(value):
+    return None if value is None else float(value)
+
+
+@query_budget(2)
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_assets(request):
+    return Response(
+        [
+            {
+                'id': asset['id'],
+                'category': asset['category'],
+                'exchange_rate': float(asset['exchange_rate']),
+            }
+            for asset in get_all_assets()
+        ]
+    )
+
+
+@query_budget(2)
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_economic_indexes(request):
+    return Response(
+        [
+            {
+                key: float_or_none(value) if key != 'id' else value
+                for key, value in index.items()
+            }
+            for index in get_all_economic_indexes()
+        ]
+    )
+
+
+def filter_date_range(queryset, request):
+    # ?from=YYYY-MM-DD&to=YYYY-MM-DD (both inclusive)
+    for param, lookup in (('from', 'date__gte'), ('to', 'date__lte')):
+        value = request.query_params.get(param)
+        if value:
+            queryset = queryset.filter(**{lookup: date.fromisoformat(value)})
+    return queryset
+
+
+@query_budget(2)
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_index_history(request, series):
+    observations = EconomicIndexObservation.objects.filter(series=series)
+    try:
+        observations = filter_date_range(observations, request)
+    except ValueError:
+        return Response(
+            {'detail': 'Invalid date format. It should be YYYY-MM-DD.'},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    return Response(
+        [
+            {'date': day.isoformat(), 'value': float(value)}
+            for day, value in observations.order_by('date').values_list('date', 'value')
+        ]
+    )
+
+
+@query_budget(2)
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_asset_history(request, asset_id):
+    prices = AssetPrice.objects.filter(asset_id=asset_id)
+    try:
+        prices = filter_date_range(prices, request)
+    except ValueError:
+        return Response(
+            {'detail': 'Invalid date format. It should be YYYY-MM-DD.'},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    return Response(
+        [
+            {'date': day.isoformat(), 'exchange_rate': float(exchange_rate)}
+            for day, exchange_rate in prices.order_by('date').values_list(
+                'date', 'exchange_rate'
+            )
+        ]
+    )
+
+
+def parse_moment(value, end=False):
+    # ISO 8601 datetime (UTC when naive) or date, at the start of the day
+    # (or of the next one for the end of a range)
+    moment = datetime.fromisoformat(value)
+    if len(value) == 10:
+        moment = datetime.combine(moment.date() + timedelta(days=end), time())
+    if timezone.is_naive(moment):
+        moment = moment.replace(tzinfo=dt_timezone.utc)
+    return moment
+
+
+def filter_time_range(queryset, request, field):
+    # ?from=&to= as dates or datetimes (both inclusive), see parse_moment
+    value = request.query_params.get('from')
+    if value:
+        queryset = queryset.filter(**{f'{field}__gte': parse_moment(value)})
+    value = request.query_params.get('to')
+    if value:
+        lookup = 'lt' if len(value) == 10 else 'lte'
+        queryset = queryset.filter(
+            **{f'{field}__{lookup}': parse_moment(value, end=True)}
+        )
+    return queryset
+
+
+@query_budget(2)
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_asset_candles(request, asset_id):
+    # ?resolution=1m|1h|1d (1h by default)&from=&to=, served from the rolled
+    # up candles only (see core.ticks)
+    resolution = request.query_params.get('resolution', CandleResolution.HOUR)
+    if resolution not in CandleResolution.values:
+        return Response(
+            {
+                'detail': f'Invalid resolution. It should be one of {", ".join(CandleResolution.values)}.'
+            },
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    candles = AssetCandle.objects.filter(asset_id=asset_id, resolution=resolution)
+    try:
+        candles = filter_time_range(candles, request, 'start')
+    except (OverflowError, ValueError):
+        # Also dates that can't be moved to the next day (9999-12-31)
+        return Response(
+            {
+                'detail': 'Invalid date format. It should be YYYY-MM-DD or an ISO 8601 datetime.'
+            },
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    rows = candles.order_by('-start').values_list(
+        'start', 'open', 'high', 'low', 'close'
+    )[:CANDLES_LIMIT]
+    return Response(
+        [
+            {
+                'start': start.isoformat(),
+                'open': float(open),
+                'high': float(high),
+                'low': float(low),
+                'close': float(close),
+            }
+            for start, open, high, low, close in reversed(rows)
+        ]
+    )
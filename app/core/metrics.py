@@ -0,0 +1,386 @@
+import logging
+import time
+from contextvars import ContextVar
+from functools import wraps
+from django.conf import settings
+from django.db import connection
+from django_redis import get_redis_connection
+from rest_framework.serializers import ListSerializer
+from .cache import tracked_cache_stats
+
+logger = logging.getLogger(__name__)
+
+# Per view, a Redis hash of sums and histogram buckets (each bucket counts
+# the requests up to its bound and above the previous one), updated in one
+# round trip per request
+METRICS_KEY_PREFIX = 'metrics:view:'
+METRICS_VIEWS_KEY = 'metrics:views'
+# Same for the calls to each external provider (see core.providers)
+PROVIDER_KEY_PREFIX = 'metrics:provider:'
+PROVIDERS_KEY = 'metrics:providers'
+# And for the runs of single-flight tasks (see core.locks)
+TASK_KEY_PREFIX = 'metrics:task:'
+TASKS_KEY = 'metrics:tasks'
+LATENCY_BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)  # ms
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50)
+DURATION_BUCKETS = (1, 5, 10, 30, 60, 120, 300)  # seconds
+SUMS = ('latency_ms', 'db_ms', 'serializer_ms', 'queries')
+CACHE_HITS = ('local_hit', 'shared_hit', 'memo_hit')
+CACHE_MISSES = ('shared_miss', 'memo_miss')
+
+_current = ContextVar('request_metrics', default=None)
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def query_budget(queries):
+    """
+    Declares the most queries a view may run per request, authentication
+    included. Goes above @api_view, or on the class of a class-based view.
+    Going over it is logged and counted, and raises QueryBudgetExceeded
+    when settings.QUERY_BUDGETS_STRICT is set (see test_query_budgets).
+    """
+
+    def decorator(view):
+        view.query_budget = queries
+        return view
+
+    return decorator
+
+
+def get_query_budget(view):
+    budget = getattr(view, 'query_budget', None)
+    if budget is None:
+        budget = getattr(getattr(view, 'view_class', None), 'query_budget', None)
+    return budget
+
+
+def view_path(view) -> str:
+    # Dotted path of the function or class, shared by every URL of a view
+    view = getattr(view, 'view_class', view)
+    return f'{view.__module__}.{view.__name__}'
+
+
+def bucket(value, bounds) -> str:
+    for bound in bounds:
+        if value <= bound:
+            return str(bound)
+    return 'inf'
+
+
+class RequestMetrics:
+    # Measures of one request, the instance being the execute wrapper
+    # of the database connection
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.serializing = False
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - start
+            self.queries += 1
+
+
+def _timed_serialization(method):
+    # Outermost call only, a serializer can serialize others
+    @wraps(method)
+    def timed(*args, **kwargs):
+        metrics = _current.get()
+        if metrics is None or metrics.serializing:
+            return method(*args, **kwargs)
+        metrics.serializing = True
+        start = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            metrics.serializer_time += time.perf_counter() - start
+            metrics.serializing = False
+
+    return timed
+
+
+class TimedSerializerMixin:
+    """
+    Times validation and serialization, which includes the queries they
+    trigger (lazy querysets are often evaluated there), for requests going
+    through RequestMetricsMiddleware. Goes first in the bases of a
+    serializer, lists of it (many=True) are timed as a whole.
+    """
+
+    @_timed_serialization
+    def is_valid(self, *args, **kwargs):
+        return super().is_valid(*args, **kwargs)
+
+    @property
+    @_timed_serialization
+    def data(self):
+        return super().data
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        serializer = super().many_init(*args, **kwargs)
+        if type(serializer) is ListSerializer:
+            serializer.__class__ = TimedListSerializer
+        return serializer
+
+
+class TimedListSerializer(TimedSerializerMixin, ListSerializer):
+    pass
+
+
+def record(view, metrics: RequestMetrics, latency, cache_stats, over_budget=False):
+    fields = {
+        'count': 1,
+        'over_budget': int(over_budget),
+        'queries': metrics.queries,
+        f'latency_le_{bucket(latency * 1000, LATENCY_BUCKETS)}': 1,
+        f'queries_le_{bucket(metrics.queries, QUERY_BUCKETS)}': 1,
+        'cache_hits': sum(cache_stats[stat] for stat in CACHE_HITS),
+        'cache_misses': sum(cache_stats[stat] for stat in CACHE_MISSES),
+    }
+    timings = {
+        'latency_ms': latency * 1000,
+        'db_ms': metrics.db_time * 1000,
+        'serializer_ms': metrics.serializer_time * 1000,
+    }
+    key = f'{METRICS_KEY_PREFIX}{view}'
+    pipeline = get_redis_connection('default').pipeline(transaction=False)
+    pipeline.sadd(METRICS_VIEWS_KEY, view)
+    for field, value in fields.items():
+        if value:
+            pipeline.hincrby(key, field, value)
+    for field, value in timings.items():
+        pipeline.hincrbyfloat(key, field, round(value, 3))
+    pipeline.execute()
+
+
+def _quantile(histogram, bounds, count, q):
+    # Upper bound of the bucket holding the q-quantile
+    seen = 0
+    for bound in (*map(str, bounds), 'inf'):
+        seen += histogram.get(bound, 0)
+        if seen >= q * count:
+            return None if bound == 'inf' else int(bound)
+    return None
+
+
+def _histogram(values: dict, name) -> dict:
+    prefix = f'{name}_le_'
+    return {
+        field[len(prefix) :]: int(value)
+        for field, value in values.items()
+        if field.startswith(prefix)
+    }
+
+
+def summarize(view, values: dict) -> dict:
+    count = int(values.get('count', 0))
+    if not count:
+        return {'view': view, 'count': 0}
+    latency = _histogram(values, 'latency')
+    queries = _histogram(values, 'queries')
+    hits = int(values.get('cache_hits', 0))
+    lookups = hits + int(values.get('cache_misses', 0))
+    summary = {'view': view, 'count': count}
+    for name in SUMS:
+        summary[f'mean_{name}'] = round(float(values.get(name, 0)) / count, 3)
+    for q in (50, 95, 99):
+        # None when above the last bound
+        summary[f'p{q}_latency_ms'] = _quantile(
+            latency, LATENCY_BUCKETS, count, q / 100
+        )
+        summary[f'p{q}_queries'] = _quantile(queries, QUERY_BUCKETS, count, q / 100)
+    summary['cache_hit_ratio'] = round(hits / lookups, 3) if lookups else None
+    summary['over_budget'] = int(values.get('over_budget', 0))
+    summary['latency_histogram'] = latency
+    summary['queries_histogram'] = queries
+    return summary
+
+
+def summarize_provider(provider, values: dict) -> dict:
+    count = int(values.get('count', 0))
+    if not count:
+        return {'provider': provider, 'count': 0}
+    latency = _histogram(values, 'latency')
+    summary = {
+        'provider': provider,
+        'count': count,
+        'mean_latency_ms': round(float(values.get('latency_ms', 0)) / count, 3),
+    }
+    for q in (50, 95, 99):
+        summary[f'p{q}_latency_ms'] = _quantile(
+            latency, LATENCY_BUCKETS, count, q / 100
+        )
+    summary['error_rate'] = round(int(values.get('errors', 0)) / count, 3)
+    summary['retries'] = int(values.get('retries', 0))
+    summary['not_modified'] = int(values.get('not_modified', 0))
+    summary['latency_histogram'] = latency
+    return summary
+
+
+def summarize_task(task, values: dict) -> dict:
+    runs = int(values.get('count', 0))
+    summary = {
+        'task': task,
+        'runs': runs,
+        'skipped': int(values.get('skipped', 0)),
+        'overlapped': int(values.get('overlapped', 0)),
+    }
+    if runs:
+        duration = _histogram(values, 'duration')
+        summary['mean_duration_s'] = round(float(values.get('duration_s', 0)) / runs, 3)
+        for q in (50, 95, 99):
+            summary[f'p{q}_duration_s'] = _quantile(
+                duration, DURATION_BUCKETS, runs, q / 100
+            )
+        summary['duration_histogram'] = duration
+    return summary
+
+
+def _read_metrics(names_key, key_prefix) -> list:
+    # (name, hash) of every name in the set
+    redis = get_redis_connection('default')
+    names = sorted(name.decode() for name in redis.smembers(names_key))
+    pipeline = redis.pipeline(transaction=False)
+    for name in names:
+        pipeline.hgetall(f'{key_prefix}{name}')
+    return [
+        (name, {key.decode(): value for key, value in values.items()})
+        for name, values in zip(names, pipeline.execute())
+    ]
+
+
+def get_view_metrics() -> list:
+    """
+    Aggregated metrics of every view served since the last reset, most
+    requested first.
+    """
+    summaries = [
+        summarize(view, values)
+        for view, values in _read_metrics(METRICS_VIEWS_KEY, METRICS_KEY_PREFIX)
+    ]
+    return sorted(summaries, key=lambda summary: -summary['count'])
+
+
+def get_provider_metrics() -> list:
+    return [
+        summarize_provider(provider, values)
+        for provider, values in _read_metrics(PROVIDERS_KEY, PROVIDER_KEY_PREFIX)
+    ]
+
+
+def get_task_metrics() -> list:
+    return [
+        summarize_task(task, values)
+        for task, values in _read_metrics(TASKS_KEY, TASK_KEY_PREFIX)
+    ]
+
+
+def record_provider_call(provider, latency, retries=0, error=False, not_modified=False):
+    """
+    :param latency: Seconds, retries and their waits included.
+    """
+    fields = {
+        'count': 1,
+        f'latency_le_{bucket(latency * 1000, LATENCY_BUCKETS)}': 1,
+        'retries': retries,
+        'errors': int(error),
+        'not_modified': int(not_modified),
+    }
+    key = f'{PROVIDER_KEY_PREFIX}{provider}'
+    pipeline = get_redis_connection('default').pipeline(transaction=False)
+    pipeline.sadd(PROVIDERS_KEY, provider)
+    for field, value in fields.items():
+        if value:
+            pipeline.hincrby(key, field, value)
+    pipeline.hincrbyfloat(key, 'latency_ms', round(latency * 1000, 3))
+    pipeline.execute()
+
+
+def record_task_run(task, duration=None, skipped=False, overlapped=False):
+    """
+    :param duration: Seconds, None for a skipped run.
+    """
+    key = f'{TASK_KEY_PREFIX}{task}'
+    pipeline = get_redis_connection('default').pipeline(transaction=False)
+    pipeline.sadd(TASKS_KEY, task)
+    if skipped:
+        pipeline.hincrby(key, 'skipped', 1)
+    if overlapped:
+        pipeline.hincrby(key, 'overlapped', 1)
+    if duration is not None:
+        pipeline.hincrby(key, 'count', 1)
+        pipeline.hincrby(key, f'duration_le_{bucket(duration, DURATION_BUCKETS)}', 1)
+        pipeline.hincrbyfloat(key, 'duration_s', round(duration, 3))
+    pipeline.execute()
+
+
+def reset_metrics():
+    redis = get_redis_connection('default')
+    keys = [METRICS_VIEWS_KEY, PROVIDERS_KEY, TASKS_KEY]
+    for names_key, key_prefix in (
+        (METRICS_VIEWS_KEY, METRICS_KEY_PREFIX),
+        (PROVIDERS_KEY, PROVIDER_KEY_PREFIX),
+        (TASKS_KEY, TASK_KEY_PREFIX),
+    ):
+        keys.extend(
+            f'{key_prefix}{name.decode()}' for name in redis.smembers(names_key)
+        )
+    redis.delete(*keys)
+
+
+class RequestMetricsMiddleware:
+    """
+    Records, per view, the latency of the requests with their number of
+    queries, time spent in the database and in serializers (those using
+    TimedSerializerMixin), and lookups of core.cache. Goes first in
+    MIDDLEWARE to time the whole request. The queries of a streamed
+    response body are not counted.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.REQUEST_METRICS:
+            return self.get_response(request)
+
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        start = time.perf_counter()
+        try:
+            with tracked_cache_stats() as cache_stats:
+                with connection.execute_wrapper(metrics):
+                    response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        latency = time.perf_counter() - start
+
+        match = request.resolver_match
+        if match is None:
+            return response
+        view = view_path(match.func)
+        budget = get_query_budget(match.func)
+        over_budget = budget is not None and metrics.queries > budget
+        try:
+            record(view, metrics, latency, cache_stats, over_budget)
+        except Exception as e:
+            logger.warning(f"Could not record the metrics of {view}: {e}")
+
+        if over_budget:
+            message = (
+                f"{view} ran {metrics.queries} queries for {request.method} "
+                f"{request.path}, its budget is {budget}"
+            )
+            if settings.QUERY_BUDGETS_STRICT:
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
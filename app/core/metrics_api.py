@@ -0,0 +1,28 @@
+from rest_framework import status
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from .metrics import (
+    get_provider_metrics,
+    get_task_metrics,
+    get_view_metrics,
+    reset_metrics,
+)
+
+
+@api_view(['GET', 'DELETE'])
+@permission_classes([IsAdminUser])
+def view_metrics(request):
+    # Staff only: per view latency, queries and cache use (see
+    # RequestMetricsMiddleware), per provider latency and errors, skipped
+    # and overlapping runs of the scheduled tasks
+    if request.method == 'DELETE':
+        reset_metrics()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+    return Response(
+        {
+            'views': get_view_metrics(),
+            'providers': get_provider_metrics(),
+            'tasks': get_task_metrics(),
+        }
+    )
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.1 on 2026-10-18 08:30
+
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_remove_transaction_counterparty_transaction_origin'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='transaction',
+            name='wallet',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='%(class)s_wallet', to='core.wallet'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['wallet', '-executed_at', 'id'], name='transaction_history_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['tags'], name='transaction_tags_idx'),
+        ),
+    ]
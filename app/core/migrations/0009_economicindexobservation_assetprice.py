@@ -0,0 +1,52 @@
+# Generated by Django 4.2.1 on 2026-10-18 08:33
+
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_transaction_history_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AssetPrice',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('exchange_rate', models.DecimalField(decimal_places=12, max_digits=24)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='EconomicIndexObservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('series', models.CharField(max_length=32)),
+                ('date', models.DateField()),
+                ('value', models.DecimalField(decimal_places=4, max_digits=12)),
+            ],
+            options={
+                'indexes': [django.contrib.postgres.indexes.BrinIndex(fields=['date'], name='economic_index_obs_date_brin')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='economicindexobservation',
+            constraint=models.UniqueConstraint(fields=('series', 'date'), name='economic_index_observation_unique'),
+        ),
+        migrations.AddField(
+            model_name='assetprice',
+            name='asset',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='%(class)s_asset', to='core.asset'),
+        ),
+        migrations.AddIndex(
+            model_name='assetprice',
+            index=django.contrib.postgres.indexes.BrinIndex(fields=['date'], name='asset_price_date_brin'),
+        ),
+        migrations.AddConstraint(
+            model_name='assetprice',
+            constraint=models.UniqueConstraint(fields=('asset', 'date'), name='asset_price_unique'),
+        ),
+    ]
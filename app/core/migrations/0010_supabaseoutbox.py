@@ -0,0 +1,33 @@
+# Generated by Django 4.2.1 on 2026-10-18 08:36
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_economicindexobservation_assetprice'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SupabaseOutbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('table', models.CharField(max_length=64)),
+                ('row_id', models.CharField(max_length=64)),
+                ('payload', models.JSONField()),
+                ('queued_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['next_attempt_at'], name='supabase_outbox_due_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='supabaseoutbox',
+            constraint=models.UniqueConstraint(fields=('table', 'row_id'), name='supabase_outbox_unique'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.2.1 on 2026-10-18 08:41
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_supabaseoutbox'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='transaction',
+            name='executed_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
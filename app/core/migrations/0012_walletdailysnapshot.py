@@ -0,0 +1,30 @@
+# Generated by Django 4.2.1 on 2026-10-18 08:54
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_transaction_executed_at_default'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WalletDailySnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('closing_balance', models.DecimalField(decimal_places=8, max_digits=19)),
+                ('inflow', models.DecimalField(decimal_places=8, default=0, max_digits=19)),
+                ('outflow', models.DecimalField(decimal_places=8, default=0, max_digits=19)),
+                ('category_totals', models.JSONField(default=dict)),
+                ('wallet', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='%(class)s_wallet', to='core.wallet')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='walletdailysnapshot',
+            constraint=models.UniqueConstraint(fields=('wallet', 'date'), name='wallet_daily_snapshot_unique'),
+        ),
+    ]
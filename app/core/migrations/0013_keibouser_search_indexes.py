@@ -0,0 +1,35 @@
+# Generated by Django 4.2.1 on 2026-10-18 09:05
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import AddIndexConcurrently, TrigramExtension
+from django.db import migrations, models
+import django.db.models.functions.comparison
+
+
+class Migration(migrations.Migration):
+    # The indexes are built without locking the users table
+    atomic = False
+
+    dependencies = [
+        ('core', '0012_walletdailysnapshot'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        AddIndexConcurrently(
+            model_name='keibouser',
+            index=models.Index(django.db.models.functions.comparison.Collate('email', 'C'), name='user_email_prefix_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='keibouser',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['email'], name='user_email_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        AddIndexConcurrently(
+            model_name='keibouser',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['first_name'], name='user_first_name_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        AddIndexConcurrently(
+            model_name='keibouser',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['last_name'], name='user_last_name_trgm', opclasses=['gin_trgm_ops']),
+        ),
+    ]
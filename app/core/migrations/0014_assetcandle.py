@@ -0,0 +1,32 @@
+# Generated by Django 4.2.1 on 2026-10-18 09:28
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_keibouser_search_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AssetCandle',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resolution', models.CharField(choices=[('1m', 'Minute'), ('1h', 'Hour'), ('1d', 'Day')], max_length=2)),
+                ('start', models.DateTimeField()),
+                ('open', models.DecimalField(decimal_places=12, max_digits=24)),
+                ('high', models.DecimalField(decimal_places=12, max_digits=24)),
+                ('low', models.DecimalField(decimal_places=12, max_digits=24)),
+                ('close', models.DecimalField(decimal_places=12, max_digits=24)),
+                ('ticks', models.PositiveIntegerField(default=0)),
+                ('asset', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='%(class)s_asset', to='core.asset')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='assetcandle',
+            constraint=models.UniqueConstraint(fields=('asset', 'resolution', 'start'), name='asset_candle_unique'),
+        ),
+    ]
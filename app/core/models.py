@@ -1,4 +1,6 @@
 from django.db import models
+from django.db.models import DecimalField, ExpressionWrapper, F
+from django.db.models.functions import Collate
 from django.utils import timezone
 from django.contrib.auth.models import (
     BaseUserManager,
@@ -6,6 +8,7 @@ from django.contrib.auth.models import (
     PermissionsMixin,
 )
 from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import BrinIndex, GinIndex
 from decimal import Decimal, DivisionByZero
 import uuid
 from .utils import generate_random_string
@@ -33,6 +36,25 @@ class KeiboUserManager(BaseUserManager):
         return user
 
 
+class KeiboUserQuerySet(models.QuerySet):
+    # Bulk writes drop the cached users like save and delete do
+    def update(self, **kwargs):
+        user_ids = list(self.values_list('pk', flat=True))
+        rows = super().update(**kwargs)
+        from .authentication import forget_users
+
+        forget_users(user_ids)
+        return rows
+
+    def delete(self):
+        user_ids = list(self.values_list('pk', flat=True))
+        deleted = super().delete()
+        from .authentication import forget_users
+
+        forget_users(user_ids)
+        return deleted
+
+
 class KeiboUser(AbstractBaseUser, PermissionsMixin):
     email = models.EmailField(max_length=255, unique=True)
     first_name = models.CharField(max_length=255)
@@ -48,14 +70,49 @@ class KeiboUser(AbstractBaseUser, PermissionsMixin):
     # Additional custom properties
     is_prime_user = models.BooleanField(default=False)
 
-    objects = KeiboUserManager()
+    objects = KeiboUserManager.from_queryset(KeiboUserQuerySet)()
 
     USERNAME_FIELD = 'email'  # is intrinsically required
     REQUIRED_FIELDS = ['first_name', 'last_name']
 
+    class Meta:
+        indexes = [
+            # Prefix search: LIKE 'abc%' and its ordering, in byte order
+            models.Index(Collate('email', 'C'), name='user_email_prefix_idx'),
+            # Substring and similarity search (pg_trgm)
+            GinIndex(
+                fields=['email'], opclasses=['gin_trgm_ops'], name='user_email_trgm'
+            ),
+            GinIndex(
+                fields=['first_name'],
+                opclasses=['gin_trgm_ops'],
+                name='user_first_name_trgm',
+            ),
+            GinIndex(
+                fields=['last_name'],
+                opclasses=['gin_trgm_ops'],
+                name='user_last_name_trgm',
+            ),
+        ]
+
     def __str__(self):
         return self.email
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # Authenticated requests resolve users through a cache
+        from .authentication import forget_user
+
+        forget_user(self.pk)
+
+    def delete(self, *args, **kwargs):
+        user_id = self.pk
+        deleted = super().delete(*args, **kwargs)
+        from .authentication import forget_user
+
+        forget_user(user_id)
+        return deleted
+
 
 class AssetCategory(models.TextChoices):
     CASH = 'cash'  # is currency
@@ -79,6 +136,26 @@ def default_wallet_name():
     return generate_random_string(prefix='wallet_')
 
 
+class WalletQuerySet(models.QuerySet):
+    def for_user(self, user):
+        # Wallets shared with the user, annotated with the user's role.
+        # The role is read through the same join as the filter, so each
+        # wallet comes back exactly once per WalletUser row.
+        return self.filter(walletuser_wallet__user=user).annotate(
+            role=F('walletuser_wallet__role')
+        )
+
+    def with_valuation(self):
+        # Pulls the asset category and the USD value through the asset join
+        return self.annotate(
+            category=F('asset__category'),
+            val_usd=ExpressionWrapper(
+                F('balance') * F('asset__exchange_rate'),
+                output_field=DecimalField(max_digits=44, decimal_places=20),
+            ),
+        )
+
+
 class Wallet(models.Model):
     id = models.UUIDField(
         default=uuid.uuid4, primary_key=True, unique=True, editable=False
@@ -100,6 +177,8 @@ class Wallet(models.Model):
     )
     is_public = models.BooleanField(default=False)
 
+    objects = WalletQuerySet.as_manager()
+
     def __str__(self):
         return self.name
 
@@ -161,9 +240,55 @@ class AbstractWalletReference(models.Model):
         abstract = True
 
 
+class WalletUserQuerySet(models.QuerySet):
+    # Bulk writes invalidate the caches of the users like save and delete do
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = super().bulk_create(objs, *args, **kwargs)
+        from .permissions import invalidate_memberships
+
+        invalidate_memberships(obj.user_id for obj in objs)
+        return objs
+
+    def update(self, **kwargs):
+        user_ids = list(self.values_list('user_id', flat=True))
+        if 'user' in kwargs or 'user_id' in kwargs:
+            user = kwargs.get('user', kwargs.get('user_id'))
+            user_ids.append(getattr(user, 'pk', user))
+        rows = super().update(**kwargs)
+        from .permissions import invalidate_memberships
+
+        invalidate_memberships(user_ids)
+        return rows
+
+    def delete(self):
+        user_ids = list(self.values_list('user_id', flat=True))
+        deleted = super().delete()
+        from .permissions import invalidate_memberships
+
+        invalidate_memberships(user_ids)
+        return deleted
+
+
 class WalletUser(AbstractWalletReference):
     granted_at = models.DateTimeField(auto_now_add=True)
 
+    objects = WalletUserQuerySet.as_manager()
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # Requests authorize against a cached map of the roles of the user,
+        # and wallet lists and portfolios are cached per user
+        from .permissions import invalidate_memberships
+
+        invalidate_memberships([self.user_id])
+
+    def delete(self, *args, **kwargs):
+        deleted = super().delete(*args, **kwargs)
+        from .permissions import invalidate_memberships
+
+        invalidate_memberships([self.user_id])
+        return deleted
+
 
 class Invitation(AbstractWalletReference):
     created_at = models.DateTimeField(auto_now_add=True)
@@ -173,8 +298,12 @@ class Transaction(models.Model):
     id = models.UUIDField(
         default=uuid.uuid4, primary_key=True, unique=True, editable=False
     )
+    # Indexed through the (wallet, executed_at, id) history index below
     wallet = models.ForeignKey(
-        Wallet, on_delete=models.CASCADE, related_name='%(class)s_wallet'
+        Wallet,
+        on_delete=models.CASCADE,
+        related_name='%(class)s_wallet',
+        db_index=False,
     )
     # Self-referential ForeignKey
     # If exists, it means that this transaction depends on another (transfer for example)
@@ -185,13 +314,51 @@ class Transaction(models.Model):
         blank=True,
         related_name='transaction_of_origin',
     )
-    executed_at = models.DateTimeField(auto_now_add=True)
+    # Defaults to now, imports carry the original execution time
+    executed_at = models.DateTimeField(default=timezone.now)
     settled_at = models.DateTimeField(null=True, blank=True)
     category = models.CharField(max_length=32)  # tax, gas, etc...
     description = models.CharField(max_length=200, blank=True)
     amount = models.DecimalField(max_digits=19, decimal_places=8)
     tags = ArrayField(models.CharField(max_length=24), default=list, blank=True)
 
+    class Meta:
+        indexes = [
+            # Backs the keyset pagination of a wallet's history
+            models.Index(
+                fields=['wallet', '-executed_at', 'id'],
+                name='transaction_history_idx',
+            ),
+            GinIndex(fields=['tags'], name='transaction_tags_idx'),
+        ]
+
+
+# Daily summary of the transactions of a wallet, maintained by core.snapshots.
+# closing_balance is the running sum of the amounts up to the end of the
+# day (UTC), so a chart reads one row per day instead of every transaction.
+class WalletDailySnapshot(models.Model):
+    # Indexed through the (wallet, date) unique constraint
+    wallet = models.ForeignKey(
+        Wallet,
+        on_delete=models.CASCADE,
+        related_name='%(class)s_wallet',
+        db_index=False,
+    )
+    date = models.DateField()
+    closing_balance = models.DecimalField(max_digits=19, decimal_places=8)
+    inflow = models.DecimalField(max_digits=19, decimal_places=8, default=0)
+    # Positive total of the negative amounts
+    outflow = models.DecimalField(max_digits=19, decimal_places=8, default=0)
+    # category -> net amount of the day
+    category_totals = models.JSONField(default=dict)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['wallet', 'date'], name='wallet_daily_snapshot_unique'
+            ),
+        ]
+
 
 # Example: S&P 500, crypto total market cap, interest rate, etc...
 class EconomicIndex(models.Model):
@@ -213,3 +380,99 @@ class EconomicIndex(models.Model):
     decennial_delta = models.DecimalField(
         max_digits=12, decimal_places=4, null=True, blank=True
     )
+
+
+# Append-only history of the series stored in EconomicIndex, one row per
+# series and observation date. EconomicIndex keeps the latest value only.
+class EconomicIndexObservation(models.Model):
+    series = models.CharField(max_length=32)
+    date = models.DateField()
+    value = models.DecimalField(max_digits=12, decimal_places=4)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['series', 'date'], name='economic_index_observation_unique'
+            ),
+        ]
+        indexes = [
+            # Rows are appended in date order, a BRIN index stays tiny
+            BrinIndex(fields=['date'], name='economic_index_obs_date_brin'),
+        ]
+
+
+# Daily closing exchange rate of an asset (against the USD)
+class AssetPrice(models.Model):
+    # Indexed through the (asset, date) unique constraint
+    asset = models.ForeignKey(
+        Asset,
+        on_delete=models.CASCADE,
+        related_name='%(class)s_asset',
+        db_index=False,
+    )
+    date = models.DateField()
+    exchange_rate = models.DecimalField(max_digits=24, decimal_places=12)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['asset', 'date'], name='asset_price_unique'
+            ),
+        ]
+        indexes = [
+            BrinIndex(fields=['date'], name='asset_price_date_brin'),
+        ]
+
+
+class CandleResolution(models.TextChoices):
+    MINUTE = '1m'
+    HOUR = '1h'
+    DAY = '1d'
+
+
+# OHLC of the exchange rate of an asset over one period, rolled up from the
+# price ticks buffered in Redis (see core.ticks)
+class AssetCandle(models.Model):
+    # Indexed through the (asset, resolution, start) unique constraint
+    asset = models.ForeignKey(
+        Asset,
+        on_delete=models.CASCADE,
+        related_name='%(class)s_asset',
+        db_index=False,
+    )
+    resolution = models.CharField(max_length=2, choices=CandleResolution.choices)
+    start = models.DateTimeField()
+    open = models.DecimalField(max_digits=24, decimal_places=12)
+    high = models.DecimalField(max_digits=24, decimal_places=12)
+    low = models.DecimalField(max_digits=24, decimal_places=12)
+    close = models.DecimalField(max_digits=24, decimal_places=12)
+    ticks = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['asset', 'resolution', 'start'], name='asset_candle_unique'
+            ),
+        ]
+
+
+# Rows waiting to be mirrored to Supabase. A row is queued once per
+# (table, row_id): queuing it again replaces the payload, so a flush always
+# sends the latest state and retries stay idempotent.
+class SupabaseOutbox(models.Model):
+    table = models.CharField(max_length=64)
+    row_id = models.CharField(max_length=64)
+    payload = models.JSONField()
+    queued_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['table', 'row_id'], name='supabase_outbox_unique'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['next_attempt_at'], name='supabase_outbox_due_idx'),
+        ]
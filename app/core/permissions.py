@@ -0,0 +1,135 @@
+import uuid
+from django.db import transaction
+from rest_framework.exceptions import NotFound
+from rest_framework.permissions import SAFE_METHODS, BasePermission
+from .cache import cached_shared, invalidate, invalidate_users
+from .models import Wallet, WalletUser
+
+# See models.ROLES
+VIEWER = 1
+EDITOR = 2
+MANAGER = 3
+OWNER = 4
+
+WALLET_ROLES_TTL = 60 * 60  # seconds
+
+
+def _roles_namespace(user_id):
+    return f'wallet_roles:{user_id}'
+
+
+def get_wallet_roles(user_id) -> dict:
+    """
+    Role of a user in each of their wallets, from the shared cache or in one
+    query. Versioned per user, the version is bumped by invalidate_wallet_roles
+    when their WalletUser rows change.
+    :return: wallet id (UUID) -> role
+    """
+    return cached_shared(
+        _roles_namespace(user_id),
+        'roles',
+        lambda: dict(
+            WalletUser.objects.filter(user_id=user_id).values_list('wallet_id', 'role')
+        ),
+        timeout=WALLET_ROLES_TTL,
+    )
+
+
+def request_wallet_roles(request) -> dict:
+    # Loaded once per request, whatever the number of checks
+    roles = getattr(request, '_wallet_roles', None)
+    if roles is None:
+        roles = get_wallet_roles(request.user.id)
+        request._wallet_roles = roles
+    return roles
+
+
+def wallet_role(request, wallet_id) -> int:
+    # 0 when the user has no access to the wallet
+    return request_wallet_roles(request).get(uuid.UUID(str(wallet_id)), 0)
+
+
+def invalidate_wallet_roles(user_ids):
+    # Runs once the change is visible: a lookup racing the change can only
+    # cache the old roles under the old version
+    user_ids = set(user_ids)
+
+    def invalidate_roles():
+        for user_id in user_ids:
+            invalidate(_roles_namespace(user_id))
+
+    transaction.on_commit(invalidate_roles)
+
+
+def invalidate_memberships(user_ids):
+    # Every write of WalletUser rows goes through here (see WalletUser and
+    # WalletUserQuerySet): the roles and the cached per-user entries (wallet
+    # lists, portfolios) of the users are dropped once the change is visible
+    user_ids = set(user_ids)
+    invalidate_wallet_roles(user_ids)
+    transaction.on_commit(lambda: invalidate_users(user_ids))
+
+
+class WalletRolePermission(BasePermission):
+    """
+    Minimum role on a wallet per kind of request. The wallet is the object
+    itself, the wallet of the object, or the "wallet_id" URL argument.
+    Anyone can read a public wallet.
+    """
+
+    read_role = VIEWER
+    write_role = EDITOR
+    delete_role = EDITOR
+
+    def has_permission(self, request, view):
+        wallet_id = view.kwargs.get('wallet_id')
+        if wallet_id is None:
+            # Checked on the object, if any
+            return True
+        return self.has_wallet_permission(request, wallet_id)
+
+    def has_object_permission(self, request, view, obj):
+        if isinstance(obj, Wallet):
+            return self.has_wallet_permission(request, obj.pk, obj)
+        return self.has_wallet_permission(request, obj.wallet_id)
+
+    def has_wallet_permission(self, request, wallet_id, wallet=None):
+        try:
+            wallet_id = uuid.UUID(str(wallet_id))
+        except ValueError:
+            # Malformed ids are reported by the view
+            return True
+        if request.method in SAFE_METHODS:
+            required, action = self.read_role, 'access'
+        elif request.method == 'DELETE':
+            required, action = self.delete_role, 'delete'
+        else:
+            required, action = self.write_role, 'update'
+        self.message = f'You do not have permission to {action} this wallet.'
+
+        if wallet_role(request, wallet_id) >= required:
+            return True
+        if request.method not in SAFE_METHODS:
+            return False
+        if wallet is not None:
+            return wallet.is_public
+        is_public = (
+            Wallet.objects.filter(id=wallet_id)
+            .values_list('is_public', flat=True)
+            .first()
+        )
+        if is_public is None:
+            raise NotFound()
+        return is_public
+
+
+class WalletPermission(WalletRolePermission):
+    # Managers edit a wallet, only its owner deletes it
+    write_role = MANAGER
+    delete_role = OWNER
+
+
+class TransactionPermission(WalletRolePermission):
+    # Editors write the transactions of a wallet
+    write_role = EDITOR
+    delete_role = EDITOR
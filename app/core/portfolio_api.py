@@ -0,0 +1,119 @@
+from decimal import Decimal
+from django.db import connection
+from rest_framework import status
+from rest_framework.decorators import (
+    api_view,
+    authentication_classes,
+    permission_classes,
+)
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from .authentication import TokenUserJWTAuthentication
+from .api_currency import SUPPORTED_CURRENCIES
+from .cache import cached_for_user, get_asset
+from .metrics import query_budget
+from .models import Asset, Wallet, WalletUser
+
+# Every breakdown is aggregated by the database in a single pass over the
+# wallets of the user. GROUPING() tells which grouping set a row belongs
+# to: one bit per grouped column, set when the column is NOT grouped.
+_BREAKDOWNS = ['category', 'asset', 'provider', 'role']
+
+_PORTFOLIO_SQL = """
+SELECT
+    GROUPING(a.category, w.asset_id, w.provider, wu.role) AS grouping_id,
+    a.category, w.asset_id, w.provider, wu.role,
+    COUNT(*) AS wallets,
+    SUM(w.balance) AS balance,
+    SUM(w.balance * a.exchange_rate) AS val_usd
+FROM "{wallet}" w
+JOIN "{wallet_user}" wu ON wu.wallet_id = w.id
+JOIN "{asset}" a ON a.id = w.asset_id
+WHERE wu.user_id = %s
+GROUP BY GROUPING SETS ((a.category), (w.asset_id), (w.provider), (wu.role), ())
+""".format(
+    wallet=Wallet._meta.db_table,
+    wallet_user=WalletUser._meta.db_table,
+    asset=Asset._meta.db_table,
+)
+
+# grouping_id of each breakdown (all the other columns rolled up)
+_GROUPING_IDS = {
+    breakdown: 0b1111 ^ (1 << (len(_BREAKDOWNS) - 1 - position))
+    for position, breakdown in enumerate(_BREAKDOWNS)
+}
+_TOTAL_GROUPING_ID = 0b1111
+
+
+def aggregate_portfolio(user_id) -> dict:
+    """
+    USD totals of the wallets shared with a user.
+    :return: {"total": {...}, "category": {key: {...}}, "asset": ..., "provider": ..., "role": ...}
+    where each {...} holds "wallets", "val_usd" and, per asset, "balance".
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(_PORTFOLIO_SQL, [user_id])
+        rows = cursor.fetchall()
+
+    portfolio = {breakdown: {} for breakdown in _BREAKDOWNS}
+    portfolio['total'] = {'wallets': 0, 'val_usd': Decimal(0)}
+    for grouping_id, *keys, wallets, balance, val_usd in rows:
+        if grouping_id == _TOTAL_GROUPING_ID:
+            # Also returned (with a NULL sum) when the user has no wallet
+            portfolio['total'] = {'wallets': wallets, 'val_usd': val_usd or Decimal(0)}
+            continue
+        for position, breakdown in enumerate(_BREAKDOWNS):
+            if grouping_id == _GROUPING_IDS[breakdown]:
+                group = {'wallets': wallets, 'val_usd': val_usd}
+                # Balances of different assets can't be added up
+                if breakdown == 'asset':
+                    group['balance'] = balance
+                portfolio[breakdown][keys[position]] = group
+    return portfolio
+
+
+def get_portfolio(user_id) -> dict:
+    # Invalidated by balance and wallet changes of the user (user namespace)
+    # and by exchange rate changes (asset namespace)
+    return cached_for_user(user_id, 'portfolio', lambda: aggregate_portfolio(user_id))
+
+
+def _converted(group, usd_rate):
+    values = {'wallets': group['wallets'], 'value': float(group['val_usd'] / usd_rate)}
+    if 'balance' in group:
+        values['balance'] = float(group['balance'])
+    return values
+
+
+@query_budget(2)
+@api_view(['GET'])
+@authentication_classes([TokenUserJWTAuthentication])
+@permission_classes([IsAuthenticated])
+def get_portfolio_summary(request):
+    # ?currency=eur (defaults to usd)
+    currency = request.query_params.get('currency', 'usd').lower()
+    if currency == 'usd':
+        usd_rate = Decimal(1)
+    else:
+        asset = get_asset(currency) if currency in SUPPORTED_CURRENCIES else None
+        if asset is None or not asset['exchange_rate']:
+            return Response(
+                {'detail': f'Unsupported currency: {currency}.'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        # Asset.exchange_rate is the value of one unit in USD
+        usd_rate = asset['exchange_rate']
+
+    portfolio = get_portfolio(request.user.id)
+    data = {
+        'currency': currency,
+        'total': _converted(portfolio['total'], usd_rate),
+    }
+    for breakdown in _BREAKDOWNS:
+        data[breakdown] = [
+            {'id': key, **_converted(group, usd_rate)}
+            for key, group in sorted(
+                portfolio[breakdown].items(), key=lambda item: -item[1]['val_usd']
+            )
+        ]
+    return Response(data)
@@ -0,0 +1,225 @@
+import hashlib
+import logging
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+import requests
+from django.core.cache import cache
+from requests.adapters import HTTPAdapter
+from core.metrics import record_provider_call
+
+logger = logging.getLogger(__name__)
+
+# (connect, read) timeouts in seconds
+DEFAULT_TIMEOUT = (3.05, 15)
+# Keep-alive connections kept per host, one per concurrent fetch
+POOL_SIZE = 8
+# Worth another attempt: throttled, or the provider is having trouble
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Documents kept to answer a 304 Not Modified
+CONDITIONAL_TTL = 60 * 60 * 24  # seconds
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def build_session(transport=None, pool_size=POOL_SIZE):
+    session = requests.Session()
+    adapter = transport or HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_session(url):
+    # One pooled session per scheme and host, shared by every client of the
+    # process so connections (and TLS sessions) are reused across runs
+    parts = urlsplit(url)
+    key = (parts.scheme, parts.netloc)
+    with _sessions_lock:
+        session = _sessions.get(key)
+        if session is None:
+            session = _sessions[key] = build_session()
+        return session
+
+
+class RateLimiter:
+    """
+    Token bucket: `rate` requests per second on average, in bursts of at
+    most `burst`. Shared by the threads of a process, a caller over the
+    limit waits for its turn.
+    """
+
+    def __init__(self, rate, burst=1, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self.sleep = sleep
+        self._tokens = burst
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            now = self.clock()
+            self._tokens = min(
+                self.burst, self._tokens + (now - self._updated) * self.rate
+            )
+            self._updated = now
+            # Taken right away, the next callers wait after this one
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+        if wait:
+            self.sleep(wait)
+
+
+class ProviderClient:
+    """
+    GET requests to one external provider over pooled keep-alive sessions,
+    with timeouts, retries after a jittered exponential backoff (or the
+    provider's Retry-After), an optional rate limit and, when `conditional`,
+    ETag / Last-Modified revalidation of JSON documents.
+    Latency, retries and errors of each call are recorded under the
+    provider name (see core.metrics).
+    :param transport: A requests adapter serving every request instead of
+    the network, for tests.
+    """
+
+    def __init__(
+        self,
+        name,
+        timeout=DEFAULT_TIMEOUT,
+        retries=2,
+        backoff=0.5,
+        max_backoff=10,
+        rate=None,
+        burst=1,
+        conditional=False,
+        transport=None,
+        sleep=time.sleep,
+    ):
+        self.name = name
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.rate_limiter = RateLimiter(rate, burst, sleep=sleep) if rate else None
+        self.conditional = conditional
+        self.sleep = sleep
+        self._session = build_session(transport) if transport else None
+
+    def session(self, url):
+        return self._session or get_session(url)
+
+    def retry_delay(self, attempt, response=None):
+        # Seconds before the next attempt (0 being the first retry)
+        retry_after = None
+        if response is not None:
+            retry_after = response.headers.get("Retry-After")
+        if retry_after:
+            try:
+                return min(self.max_backoff, max(0, float(retry_after)))
+            except ValueError:
+                try:
+                    delay = parsedate_to_datetime(retry_after).timestamp() - time.time()
+                    return min(self.max_backoff, max(0, delay))
+                except (TypeError, ValueError):
+                    pass
+        # "Full jitter", so clients failing together don't retry together
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2**attempt))
+
+    def get(self, url, params=None, headers=None) -> requests.Response:
+        """
+        The response of the last attempt, whatever its status.
+        :raise requests.exceptions.RequestException: When the last attempt
+        failed to connect or timed out.
+        """
+        start = time.perf_counter()
+        retries = 0
+        response = None
+        try:
+            while True:
+                if self.rate_limiter:
+                    self.rate_limiter.acquire()
+                response = None
+                try:
+                    response = self.session(url).get(
+                        url, params=params, headers=headers, timeout=self.timeout
+                    )
+                except (requests.ConnectionError, requests.Timeout):
+                    if retries == self.retries:
+                        raise
+                else:
+                    if (
+                        response.status_code not in RETRY_STATUSES
+                        or retries == self.retries
+                    ):
+                        return response
+                self.sleep(self.retry_delay(retries, response))
+                retries += 1
+        finally:
+            self.record(time.perf_counter() - start, retries, response)
+
+    def record(self, latency, retries, response):
+        try:
+            record_provider_call(
+                self.name,
+                latency,
+                retries,
+                error=response is None or response.status_code >= 400,
+                not_modified=response is not None and response.status_code == 304,
+            )
+        except Exception as e:
+            logger.warning(f"Could not record the metrics of {self.name}: {e}")
+
+    def _validators_key(self, url, params):
+        # Urls may carry api keys, only their hash is stored
+        request = requests.Request("GET", url, params=params).prepare()
+        digest = hashlib.sha256(request.url.encode()).hexdigest()
+        return f"provider_validators:{self.name}:{digest}"
+
+    def get_json(self, url, params=None, headers=None):
+        """
+        The decoded document, the stored one when the provider answers that
+        it didn't change since it was fetched.
+        :raise requests.exceptions.RequestException: Including HTTPError for
+        an error status.
+        :raise ValueError: For a body that isn't JSON.
+        """
+        headers = dict(headers or {})
+        stored = None
+        if self.conditional:
+            key = self._validators_key(url, params)
+            stored = cache.get(key)
+            if stored:
+                if stored["etag"]:
+                    headers["If-None-Match"] = stored["etag"]
+                if stored["last_modified"]:
+                    headers["If-Modified-Since"] = stored["last_modified"]
+
+        response = self.get(url, params=params, headers=headers)
+        if response.status_code == 304 and stored:
+            return stored["document"]
+        response.raise_for_status()
+        document = response.json()
+
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if self.conditional and (etag or last_modified):
+            cache.set(
+                key,
+                {"etag": etag, "last_modified": last_modified, "document": document},
+                CONDITIONAL_TTL,
+            )
+        return document
+
+
+# Each provider is called a few times per update, the limits guard against
+# bursts (all the index series at once) and loops
+CRYPTO_PRICES = ProviderClient("crypto_prices", rate=1, burst=2, conditional=True)
+EXCHANGE_RATES = ProviderClient("exchange_rates", rate=1, burst=2, conditional=True)
+# FRED allows 120 requests per minute
+FRED = ProviderClient("fred", rate=2, burst=8, conditional=True)
+ECOS = ProviderClient("ecos_bok_kr", rate=1, burst=2, conditional=True)
@@ -1,6 +1,8 @@
 from django.urls import path
 from .wsconsumer_ping import PingWSConsumer
+from .wsconsumer_live import LiveWSConsumer
 
 websocket_urlpatterns = [
     path("ws/com/ping/<int:user_id>/", PingWSConsumer.as_asgi()),
+    path("ws/com/live/", LiveWSConsumer.as_asgi()),
 ]
@@ -1,9 +1,10 @@
 from rest_framework import serializers
+from .metrics import TimedSerializerMixin
 from .models import KeiboUser, WalletUser, Wallet, Transaction, Asset
-from decimal import Decimal
+from decimal import Decimal, InvalidOperation
 
 
-class AssetSerializer(serializers.ModelSerializer):
+class AssetSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Asset
         fields = [
@@ -18,12 +19,14 @@ class BalanceField(serializers.Field):
         return float(value)
 
     def to_internal_value(self, data):
-        return Decimal(data)
+        try:
+            return Decimal(str(data))
+        except InvalidOperation:
+            raise serializers.ValidationError('A valid number is required.')
 
 
-class WalletSerializer(serializers.ModelSerializer):
+class WalletSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     balance = BalanceField()
-    input_amount = BalanceField()
 
     class Meta:
         model = Wallet
@@ -31,21 +34,40 @@ class WalletSerializer(serializers.ModelSerializer):
             'id',
             'name',
             'asset',
-            'input_asset',
             'provider',
             'balance',
-            'input_amount',
             'is_public',
         ]
 
     def get_balance(self, obj):
         return float(obj.balance)
 
-    def get_input_amount(self, obj):
-        return float(obj.input_amount)
 
+# Read-only listing of wallets coming from Wallet.objects.for_user().with_valuation()
+# Every field is a column or an annotation of that single query.
+class WalletListSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    asset = serializers.CharField(source='asset_id', read_only=True)
+    balance = BalanceField(read_only=True)
+    role = serializers.IntegerField(read_only=True)
+    category = serializers.CharField(read_only=True)
+    val_usd = serializers.FloatField(read_only=True)
 
-class WalletUserSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Wallet
+        fields = [
+            'id',
+            'name',
+            'asset',
+            'provider',
+            'balance',
+            'is_public',
+            'role',
+            'category',
+            'val_usd',
+        ]
+
+
+class WalletUserSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     granted_at = serializers.SerializerMethodField()
 
     class Meta:
@@ -56,7 +78,7 @@ class WalletUserSerializer(serializers.ModelSerializer):
         return int(obj.date.timestamp() * 1000)
 
 
-class KeiboUserSerializer(serializers.ModelSerializer):
+class KeiboUserSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = KeiboUser
         fields = [
@@ -71,30 +93,36 @@ class KeiboUserSerializer(serializers.ModelSerializer):
         ]
 
 
-class TransactionSerializer(serializers.ModelSerializer):
+class UserSearchResultSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    # Only what the invite dialog shows, for the rows of user_search
+    class Meta:
+        model = KeiboUser
+        fields = ['id', 'email', 'first_name', 'last_name', 'avatar']
+
+
+class TransactionSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     executed_at = serializers.SerializerMethodField()
     settled_at = serializers.SerializerMethodField()
-    amount = serializers.SerializerMethodField()
+    amount = BalanceField()
 
     class Meta:
         model = Transaction
         fields = [
             'id',
             'wallet',
+            'origin',
             'executed_at',
             'settled_at',
             'category',
-            'counterparty',
             'description',
             'amount',
-            'disposable',
+            'tags',
         ]
 
     def get_executed_at(self, obj):
         return int(obj.executed_at.timestamp() * 1000)
 
     def get_settled_at(self, obj):
+        if obj.settled_at is None:
+            return None
         return int(obj.settled_at.timestamp() * 1000)
-
-    def get_amount(self, obj):
-        return float(obj.amount)
@@ -0,0 +1,189 @@
+import json
+from collections import defaultdict
+from datetime import timezone
+from decimal import Decimal
+from django.db import connection
+from .cache import invalidate_wallet_users_on_commit
+from .models import Transaction, Wallet, WalletDailySnapshot
+
+_SNAPSHOT_TABLE = WalletDailySnapshot._meta.db_table
+_TRANSACTION_TABLE = Transaction._meta.db_table
+_WALLET_TABLE = Wallet._meta.db_table
+
+# Serializes the snapshot maintenance of a wallet: a day inserted by one
+# transaction must see the later days shifted by another. NO KEY UPDATE is
+# what the balance UPDATE takes too, and doesn't block inserts referencing
+# the wallet.
+_LOCK_WALLETS_SQL = f"""
+SELECT id FROM "{_WALLET_TABLE}" WHERE id = ANY(%s::uuid[])
+ORDER BY id FOR NO KEY UPDATE
+"""
+
+# Adds the changes of one day. A new row starts from the closing balance of
+# the previous snapshot. Category totals are summed key by key and the ones
+# cancelled out are dropped.
+_UPSERT_DAY_SQL = f"""
+INSERT INTO "{_SNAPSHOT_TABLE}" AS s
+    (wallet_id, date, closing_balance, inflow, outflow, category_totals)
+VALUES (
+    %(wallet)s, %(date)s,
+    COALESCE((
+        SELECT p.closing_balance FROM "{_SNAPSHOT_TABLE}" p
+        WHERE p.wallet_id = %(wallet)s AND p.date < %(date)s
+        ORDER BY p.date DESC LIMIT 1
+    ), 0) + %(net)s,
+    %(inflow)s, %(outflow)s, %(categories)s::jsonb
+)
+ON CONFLICT (wallet_id, date) DO UPDATE SET
+    closing_balance = s.closing_balance + %(net)s,
+    inflow = s.inflow + EXCLUDED.inflow,
+    outflow = s.outflow + EXCLUDED.outflow,
+    category_totals = COALESCE((
+        SELECT jsonb_object_agg(key, total) FROM (
+            SELECT key, SUM(value::numeric) AS total FROM (
+                SELECT * FROM jsonb_each_text(s.category_totals)
+                UNION ALL
+                SELECT * FROM jsonb_each_text(EXCLUDED.category_totals)
+            ) entries
+            GROUP BY key HAVING SUM(value::numeric) <> 0
+        ) totals
+    ), '{{}}'::jsonb)
+"""
+
+_SHIFT_LATER_DAYS_SQL = f"""
+UPDATE "{_SNAPSHOT_TABLE}" SET closing_balance = closing_balance + %(net)s
+WHERE wallet_id = %(wallet)s AND date > %(date)s
+"""
+
+# A day left without transactions by deletions is removed, like the
+# rebuild would do (later days already carry its closing balance)
+_DROP_EMPTY_DAY_SQL = f"""
+DELETE FROM "{_SNAPSHOT_TABLE}"
+WHERE wallet_id = %(wallet)s AND date = %(date)s
+AND inflow = 0 AND outflow = 0 AND category_totals = '{{}}'::jsonb
+"""
+
+_DELETE_SQL = f'DELETE FROM "{_SNAPSHOT_TABLE}" WHERE wallet_id = ANY(%s::uuid[])'
+
+# Recomputes every snapshot of the given wallets from their transactions
+_REBUILD_SQL = f"""
+INSERT INTO "{_SNAPSHOT_TABLE}"
+    (wallet_id, date, closing_balance, inflow, outflow, category_totals)
+SELECT
+    wallet_id, date,
+    SUM(net) OVER (PARTITION BY wallet_id ORDER BY date),
+    inflow, outflow, category_totals
+FROM (
+    SELECT
+        wallet_id, date, SUM(total) AS net, SUM(inflow) AS inflow,
+        SUM(outflow) AS outflow,
+        COALESCE(
+            jsonb_object_agg(category, total) FILTER (WHERE total <> 0),
+            '{{}}'::jsonb
+        ) AS category_totals
+    FROM (
+        SELECT
+            wallet_id, (executed_at AT TIME ZONE 'UTC')::date AS date, category,
+            SUM(amount) AS total,
+            SUM(GREATEST(amount, 0)) AS inflow,
+            SUM(GREATEST(-amount, 0)) AS outflow
+        FROM "{_TRANSACTION_TABLE}"
+        -- Zero amounts move nothing, like in record_transaction_changes
+        WHERE wallet_id = ANY(%s::uuid[]) AND amount <> 0
+        GROUP BY wallet_id, date, category
+    ) per_category
+    GROUP BY wallet_id, date
+) per_day
+"""
+
+_ALL_WALLETS_WITH_TRANSACTIONS_SQL = (
+    f'SELECT DISTINCT wallet_id FROM "{_TRANSACTION_TABLE}"'
+)
+
+
+def _json_numbers(totals: dict) -> str:
+    # JSON object of exact decimal numbers, like the ones built by Postgres
+    return '{%s}' % ', '.join(
+        f'{json.dumps(key)}: {value}' for key, value in totals.items() if value
+    )
+
+
+def snapshot_date(executed_at):
+    # Days are cut in UTC, like the rebuild query
+    return executed_at.astimezone(timezone.utc).date()
+
+
+def record_transaction_changes(added=(), removed=()):
+    """
+    Apply transaction writes to the snapshots, in the same database
+    transaction as the writes themselves. The cached entries derived from
+    the transactions of the users of the wallets are dropped on commit.
+    :param added: Created transactions (or their new state after an update).
+    :param removed: Deleted transactions (or their state before an update).
+    """
+    days = defaultdict(
+        lambda: {
+            'net': Decimal(0),
+            'inflow': Decimal(0),
+            'outflow': Decimal(0),
+            'categories': defaultdict(Decimal),
+        }
+    )
+    for sign, transactions in ((1, added), (-1, removed)):
+        for instance in transactions:
+            amount = sign * instance.amount
+            day = days[(str(instance.wallet_id), snapshot_date(instance.executed_at))]
+            day['net'] += amount
+            day['inflow'] += sign * max(instance.amount, 0)
+            day['outflow'] += sign * max(-instance.amount, 0)
+            day['categories'][instance.category] += amount
+
+    # An update that changes nothing the snapshots hold is a no-op
+    changes = [
+        (key, day)
+        for key, day in days.items()
+        if day['net']
+        or day['inflow']
+        or day['outflow']
+        or any(day['categories'].values())
+    ]
+    if not changes:
+        return
+    invalidate_wallet_users_on_commit({key[0] for key, _ in changes})
+    with connection.cursor() as cursor:
+        cursor.execute(_LOCK_WALLETS_SQL, [sorted({key[0] for key, _ in changes})])
+        for (wallet_id, date), day in sorted(changes):
+            params = {
+                'wallet': wallet_id,
+                'date': date,
+                'net': day['net'],
+                'inflow': day['inflow'],
+                'outflow': day['outflow'],
+                'categories': _json_numbers(day['categories']),
+            }
+            cursor.execute(_UPSERT_DAY_SQL, params)
+            if day['net']:
+                cursor.execute(_SHIFT_LATER_DAYS_SQL, params)
+            if day['inflow'] < 0 or day['outflow'] < 0:
+                cursor.execute(_DROP_EMPTY_DAY_SQL, params)
+
+
+def rebuild_wallet_snapshots(wallet_ids=None) -> int:
+    """
+    Recompute the snapshots of some wallets (of every wallet by default)
+    from their transactions, in one pass per call.
+    :return: The number of snapshot rows written.
+    """
+    with connection.cursor() as cursor:
+        if wallet_ids is None:
+            cursor.execute(_ALL_WALLETS_WITH_TRANSACTIONS_SQL)
+            wallet_ids = [row[0] for row in cursor.fetchall()]
+            cursor.execute(f'DELETE FROM "{_SNAPSHOT_TABLE}"')
+        wallet_ids = sorted(str(wallet_id) for wallet_id in wallet_ids)
+        if not wallet_ids:
+            return 0
+        invalidate_wallet_users_on_commit(wallet_ids)
+        cursor.execute(_LOCK_WALLETS_SQL, [wallet_ids])
+        cursor.execute(_DELETE_SQL, [wallet_ids])
+        cursor.execute(_REBUILD_SQL, [wallet_ids])
+        return cursor.rowcount
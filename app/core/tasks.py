@@ -1,8 +1,25 @@
-from celery import shared_task
+from celery import chord, shared_task
+from celery.exceptions import SoftTimeLimitExceeded
 from datetime import datetime
-from .api_crypto import get_crypto_prices
-from .api_currency import get_exchange_rates
-from .api_index import get_all_indexes
+from django.db import transaction
+from requests.exceptions import HTTPError, RequestException
+from .api_crypto import fetch_crypto_prices, get_crypto_prices, ingest_crypto_prices
+from .api_currency import (
+    fetch_exchange_rates,
+    get_exchange_rates,
+    ingest_exchange_rates,
+)
+from .api_index import (
+    INDEX_SERIES,
+    fetch_index_documents,
+    ingest_index_documents,
+    update_indexes,
+)
+from .lib.concurrent_fetch import describe_fetch_error
+from .lib.supabase.outbox import flush_all
+from .locks import Lease, record_run, single_flight
+from .providers import RETRY_STATUSES
+from .ticks import rollup_ticks
 import logging
 
 logger = logging.getLogger(__name__)
@@ -17,6 +34,28 @@ except SoftTimeLimitExceeded:
 
 """soft_time_limit=60, time_limit=70"""
 
+# update_all fans out one task per provider call, their documents are
+# written by a single callback once every fetch is done or gave up
+FETCH_SOFT_TIME_LIMIT = 60  # seconds
+FETCH_TIME_LIMIT = 70  # seconds
+FETCH_MAX_RETRIES = 2
+FETCH_RETRY_DELAY = 5  # seconds, doubled on each retry
+# Lease of a run of update_all, released by its callback or running out
+# when the run failed
+UPDATE_ALL_LEASE_TTL = 60 * 5  # seconds
+
+CRYPTO = 'crypto'
+EXCHANGE_RATES = 'exchange_rates'
+# Held by the standalone update of indexes, per series so it can run
+# alongside update_all, each leaving the series of the other alone
+INDEX_LEASE_TTL = 60 * 5  # seconds
+
+
+def _fetch_lease_name(name):
+    # Shared by the fetches of update_all and the standalone updates, so a
+    # provider document is never fetched by both at once
+    return f'fetch:{name}'
+
 
 @shared_task()
 def print_current_time():
@@ -25,22 +64,175 @@ def print_current_time():
 
 
 @shared_task()
+@single_flight(_fetch_lease_name(EXCHANGE_RATES))
 def update_exchange_rate():
     get_exchange_rates()
 
 
 @shared_task()
+@single_flight(_fetch_lease_name(CRYPTO))
 def update_crypto_prices():
     get_crypto_prices()
 
 
 @shared_task()
+@single_flight()
 def update_all_indexes():
-    get_all_indexes()
+    leases = {
+        item: Lease(_fetch_lease_name(item[0]), INDEX_LEASE_TTL)
+        for item in INDEX_SERIES
+    }
+    acquired = [item for item, lease in leases.items() if lease.acquire()]
+    if len(acquired) < len(INDEX_SERIES):
+        logger.info(
+            f"{len(INDEX_SERIES) - len(acquired)} economic indexes skipped, "
+            f"they are being fetched"
+        )
+    if not acquired:
+        return
+    try:
+        update_indexes(acquired)
+    finally:
+        for item in acquired:
+            leases[item].release()
+
+
+@shared_task()
+@single_flight()
+def rollup_asset_ticks():
+    # Meant to run every minute, see core.ticks
+    rolled = rollup_ticks()
+    if rolled:
+        logger.info(f"Rolled up {rolled} price ticks into candles")
+
+
+@shared_task()
+def refresh_indexes(series):
+    # Series whose cached response went stale (see api_index.update_indexes)
+    update_indexes(series, refresh=True)
+
+
+def _retryable(error):
+    # The provider client already retried, only transient failures get
+    # another chance later
+    if isinstance(error, HTTPError):
+        return (
+            error.response is not None and error.response.status_code in RETRY_STATUSES
+        )
+    return isinstance(error, RequestException)
+
+
+def _fetch(task, name, fetch):
+    """
+    :return: (name, document), with None in place of a document that couldn't
+    be fetched or is already being fetched.
+    """
+    # Outlives the task at most until its hard time limit
+    lease = Lease(_fetch_lease_name(name), FETCH_TIME_LIMIT)
+    if not lease.acquire():
+        logger.info(f"Fetch of {name} skipped, another one is running")
+        return name, None
+    try:
+        return name, fetch()
+    except (RequestException, ValueError) as e:
+        error = e
+    except SoftTimeLimitExceeded:
+        logger.info(f"Fetch of {name} timed out")
+        return name, None
+    finally:
+        lease.release()
+
+    if _retryable(error) and task.request.retries < task.max_retries:
+        raise task.retry(
+            exc=error, countdown=FETCH_RETRY_DELAY * 2**task.request.retries
+        )
+    logger.info(f"Fetch of {name} failed with {describe_fetch_error(error)}")
+    return name, None
+
+
+@shared_task(
+    bind=True,
+    max_retries=FETCH_MAX_RETRIES,
+    soft_time_limit=FETCH_SOFT_TIME_LIMIT,
+    time_limit=FETCH_TIME_LIMIT,
+)
+def fetch_crypto_prices_document(self):
+    return _fetch(self, CRYPTO, fetch_crypto_prices)
+
+
+@shared_task(
+    bind=True,
+    max_retries=FETCH_MAX_RETRIES,
+    soft_time_limit=FETCH_SOFT_TIME_LIMIT,
+    time_limit=FETCH_TIME_LIMIT,
+)
+def fetch_exchange_rates_document(self):
+    return _fetch(self, EXCHANGE_RATES, fetch_exchange_rates)
+
+
+@shared_task(
+    bind=True,
+    max_retries=FETCH_MAX_RETRIES,
+    soft_time_limit=FETCH_SOFT_TIME_LIMIT,
+    time_limit=FETCH_TIME_LIMIT,
+)
+def fetch_index_document(self, item):
+    # Through the cached responses of api_index
+    seriesid = item[0]
+
+    def fetch():
+        document = fetch_index_documents([item])[seriesid]
+        if isinstance(document, Exception):
+            raise document
+        return document
+
+    return _fetch(self, seriesid, fetch)
+
+
+@shared_task()
+def ingest_all(results, debug=False, lease_token=None):
+    """
+    Writes the documents fetched by update_all in one transaction: the
+    shared caches are refreshed and the Supabase mirror flushed once it
+    commits.
+    :param results: (name, document) of every fetch.
+    :param lease_token: Of the lease taken by update_all.
+    """
+    try:
+        documents = dict(results)
+        with transaction.atomic():
+            if documents.get(CRYPTO) is not None:
+                ingest_crypto_prices(documents[CRYPTO], debug)
+            if documents.get(EXCHANGE_RATES) is not None:
+                ingest_exchange_rates(documents[EXCHANGE_RATES], debug)
+            ingest_index_documents(INDEX_SERIES, documents, debug)
+    finally:
+        # Ran out: a later update_all may have run alongside
+        if lease_token and not Lease('update_all', token=lease_token).release():
+            record_run('update_all', overlapped=True)
+
+
+@shared_task()
+def update_all(debug=False):
+    # Lasts as long as the slowest fetch, given enough workers
+    lease = Lease('update_all', UPDATE_ALL_LEASE_TTL)
+    if not lease.acquire():
+        logger.info("update_all skipped, the previous run isn't done")
+        record_run('update_all', skipped=True)
+        return
+    try:
+        chord(
+            [fetch_crypto_prices_document.s(), fetch_exchange_rates_document.s()]
+            + [fetch_index_document.s(item) for item in INDEX_SERIES]
+        )(ingest_all.s(debug=debug, lease_token=lease.token))
+    except Exception:
+        lease.release()
+        raise
 
 
 @shared_task()
-def update_all():
-    get_crypto_prices(True)
-    get_exchange_rates(True)
-    get_all_indexes(True)
+@single_flight()
+def flush_supabase_mirror():
+    sent, failed = flush_all()
+    if sent or failed:
+        logger.info(f"Supabase mirror: sent {sent} rows, {failed} rows rescheduled")
@@ -0,0 +1,53 @@
+from datetime import timedelta
+from decimal import Decimal
+from django.core.cache import cache
+from django.test import TestCase
+from django.utils import timezone
+from core.analytics import get_spending_analytics
+from core.cache import ASSETS, invalidate
+from core.models import Asset, KeiboUser, Transaction, Wallet, WalletUser
+from core.snapshots import record_transaction_changes
+
+
+class SpendingAnalyticsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        # And the copies of the assets kept by this process
+        invalidate(ASSETS)
+        self.user = KeiboUser.objects.create_user(
+            'owner@example.com', 'password', first_name='Owner'
+        )
+        self.asset = Asset.objects.create(id='eur', exchange_rate=Decimal('2'))
+        self.wallet = Wallet.objects.create(asset=self.asset, balance=Decimal('0'))
+        WalletUser.objects.create(user=self.user, wallet=self.wallet, role=4)
+        self.add_transaction(Decimal('-10'))
+
+    def add_transaction(self, amount):
+        with self.captureOnCommitCallbacks(execute=True):
+            instance = Transaction.objects.create(
+                wallet=self.wallet,
+                executed_at=timezone.now() - timedelta(minutes=1),
+                category='food',
+                amount=amount,
+            )
+            # As the transaction endpoints do
+            record_transaction_changes(added=[instance])
+
+    def current_month_total(self):
+        return sum(get_spending_analytics(self.user.id)['monthly'][-1])
+
+    def test_rate_changes_do_not_reload_the_transactions(self):
+        self.assertEqual(self.current_month_total(), 20)
+
+        Asset.objects.filter(id='eur').update(exchange_rate=Decimal('3'))
+        invalidate(ASSETS)
+        # Only the assets are read again
+        with self.assertNumQueries(1):
+            self.assertEqual(self.current_month_total(), 30)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.current_month_total(), 30)
+
+    def test_transaction_changes_reload_the_transactions(self):
+        self.assertEqual(self.current_month_total(), 20)
+        self.add_transaction(Decimal('-5'))
+        self.assertEqual(self.current_month_total(), 30)
@@ -0,0 +1,166 @@
+import threading
+import time
+from datetime import date
+from decimal import Decimal
+from unittest import mock
+import requests
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from core import api_index
+from core.benchmark import provider_stub
+from core.lib.concurrent_fetch import fetch_json_concurrently
+from core.models import EconomicIndex, EconomicIndexObservation
+
+
+class SlowClient:
+    # Answers after a delay, keeping track of the requests in flight
+    def __init__(self, delay=0.05):
+        self.delay = delay
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+    def get_json(self, url):
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            time.sleep(self.delay)
+            if 'fail' in url:
+                raise requests.ConnectionError('unreachable')
+            return {'url': url}
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+
+class FetchJsonConcurrentlyTests(TestCase):
+    def test_requests_run_in_parallel(self):
+        client = SlowClient()
+        documents = fetch_json_concurrently(
+            {i: (client, f'https://provider.test/{i}') for i in range(8)},
+            max_workers=4,
+        )
+        self.assertEqual(documents[3], {'url': 'https://provider.test/3'})
+        self.assertEqual(client.max_in_flight, 4)
+
+    def test_a_failure_is_returned_in_place_of_its_document(self):
+        client = SlowClient(delay=0)
+        documents = fetch_json_concurrently(
+            {
+                'ok': (client, 'https://provider.test/ok'),
+                'ko': (client, 'https://provider.test/fail'),
+            }
+        )
+        self.assertEqual(documents['ok'], {'url': 'https://provider.test/ok'})
+        self.assertIsInstance(documents['ko'], requests.ConnectionError)
+
+
+class UpdateIndexesTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_every_series_is_stored(self):
+        with provider_stub():
+            api_index.update_indexes(api_index.INDEX_SERIES, refresh=True)
+
+        series = [seriesid for seriesid, _, _ in api_index.INDEX_SERIES]
+        self.assertEqual(
+            set(EconomicIndex.objects.values_list('id', flat=True)), set(series)
+        )
+        self.assertEqual(
+            set(EconomicIndexObservation.objects.values_list('series', flat=True)),
+            set(series),
+        )
+
+    def test_a_failing_provider_does_not_affect_the_others(self):
+        with provider_stub() as base, mock.patch.object(
+            api_index, 'API_ECOS_URL', f'{base}/missing'
+        ):
+            api_index.update_indexes(api_index.INDEX_SERIES, refresh=True)
+
+        stored = set(EconomicIndex.objects.values_list('id', flat=True))
+        self.assertNotIn(api_index.BOK_BASE_RATE, stored)
+        self.assertEqual(len(stored), len(api_index.INDEX_SERIES) - 1)
+
+    def test_query_count_does_not_grow_with_series(self):
+        def count_queries(series):
+            with provider_stub(), CaptureQueriesContext(connection) as queries:
+                api_index.update_indexes(series, refresh=True)
+            return len(queries)
+
+        one = count_queries(api_index.INDEX_SERIES[:1])
+        EconomicIndex.objects.all().delete()
+        EconomicIndexObservation.objects.all().delete()
+        self.assertEqual(count_queries(api_index.INDEX_SERIES), one)
+
+
+class CountingClient:
+    def __init__(self):
+        self.urls = []
+
+    def get_json(self, url):
+        self.urls.append(url)
+        return {'call': len(self.urls)}
+
+
+class IndexResponseCacheTests(TestCase):
+    series = (api_index.FED_FUNDS_RATE_ID, api_index.STLOUISFED, 'monthly')
+
+    def setUp(self):
+        cache.clear()
+        self.provider = CountingClient()
+
+    def fetch(self):
+        return api_index.fetch_index_documents(
+            [self.series], clients={api_index.STLOUISFED: self.provider}
+        )[self.series[0]]
+
+    def key(self, last_date=None):
+        return api_index.index_response_key(self.series[0], 'monthly', last_date)
+
+    def age_entry(self, seconds):
+        entry = cache.get(self.key())
+        entry['fetched_at'] -= seconds
+        cache.set(self.key(), entry)
+
+    def test_fresh_hit_does_not_call_the_provider(self):
+        self.assertEqual(self.fetch(), {'call': 1})
+        with mock.patch('core.tasks.refresh_indexes.delay') as delay:
+            self.assertEqual(self.fetch(), {'call': 1})
+        self.assertEqual(len(self.provider.urls), 1)
+        delay.assert_not_called()
+
+    def test_stale_hit_is_served_and_refreshed_once(self):
+        self.fetch()
+        fresh, _ = api_index.INDEX_RESPONSE_TTLS['monthly']
+        self.age_entry(fresh + 1)
+
+        with mock.patch('core.tasks.refresh_indexes.delay') as delay:
+            self.assertEqual(self.fetch(), {'call': 1})
+            # The refresh lock is held until the task runs
+            self.assertEqual(self.fetch(), {'call': 1})
+        self.assertEqual(len(self.provider.urls), 1)
+        delay.assert_called_once_with([self.series])
+
+    def test_expired_entry_is_fetched_synchronously(self):
+        self.fetch()
+        # As if its time to live had run out
+        cache.delete(self.key())
+
+        with mock.patch('core.tasks.refresh_indexes.delay') as delay:
+            self.assertEqual(self.fetch(), {'call': 2})
+        delay.assert_not_called()
+
+    def test_key_moves_with_the_last_observation(self):
+        self.fetch()
+        EconomicIndexObservation.objects.create(
+            series=self.series[0], date=date(2024, 1, 1), value=Decimal('5.33')
+        )
+
+        # Another window, another entry
+        self.assertEqual(self.fetch(), {'call': 2})
+        self.assertIn('observation_start=2024-01-02', self.provider.urls[1])
+        self.assertIsNotNone(cache.get(self.key(date(2024, 1, 1))))
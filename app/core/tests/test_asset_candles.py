@@ -0,0 +1,61 @@
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal
+from django.core.cache import cache
+from django.urls import reverse
+from rest_framework.test import APITestCase
+from core.market_api import parse_moment
+from core.models import Asset, AssetCandle, CandleResolution, KeiboUser
+
+
+class AssetCandlesTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = KeiboUser.objects.create_user(
+            'user@example.com', 'password', first_name='User'
+        )
+        self.asset = Asset.objects.create(id='btc', exchange_rate=Decimal('50000'))
+        for day in (1, 2, 3):
+            AssetCandle.objects.create(
+                asset=self.asset,
+                resolution=CandleResolution.DAY,
+                start=datetime(2024, 1, day, tzinfo=dt_timezone.utc),
+                open=Decimal(day),
+                high=Decimal(day),
+                low=Decimal(day),
+                close=Decimal(day),
+                ticks=1,
+            )
+        self.client.force_authenticate(self.user)
+        self.url = reverse('get_asset_candles', args=['btc'])
+
+    def get_starts(self, **params):
+        response = self.client.get(self.url, {'resolution': '1d', **params})
+        self.assertEqual(response.status_code, 200)
+        return [candle['start'][:10] for candle in response.data]
+
+    def test_naive_moments_are_utc(self):
+        self.assertEqual(
+            parse_moment('2024-01-02T12:00'),
+            datetime(2024, 1, 2, 12, tzinfo=dt_timezone.utc),
+        )
+        # The end of a range of dates is the start of the next day
+        self.assertEqual(
+            parse_moment('2024-01-02', end=True),
+            datetime(2024, 1, 3, tzinfo=dt_timezone.utc),
+        )
+
+    def test_range_is_inclusive(self):
+        self.assertEqual(
+            self.get_starts(**{'from': '2024-01-02', 'to': '2024-01-03'}),
+            ['2024-01-02', '2024-01-03'],
+        )
+        self.assertEqual(
+            self.get_starts(to='2024-01-02T00:00:00+00:00'),
+            ['2024-01-01', '2024-01-02'],
+        )
+
+    def test_invalid_moments_are_rejected(self):
+        for value in ('9999-12-31', 'tomorrow', '2024-13-01'):
+            with self.subTest(value=value):
+                response = self.client.get(self.url, {'to': value})
+                self.assertEqual(response.status_code, 400)
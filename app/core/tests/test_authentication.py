@@ -0,0 +1,88 @@
+from unittest import mock
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework.test import APIRequestFactory
+from rest_framework_simplejwt.tokens import AccessToken
+from core.authentication import (
+    CustomJWTAuthentication,
+    _user_namespace,
+    _users,
+    get_user_fields,
+)
+from core.cache import cached_shared
+from core.models import KeiboUser
+
+
+class CachedUserTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        _users.clear()
+        self.user = KeiboUser.objects.create_user(
+            'user@example.com', 'password', first_name='User'
+        )
+        self.token = AccessToken.for_user(self.user)
+
+    def authenticate(self, token):
+        request = APIRequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        return CustomJWTAuthentication().authenticate(request)
+
+    def test_password_is_not_cached(self):
+        self.assertNotIn('password', get_user_fields(self.user.id))
+
+        user, _ = self.authenticate(self.token)
+        self.assertEqual(user.id, self.user.id)
+        # Loaded from the database when needed
+        self.assertTrue(user.check_password('password'))
+
+    def test_saving_the_cached_user_keeps_the_password(self):
+        user, _ = self.authenticate(self.token)
+        user.first_name = 'Renamed'
+        user.save()
+
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.first_name, 'Renamed')
+        self.assertTrue(self.user.check_password('password'))
+
+    def test_invalid_token_is_unauthenticated(self):
+        self.assertIsNone(self.authenticate('not-a-token'))
+
+    def test_cache_outage_falls_back_to_the_database(self):
+        with mock.patch('core.cache.cache') as broken_cache:
+            broken_cache.get.side_effect = ConnectionError('Redis is down')
+            user, _ = self.authenticate(self.token)
+        self.assertEqual(user.id, self.user.id)
+
+    def test_refill_racing_a_change_is_not_served(self):
+        def load_then_change():
+            stale = KeiboUser.objects.filter(pk=self.user.id).values().first()
+            # Committed while the lookup is in flight
+            with self.captureOnCommitCallbacks(execute=True):
+                self.user.is_active = False
+                self.user.save()
+            return stale
+
+        cached_shared(_user_namespace(self.user.id), 'fields', load_then_change)
+
+        self.assertFalse(get_user_fields(self.user.id)['is_active'])
+        self.assertIsNone(self.authenticate(self.token))
+
+    def test_queryset_writes_drop_the_cached_user(self):
+        def get_status():
+            return self.client.get(
+                reverse('get_assets'), HTTP_AUTHORIZATION=f'Bearer {self.token}'
+            ).status_code
+
+        self.assertEqual(get_status(), 200)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            KeiboUser.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertEqual(get_status(), 401)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            KeiboUser.objects.filter(pk=self.user.pk).update(is_active=True)
+        self.assertEqual(get_status(), 200)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            KeiboUser.objects.filter(pk=self.user.pk).delete()
+        self.assertEqual(get_status(), 401)
@@ -0,0 +1,97 @@
+import io
+import uuid
+from decimal import Decimal
+from django.test import SimpleTestCase
+from core.lib.columnar import (
+    DECIMAL,
+    DICT_STRING,
+    INT64,
+    STRING,
+    STRING_LIST,
+    UUID,
+    ColumnarWriter,
+    read_columnar,
+)
+
+COLUMNS = [
+    ('id', UUID),
+    ('origin', UUID),
+    ('executed_at', INT64),
+    ('settled_at', INT64),
+    ('category', DICT_STRING),
+    ('description', STRING),
+    ('amount', DECIMAL, 8),
+    ('tags', STRING_LIST),
+]
+
+
+def write(blocks, columns=COLUMNS):
+    writer = ColumnarWriter(columns)
+    return writer.header() + b''.join(map(writer.block, blocks)) + writer.footer()
+
+
+def read(data):
+    return list(read_columnar(io.BytesIO(data)))
+
+
+class ColumnarRoundTripTests(SimpleTestCase):
+    def row(self, **values):
+        row = {
+            'id': uuid.uuid4(),
+            'origin': None,
+            'executed_at': 1704067200000,
+            'settled_at': None,
+            'category': 'food',
+            'description': '',
+            'amount': Decimal('-12.5'),
+            'tags': [],
+        }
+        row.update(values)
+        return row
+
+    def round_trip(self, *blocks):
+        decoded = read(
+            write([[tuple(row.values()) for row in block] for block in blocks])
+        )
+        self.assertEqual(decoded, [row for block in blocks for row in block])
+
+    def test_rows_with_nulls(self):
+        self.round_trip(
+            [
+                self.row(),
+                self.row(
+                    origin=uuid.uuid4(),
+                    settled_at=-1,
+                    category='rent',
+                    description='Café ☕',
+                    amount=Decimal('0.00000001'),
+                    tags=['home', 'monthly'],
+                ),
+                self.row(category='food', tags=['']),
+            ]
+        )
+
+    def test_several_blocks(self):
+        self.round_trip(
+            [self.row(category=f'category {i}') for i in range(3)],
+            [self.row(amount=Decimal(i)) for i in range(5)],
+        )
+
+    def test_decimal_fallback_to_strings(self):
+        # Unscaled, 10^20 * 10^8 doesn't fit an int64
+        rows = [self.row(amount=Decimal('1e20')), self.row(amount=Decimal('-1.5'))]
+        self.round_trip(rows)
+
+        data = write([[tuple(row.values()) for row in rows]])
+        self.assertIn(b'1E+20', data)
+
+    def test_empty_export(self):
+        data = write([[]])
+        self.assertEqual(read(data), [])
+
+    def test_invalid_streams(self):
+        with self.assertRaises(ValueError):
+            read(b'CSV,')
+        with self.assertRaises(ValueError):
+            # Cut in the middle of a block
+            read(write([[tuple(self.row().values())]])[:-10])
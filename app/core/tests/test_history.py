@@ -0,0 +1,67 @@
+from datetime import date
+from decimal import Decimal
+from django.test import TestCase
+from core.history import compute_index_rows, store_index_observations
+from core.models import EconomicIndexObservation
+
+
+class StoreIndexObservationsTests(TestCase):
+    def test_revised_observations_replace_the_stored_ones(self):
+        store_index_observations(
+            {
+                'FEDFUNDS': [
+                    (date(2024, 1, 1), Decimal('5.33')),
+                    (date(2024, 2, 1), Decimal('5.30')),
+                ]
+            }
+        )
+        moved = store_index_observations(
+            {
+                'FEDFUNDS': [
+                    (date(2024, 2, 1), Decimal('5.31')),
+                    (date(2024, 3, 1), Decimal('5.25')),
+                ]
+            }
+        )
+
+        self.assertEqual(moved, {'FEDFUNDS'})
+        self.assertEqual(
+            list(
+                EconomicIndexObservation.objects.order_by('date').values_list(
+                    'date', 'value'
+                )
+            ),
+            [
+                (date(2024, 1, 1), Decimal('5.33')),
+                (date(2024, 2, 1), Decimal('5.31')),
+                (date(2024, 3, 1), Decimal('5.25')),
+            ],
+        )
+
+    def test_duplicates_in_one_batch_keep_the_last_value(self):
+        store_index_observations(
+            {
+                'ECBDFR': [
+                    (date(2024, 1, 1), Decimal('4.00')),
+                    (date(2024, 1, 1), Decimal('3.75')),
+                ]
+            }
+        )
+        self.assertEqual(
+            EconomicIndexObservation.objects.get(series='ECBDFR').value,
+            Decimal('3.75'),
+        )
+
+    def test_deltas_are_computed_from_the_history(self):
+        store_index_observations(
+            {
+                'FPCPITOTLZGUSA': [
+                    (date(2022, 1, 1), Decimal('8.00')),
+                    (date(2023, 1, 1), Decimal('4.10')),
+                ]
+            }
+        )
+        [row] = compute_index_rows({'FPCPITOTLZGUSA': 'annual'})
+        self.assertEqual(row['value'], Decimal('4.10'))
+        self.assertEqual(row['yearly_delta'], Decimal('-3.90'))
+        self.assertNotIn('decennial_delta', row)
@@ -0,0 +1,107 @@
+from decimal import Decimal
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.testing import WebsocketCommunicator
+from django.core.cache import cache
+from django.db import transaction
+from django.test import TransactionTestCase, override_settings
+from rest_framework_simplejwt.tokens import AccessToken
+from core.balance import apply_balance_delta
+from core.models import Asset, KeiboUser, Wallet, WalletUser
+from keibo.asgi import application
+
+
+@override_settings(
+    CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}
+)
+class LiveWSConsumerTests(TransactionTestCase):
+    # The consumer reads the database from another thread, and pushes are
+    # sent on commit, so writes must really be committed
+
+    def setUp(self):
+        cache.clear()
+        self.user = KeiboUser.objects.create_user(
+            'owner@example.com', 'password', first_name='Owner'
+        )
+        other = KeiboUser.objects.create_user(
+            'other@example.com', 'password', first_name='Other'
+        )
+        asset = Asset.objects.create(id='usd', exchange_rate=Decimal('1'))
+        self.wallet = Wallet.objects.create(asset=asset, balance=Decimal('10'))
+        WalletUser.objects.create(user=self.user, wallet=self.wallet, role=1)
+        self.other_wallet = Wallet.objects.create(asset=asset, balance=Decimal('0'))
+        WalletUser.objects.create(user=other, wallet=self.other_wallet, role=1)
+
+    def communicator(self, token=None):
+        headers = []
+        if token is not None:
+            headers.append((b'authorization', f'Bearer {token}'.encode()))
+        return WebsocketCommunicator(application, '/ws/com/live/', headers=headers)
+
+    async def connect(self):
+        communicator = self.communicator(AccessToken.for_user(self.user))
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        self.assertEqual(
+            await communicator.receive_json_from(), {'kind': 'subscribed', 'groups': 2}
+        )
+        return communicator
+
+    async def test_connection_without_a_valid_token_is_refused(self):
+        for token in (None, 'not-a-jwt', f'{AccessToken.for_user(self.user)}x'):
+            with self.subTest(token=token):
+                connected, _ = await self.communicator(token).connect()
+                self.assertFalse(connected)
+
+    async def test_wallets_of_other_users_are_not_pushed(self):
+        communicator = await self.connect()
+
+        await database_sync_to_async(apply_balance_delta)(
+            self.other_wallet.id, Decimal('5')
+        )
+        self.assertTrue(await communicator.receive_nothing())
+
+        # Joining the wallet and resyncing subscribes to it
+        await database_sync_to_async(WalletUser.objects.create)(
+            user=self.user, wallet=self.other_wallet, role=1
+        )
+        await communicator.send_json_to({'action': 'resync'})
+        self.assertEqual(
+            await communicator.receive_json_from(), {'kind': 'subscribed', 'groups': 3}
+        )
+        await database_sync_to_async(apply_balance_delta)(
+            self.other_wallet.id, Decimal('5')
+        )
+        self.assertEqual(
+            await communicator.receive_json_from(),
+            {'kind': 'wallet', 'id': str(self.other_wallet.id), 'balance': 10.0},
+        )
+        await communicator.disconnect()
+
+    async def test_balance_is_pushed_once_committed(self):
+        communicator = await self.connect()
+
+        def write():
+            with transaction.atomic():
+                apply_balance_delta(self.wallet.id, Decimal('2.5'))
+                # Nothing sent while the transaction is open
+                self.assertTrue(async_to_sync(communicator.receive_nothing)())
+
+        await database_sync_to_async(write)()
+        self.assertEqual(
+            await communicator.receive_json_from(),
+            {'kind': 'wallet', 'id': str(self.wallet.id), 'balance': 12.5},
+        )
+        await communicator.disconnect()
+
+    async def test_rolled_back_balance_is_not_pushed(self):
+        communicator = await self.connect()
+
+        def write():
+            with transaction.atomic():
+                apply_balance_delta(self.wallet.id, Decimal('2.5'))
+                transaction.set_rollback(True)
+
+        await database_sync_to_async(write)()
+        self.assertTrue(await communicator.receive_nothing())
+        await communicator.disconnect()
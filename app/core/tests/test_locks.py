@@ -0,0 +1,142 @@
+import time
+from unittest import mock
+from django.test import SimpleTestCase, TestCase
+from django_redis import get_redis_connection
+from core.locks import Lease, single_flight
+from core.metrics import get_task_metrics
+from core.tasks import (
+    INDEX_SERIES,
+    _fetch,
+    ingest_all,
+    update_all,
+    update_all_indexes,
+    update_crypto_prices,
+)
+
+
+class LeaseTests(SimpleTestCase):
+    def setUp(self):
+        self.redis = get_redis_connection('default')
+        self.redis.flushdb()
+
+    def test_acquire_is_exclusive(self):
+        lease = Lease('job')
+        self.assertTrue(lease.acquire())
+        self.assertFalse(Lease('job').acquire())
+
+        self.assertTrue(lease.release())
+        self.assertTrue(Lease('job').acquire())
+
+    def test_renew_extends_the_lease(self):
+        lease = Lease('job', ttl=10)
+        lease.acquire()
+        self.redis.pexpire(lease.key, 100)
+
+        self.assertTrue(lease.renew())
+        self.assertGreater(self.redis.pttl(lease.key), 9000)
+        self.assertFalse(lease.lost)
+
+    def test_only_the_holder_renews_or_releases(self):
+        lease = Lease('job')
+        lease.acquire()
+        other = Lease('job')
+
+        self.assertFalse(other.renew())
+        self.assertFalse(other.release())
+        self.assertTrue(other.lost)
+        self.assertEqual(self.redis.get(lease.key).decode(), lease.token)
+
+    def test_release_with_the_token_of_another_process(self):
+        lease = Lease('job')
+        lease.acquire()
+
+        self.assertTrue(Lease('job', token=lease.token).release())
+        self.assertIsNone(self.redis.get(lease.key))
+
+    def test_lease_that_ran_out_is_lost(self):
+        lease = Lease('job')
+        lease.acquire()
+        # Expired, then taken by another run
+        self.redis.delete(lease.key)
+        Lease('job').acquire()
+
+        self.assertFalse(lease.renew())
+        self.assertFalse(lease.release())
+        self.assertTrue(lease.lost)
+
+    def test_held_lease_is_renewed_in_the_background(self):
+        lease = Lease('job', ttl=0.3)
+        lease.acquire()
+        with lease:
+            time.sleep(0.6)
+            self.assertEqual(self.redis.get(lease.key).decode(), lease.token)
+        self.assertIsNone(self.redis.get(lease.key))
+        self.assertFalse(lease.lost)
+
+
+class SingleFlightTests(SimpleTestCase):
+    def setUp(self):
+        get_redis_connection('default').flushdb()
+
+    def test_run_during_another_is_skipped(self):
+        runs = []
+
+        @single_flight('job')
+        def job():
+            runs.append(Lease('job').acquire())
+            return 'done'
+
+        self.assertEqual(job(), 'done')
+        self.assertEqual(runs, [False])
+        held = Lease('job')
+        held.acquire()
+        self.assertIsNone(job())
+
+        metrics = get_task_metrics()[0]
+        self.assertEqual((metrics['runs'], metrics['skipped']), (1, 1))
+
+    def test_update_and_fetch_share_the_provider_lease(self):
+        fetch = mock.Mock(return_value={'bitcoin': {'usd': 1}})
+        held = Lease('fetch:crypto')
+        held.acquire()
+
+        with mock.patch('core.tasks.get_crypto_prices') as get_crypto_prices:
+            update_crypto_prices()
+        get_crypto_prices.assert_not_called()
+        self.assertEqual(_fetch(mock.Mock(), 'crypto', fetch), ('crypto', None))
+        fetch.assert_not_called()
+
+    def test_index_update_leaves_the_series_being_fetched(self):
+        held = Lease(f'fetch:{INDEX_SERIES[0][0]}')
+        held.acquire()
+
+        with mock.patch('core.tasks.update_indexes') as update_indexes:
+            update_all_indexes()
+        update_indexes.assert_called_once_with(INDEX_SERIES[1:])
+        # Released once done
+        self.assertTrue(Lease(f'fetch:{INDEX_SERIES[1][0]}').acquire())
+
+
+class IngestAllTests(TestCase):
+    def setUp(self):
+        get_redis_connection('default').flushdb()
+
+    def test_lease_lost_is_recorded(self):
+        ingest_all([], lease_token='expired')
+
+        self.assertEqual(get_task_metrics()[0]['overlapped'], 1)
+
+    def test_failing_metrics_do_not_fail_the_ingestion(self):
+        with mock.patch(
+            'core.locks.record_task_run', side_effect=ConnectionError('Redis is down')
+        ):
+            ingest_all([], lease_token='expired')
+
+    def test_update_all_passes_debug_to_the_ingestion(self):
+        for debug in (False, True):
+            get_redis_connection('default').flushdb()
+            with mock.patch('core.tasks.chord') as chord:
+                update_all(debug=debug)
+            callback = chord.return_value.call_args.args[0]
+            self.assertEqual(callback.kwargs['debug'], debug)
+            self.assertIsNotNone(callback.kwargs['lease_token'])
@@ -0,0 +1,98 @@
+from decimal import Decimal
+from django.core.cache import cache
+from django.urls import reverse
+from rest_framework.test import APITestCase
+from core.cache import cached_shared
+from core.models import Asset, KeiboUser, Wallet, WalletUser
+from core.permissions import get_wallet_roles
+from core.portfolio_api import get_portfolio
+
+
+class MembershipInvalidationTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = KeiboUser.objects.create_user(
+            'member@example.com', 'password', first_name='Member'
+        )
+        self.owner = KeiboUser.objects.create_user(
+            'owner@example.com', 'password', first_name='Owner'
+        )
+        self.asset = Asset.objects.create(id='usd', exchange_rate=Decimal('1'))
+        self.wallet = Wallet.objects.create(asset=self.asset, balance=Decimal('10'))
+        WalletUser.objects.create(user=self.owner, wallet=self.wallet, role=4)
+
+    def assert_cached_state(self, wallets, role):
+        self.assertEqual(get_portfolio(self.user.id)['total']['wallets'], wallets)
+        self.assertEqual(get_wallet_roles(self.user.id).get(self.wallet.id), role)
+
+    def test_created_wallet_is_listed_once_committed(self):
+        self.client.force_authenticate(self.user)
+        self.assert_cached_state(0, None)
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.post(
+                reverse('wallet-list-create'),
+                {'asset': 'usd', 'balance': '5'},
+                format='json',
+            )
+            self.assertEqual(response.status_code, 201)
+            # Not visible to the other connections yet
+            self.assertEqual(get_portfolio(self.user.id)['total']['wallets'], 0)
+        for callback in callbacks:
+            callback()
+
+        self.assertEqual(get_portfolio(self.user.id)['total']['wallets'], 1)
+
+    def test_queryset_writes_invalidate(self):
+        self.assert_cached_state(0, None)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            WalletUser.objects.bulk_create(
+                [WalletUser(user=self.user, wallet=self.wallet, role=1)]
+            )
+        self.assert_cached_state(1, 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            WalletUser.objects.filter(user=self.user).update(role=3)
+        self.assert_cached_state(1, 3)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            WalletUser.objects.filter(user=self.user).delete()
+        self.assert_cached_state(0, None)
+
+    def test_instance_writes_invalidate(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            membership = WalletUser.objects.create(
+                user=self.user, wallet=self.wallet, role=1
+            )
+        self.assert_cached_state(1, 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            membership.delete()
+        self.assert_cached_state(0, None)
+
+    def test_deleted_wallet_is_dropped_for_every_member(self):
+        WalletUser.objects.create(user=self.user, wallet=self.wallet, role=1)
+        self.assert_cached_state(1, 1)
+        self.client.force_authenticate(self.owner)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.delete(reverse('wallet-rud', args=[self.wallet.id]))
+        self.assertEqual(response.status_code, 204)
+        self.assert_cached_state(0, None)
+
+    def test_roles_refill_racing_a_change_is_not_served(self):
+        def load_then_change():
+            stale = dict(
+                WalletUser.objects.filter(user=self.user).values_list(
+                    'wallet_id', 'role'
+                )
+            )
+            # Committed while the lookup is in flight
+            with self.captureOnCommitCallbacks(execute=True):
+                WalletUser.objects.create(user=self.user, wallet=self.wallet, role=2)
+            return stale
+
+        cached_shared(f'wallet_roles:{self.user.id}', 'roles', load_then_change)
+
+        self.assertEqual(get_wallet_roles(self.user.id), {self.wallet.id: 2})
@@ -0,0 +1,158 @@
+import json
+import requests
+from django.core.cache import cache
+from django.test import SimpleTestCase
+from django_redis import get_redis_connection
+from requests.adapters import BaseAdapter
+from requests.models import Response
+from core.metrics import get_provider_metrics
+from core.providers import ProviderClient, RateLimiter
+
+
+class FakeTransport(BaseAdapter):
+    """
+    Serves the scripted steps in order: (status, headers, JSON body) tuples,
+    or exceptions to raise. Keeps the requests it was sent.
+    """
+
+    def __init__(self, *steps):
+        super().__init__()
+        self.steps = list(steps)
+        self.requests = []
+
+    def send(self, request, **kwargs):
+        self.requests.append(request)
+        step = self.steps.pop(0)
+        if isinstance(step, Exception):
+            raise step
+        status, headers, body = step
+        response = Response()
+        response.status_code = status
+        response.headers.update(headers)
+        response._content = b'' if body is None else json.dumps(body).encode()
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+class ProviderClientTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        get_redis_connection('default').flushdb()
+        self.sleeps = []
+
+    def client_for(self, *steps, **kwargs):
+        self.transport = FakeTransport(*steps)
+        return ProviderClient(
+            'test', transport=self.transport, sleep=self.sleeps.append, **kwargs
+        )
+
+    def metrics(self):
+        return get_provider_metrics()[0]
+
+    def test_retries_after_errors_and_throttling(self):
+        client = self.client_for(
+            (503, {'Retry-After': '2'}, None),
+            requests.ConnectionError('Connection refused'),
+            (200, {}, {'price': 1}),
+            backoff=0.5,
+        )
+
+        self.assertEqual(client.get_json('https://provider.test/prices'), {'price': 1})
+        self.assertEqual(len(self.transport.requests), 3)
+        # Retry-After first, then a jittered backoff of at most 0.5 * 2^1
+        self.assertEqual(self.sleeps[0], 2)
+        self.assertTrue(0 <= self.sleeps[1] <= 1)
+        self.assertEqual(self.metrics()['retries'], 2)
+        self.assertEqual(self.metrics()['error_rate'], 0)
+
+    def test_backoff_is_capped(self):
+        client = self.client_for(
+            (429, {'Retry-After': '3600'}, None),
+            (500, {}, None),
+            (500, {}, None),
+            max_backoff=1,
+        )
+
+        with self.assertRaises(requests.HTTPError):
+            client.get_json('https://provider.test/prices')
+        self.assertEqual(len(self.sleeps), 2)
+        self.assertTrue(all(0 <= delay <= 1 for delay in self.sleeps))
+        self.assertEqual(self.metrics()['error_rate'], 1)
+
+    def test_gives_up_after_the_last_retry(self):
+        client = self.client_for(*[requests.Timeout('Read timed out')] * 3)
+
+        with self.assertRaises(requests.Timeout):
+            client.get('https://provider.test/prices')
+        self.assertEqual(len(self.transport.requests), 3)
+        self.assertEqual(self.metrics()['error_rate'], 1)
+
+    def test_client_errors_are_not_retried(self):
+        client = self.client_for((404, {}, None))
+
+        with self.assertRaises(requests.HTTPError):
+            client.get_json('https://provider.test/prices')
+        self.assertEqual(len(self.transport.requests), 1)
+        self.assertEqual(self.sleeps, [])
+
+    def test_not_modified_returns_the_stored_document(self):
+        client = self.client_for(
+            (
+                200,
+                {'ETag': '"v1"', 'Last-Modified': 'Mon, 01 Jan 2024 00:00:00 GMT'},
+                [1],
+            ),
+            (304, {}, None),
+            conditional=True,
+        )
+        url = 'https://provider.test/prices?key=secret'
+
+        self.assertEqual(client.get_json(url), [1])
+        self.assertEqual(client.get_json(url), [1])
+        revalidation = self.transport.requests[1].headers
+        self.assertEqual(revalidation['If-None-Match'], '"v1"')
+        self.assertEqual(
+            revalidation['If-Modified-Since'], 'Mon, 01 Jan 2024 00:00:00 GMT'
+        )
+        self.assertEqual(self.metrics()['not_modified'], 1)
+        # Only a hash of the url (and its api key) is stored
+        self.assertFalse(get_redis_connection('default').keys('*secret*'))
+
+    def test_unconditional_clients_do_not_revalidate(self):
+        client = self.client_for(
+            (200, {'ETag': '"v1"'}, [1]),
+            (200, {'ETag': '"v2"'}, [2]),
+        )
+
+        self.assertEqual(client.get_json('https://provider.test/prices'), [1])
+        self.assertEqual(client.get_json('https://provider.test/prices'), [2])
+        self.assertNotIn('If-None-Match', self.transport.requests[1].headers)
+
+
+class RateLimiterTests(SimpleTestCase):
+    def setUp(self):
+        self.now = 0.0
+        self.sleeps = []
+        self.limiter = RateLimiter(
+            2, burst=3, clock=lambda: self.now, sleep=self.sleeps.append
+        )
+
+    def test_burst_then_rate(self):
+        for _ in range(5):
+            self.limiter.acquire()
+
+        # 3 right away, then one every half second
+        self.assertEqual(self.sleeps, [0.5, 1.0])
+
+    def test_tokens_refill_over_time(self):
+        for _ in range(3):
+            self.limiter.acquire()
+        self.now = 1.0
+        for _ in range(2):
+            self.limiter.acquire()
+
+        self.assertEqual(self.sleeps, [])
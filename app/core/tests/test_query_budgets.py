@@ -0,0 +1,89 @@
+from decimal import Decimal
+from unittest import mock
+from django.core.cache import cache
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
+from django_redis import get_redis_connection
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
+from core.authentication import _users
+from core.market_api import get_assets
+from core.metrics import METRICS_KEY_PREFIX, QueryBudgetExceeded, view_path
+from core.models import Asset, KeiboUser, Transaction, Wallet, WalletUser
+from core.tests.test_user_search import requires_pg_trgm
+from core.transaction_api import TransactionHistoryView
+
+
+@override_settings(REQUEST_METRICS=True, QUERY_BUDGETS_STRICT=True)
+class QueryBudgetTests(APITestCase):
+    """
+    Budgeted views under strict budgets, with cold caches and token
+    authentication: going over a budget fails the request.
+    """
+
+    def setUp(self):
+        cache.clear()
+        _users.clear()
+        get_redis_connection('default').flushdb()
+        self.user = KeiboUser.objects.create_user(
+            'owner@example.com', 'password', first_name='Owner'
+        )
+        self.asset = Asset.objects.create(id='eur', exchange_rate=Decimal('1.1'))
+        self.wallet = Wallet.objects.create(asset=self.asset, balance=Decimal('10'))
+        WalletUser.objects.create(user=self.user, wallet=self.wallet, role=4)
+        for i in range(3):
+            Transaction.objects.create(
+                wallet=self.wallet,
+                executed_at=timezone.now(),
+                amount=Decimal(i + 1),
+                category='food',
+                description=f'Transaction {i}',
+            )
+        token = AccessToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def test_views_stay_within_their_budget(self):
+        urls = [
+            reverse('get_wallets_no_params'),
+            reverse('get_wallets_role', args=['4']),
+            reverse('get_wallet_history', args=[self.wallet.id]),
+            reverse('wallet-list-create'),
+            reverse('get_transactions', args=[self.wallet.id]),
+            reverse('get_portfolio_summary'),
+            reverse('get_assets'),
+            reverse('get_economic_indexes'),
+            reverse('get_index_history', args=['selic']),
+            reverse('get_asset_history', args=['eur']),
+            reverse('get_asset_candles', args=['eur']),
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 200)
+
+    @requires_pg_trgm
+    def test_search_stays_within_its_budget(self):
+        # Long enough for the prefix and the similarity queries
+        response = self.client.get(reverse('search_users', args=['owner']))
+        self.assertEqual(response.status_code, 200)
+
+    def test_create_wallet_stays_within_its_budget(self):
+        response = self.client.post(
+            reverse('wallet-list-create'),
+            {'asset': 'eur', 'balance': '5'},
+            format='json',
+        )
+        self.assertEqual(response.status_code, 201)
+
+    def test_going_over_the_budget_fails(self):
+        with mock.patch.object(get_assets, 'query_budget', 0):
+            with self.assertRaises(QueryBudgetExceeded):
+                self.client.get(reverse('get_assets'))
+
+    def test_serialization_is_timed(self):
+        self.client.get(reverse('get_transactions', args=[self.wallet.id]))
+
+        metrics = get_redis_connection('default').hgetall(
+            f'{METRICS_KEY_PREFIX}{view_path(TransactionHistoryView)}'
+        )
+        self.assertGreater(float(metrics[b'serializer_ms']), 0)
@@ -0,0 +1,143 @@
+import copy
+import random
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from django.test import TestCase
+from core.models import Asset, Transaction, Wallet, WalletDailySnapshot
+from core.snapshots import rebuild_wallet_snapshots, record_transaction_changes
+
+START = datetime(2024, 1, 10, tzinfo=dt_timezone.utc)
+CATEGORIES = ['food', 'rent', 'salary']
+
+
+class IncrementalSnapshotTests(TestCase):
+    """
+    Snapshots maintained write by write, as the transaction views do, must
+    match the ones rebuilt from scratch.
+    """
+
+    def setUp(self):
+        asset = Asset.objects.create(id='usd', exchange_rate=Decimal('1'))
+        self.wallet = Wallet.objects.create(asset=asset, balance=Decimal('0'))
+
+    def snapshots(self):
+        return list(
+            WalletDailySnapshot.objects.filter(wallet=self.wallet)
+            .order_by('date')
+            .values_list(
+                'date', 'closing_balance', 'inflow', 'outflow', 'category_totals'
+            )
+        )
+
+    def assert_matches_rebuild(self):
+        incremental = self.snapshots()
+        rebuild_wallet_snapshots([self.wallet.id])
+        self.assertEqual(incremental, self.snapshots())
+
+    def create(self, executed_at, amount, category='food'):
+        instance = Transaction.objects.create(
+            wallet=self.wallet,
+            executed_at=executed_at,
+            amount=Decimal(amount),
+            category=category,
+        )
+        record_transaction_changes(added=[instance])
+        return instance
+
+    def update(self, instance, **fields):
+        previous = copy.copy(instance)
+        for name, value in fields.items():
+            setattr(instance, name, value)
+        instance.save()
+        record_transaction_changes(added=[instance], removed=[previous])
+
+    def delete(self, instance):
+        instance.delete()
+        record_transaction_changes(removed=[instance])
+
+    def test_backdated_before_the_first_day(self):
+        self.create(START, '10')
+        self.create(START + timedelta(days=2), '-4')
+        # A new first row, every later closing balance moves
+        self.create(START - timedelta(days=3), '7', 'salary')
+        self.assert_matches_rebuild()
+
+    def test_deleting_the_first_day(self):
+        first = self.create(START, '10')
+        self.create(START + timedelta(days=1), '-4')
+        self.delete(first)
+        self.assert_matches_rebuild()
+        self.assertEqual(len(self.snapshots()), 1)
+
+    def test_deleting_the_last_transaction_of_a_day(self):
+        self.create(START, '10')
+        middle = self.create(START + timedelta(days=1), '-4', 'rent')
+        self.create(START + timedelta(days=2), '3')
+        self.delete(middle)
+        self.assert_matches_rebuild()
+        self.assertEqual(len(self.snapshots()), 2)
+
+    def test_day_with_cancelling_amounts_is_kept(self):
+        self.create(START, '5')
+        self.create(START + timedelta(hours=1), '-5')
+        self.assert_matches_rebuild()
+        self.assertEqual(len(self.snapshots()), 1)
+
+    def test_zero_amounts(self):
+        self.create(START, '10')
+        zero = self.create(START + timedelta(days=1), '0')
+        self.assert_matches_rebuild()
+        self.update(zero, amount=Decimal('3'))
+        self.update(zero, amount=Decimal('0'))
+        self.assert_matches_rebuild()
+
+    def test_moves_across_days_and_midnight(self):
+        instance = self.create(START.replace(hour=23, minute=59), '12.5')
+        self.create(START + timedelta(days=1), '-2')
+        self.update(instance, executed_at=START + timedelta(days=1, minutes=1))
+        self.assert_matches_rebuild()
+        self.update(instance, amount=Decimal('-7.25'), category='rent')
+        self.assert_matches_rebuild()
+        self.update(instance, executed_at=START - timedelta(days=5))
+        self.assert_matches_rebuild()
+
+    def test_random_writes(self):
+        for seed in range(5):
+            with self.subTest(seed=seed):
+                Transaction.objects.filter(wallet=self.wallet).delete()
+                WalletDailySnapshot.objects.filter(wallet=self.wallet).delete()
+                self.apply_random_writes(random.Random(seed), 60)
+                self.assert_matches_rebuild()
+
+    def apply_random_writes(self, rng, count):
+        def random_moment():
+            return START + timedelta(
+                days=rng.randint(-5, 5), minutes=rng.choice([0, 1, 720, 1439])
+            )
+
+        def random_amount():
+            # Zero amounts included
+            return Decimal(rng.randint(-50, 50)) / 4
+
+        transactions = []
+        for _ in range(count):
+            action = rng.random()
+            if not transactions or action < 0.4:
+                transactions.append(
+                    self.create(
+                        random_moment(), random_amount(), rng.choice(CATEGORIES)
+                    )
+                )
+            elif action < 0.6:
+                self.update(rng.choice(transactions), amount=random_amount())
+            elif action < 0.75:
+                self.update(rng.choice(transactions), executed_at=random_moment())
+            elif action < 0.85:
+                self.update(
+                    rng.choice(transactions),
+                    category=rng.choice(CATEGORIES),
+                    amount=random_amount(),
+                    executed_at=random_moment(),
+                )
+            else:
+                self.delete(transactions.pop(rng.randrange(len(transactions))))
@@ -0,0 +1,104 @@
+import threading
+from datetime import timedelta
+from unittest import mock
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+from core.lib.supabase import outbox
+from core.lib.supabase.fake_client import FakeSupabaseClient
+from core.models import SupabaseOutbox
+
+
+@mock.patch.object(outbox, 'request_flush', lambda: None)
+class FlushOutboxTests(TestCase):
+    def test_rows_are_upserted_once_per_table(self):
+        outbox.enqueue('economic_index', [{'id': 'FEDFUNDS', 'value': 5.33}])
+        outbox.enqueue('economic_index', [{'id': 'ECBDFR', 'value': 4.0}])
+        client = FakeSupabaseClient()
+
+        self.assertEqual(outbox.flush_all(client), (2, 0))
+        self.assertEqual(len(client.calls), 1)
+        self.assertEqual(set(client.tables['economic_index']), {'FEDFUNDS', 'ECBDFR'})
+        self.assertFalse(SupabaseOutbox.objects.exists())
+
+    def test_assets_are_updated_not_inserted(self):
+        client = FakeSupabaseClient()
+        client.tables['asset'] = {'eur': {'id': 'eur', 'usd_exchange_rate': 1.0}}
+        outbox.enqueue(
+            'asset',
+            [
+                {'id': 'eur', 'usd_exchange_rate': 1.1},
+                {'id': 'unknown', 'usd_exchange_rate': 2.0},
+            ],
+        )
+
+        self.assertEqual(outbox.flush_outbox(client), (2, 0))
+        self.assertEqual(
+            client.tables['asset'], {'eur': {'id': 'eur', 'usd_exchange_rate': 1.1}}
+        )
+        self.assertIn(
+            ('asset', {'usd_exchange_rate': 1.1}, {'id': 'eur'}), client.calls
+        )
+
+    def test_failed_rows_are_rescheduled_with_backoff(self):
+        outbox.enqueue('economic_index', [{'id': 'FEDFUNDS', 'value': 5.33}])
+        before = timezone.now()
+
+        self.assertEqual(outbox.flush_outbox(FakeSupabaseClient(failures=1)), (0, 1))
+        row = SupabaseOutbox.objects.get()
+        self.assertEqual(row.attempts, 1)
+        self.assertGreaterEqual(row.next_attempt_at, before + outbox.RETRY_BASE_DELAY)
+        # Not due yet
+        self.assertEqual(outbox.flush_outbox(FakeSupabaseClient()), (0, 0))
+
+    def test_rows_queued_again_while_sent_are_kept(self):
+        outbox.enqueue('economic_index', [{'id': 'FEDFUNDS', 'value': 5.33}])
+
+        class RequeuingClient(FakeSupabaseClient):
+            # Queues the row again while sending it
+            def table(self, name):
+                outbox.enqueue(name, [{'id': 'FEDFUNDS', 'value': 5.5}])
+                return super().table(name)
+
+        self.assertEqual(outbox.flush_outbox(RequeuingClient()), (1, 0))
+        row = SupabaseOutbox.objects.get()
+        self.assertEqual(row.payload['value'], 5.5)
+        self.assertLessEqual(row.next_attempt_at, timezone.now())
+
+    def test_claimed_rows_are_skipped_until_the_claim_times_out(self):
+        outbox.enqueue('economic_index', [{'id': 'FEDFUNDS', 'value': 5.33}])
+        SupabaseOutbox.objects.update(
+            next_attempt_at=timezone.now() + outbox.CLAIM_TIMEOUT
+        )
+        self.assertEqual(outbox.flush_outbox(FakeSupabaseClient()), (0, 0))
+
+        SupabaseOutbox.objects.update(
+            next_attempt_at=timezone.now() - timedelta(seconds=1)
+        )
+        self.assertEqual(outbox.flush_outbox(FakeSupabaseClient()), (1, 0))
+
+
+@mock.patch.object(outbox, 'request_flush', lambda: None)
+class FlushOutboxConcurrencyTests(TransactionTestCase):
+    def test_enqueue_does_not_wait_for_supabase(self):
+        outbox.enqueue('economic_index', [{'id': 'FEDFUNDS', 'value': 5.33}])
+        enqueued = threading.Event()
+
+        def enqueue():
+            try:
+                outbox.enqueue('economic_index', [{'id': 'FEDFUNDS', 'value': 5.5}])
+                enqueued.set()
+            finally:
+                connection.close()
+
+        class SlowClient(FakeSupabaseClient):
+            # Queues the row again from another connection while sending it
+            def table(self, name):
+                thread = threading.Thread(target=enqueue)
+                thread.start()
+                thread.join(timeout=5)
+                return super().table(name)
+
+        self.assertEqual(outbox.flush_outbox(SlowClient()), (1, 0))
+        self.assertTrue(enqueued.is_set())
+        self.assertEqual(SupabaseOutbox.objects.get().payload['value'], 5.5)
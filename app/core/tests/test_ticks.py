@@ -0,0 +1,120 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from unittest import mock
+from django.test import SimpleTestCase, TestCase
+from django_redis import get_redis_connection
+from core.models import Asset, AssetCandle, CandleResolution
+from core.ticks import build_candles, read_ticks, record_ticks, rollup_ticks
+
+START = datetime(2024, 1, 1, 10, 0, tzinfo=dt_timezone.utc)
+
+
+def ms(moment):
+    return int(moment.timestamp() * 1000)
+
+
+class BuildCandlesTests(SimpleTestCase):
+    def test_ohlc_per_resolution(self):
+        ticks = [
+            (ms(START), 10.0),
+            (ms(START + timedelta(seconds=30)), 12.0),
+            (ms(START + timedelta(seconds=59)), 9.0),
+            (ms(START + timedelta(minutes=1)), 11.0),
+            (ms(START + timedelta(hours=1)), 8.0),
+        ]
+
+        candles = build_candles(ticks)
+
+        self.assertEqual(candles[('1m', ms(START))], [10.0, 12.0, 9.0, 9.0, 3])
+        self.assertEqual(
+            candles[('1m', ms(START + timedelta(minutes=1)))],
+            [11.0, 11.0, 11.0, 11.0, 1],
+        )
+        self.assertEqual(candles[('1h', ms(START))], [10.0, 12.0, 9.0, 11.0, 4])
+        self.assertEqual(
+            candles[('1h', ms(START + timedelta(hours=1)))], [8.0, 8.0, 8.0, 8.0, 1]
+        )
+        day = ms(START.replace(hour=0))
+        self.assertEqual(candles[('1d', day)], [10.0, 12.0, 8.0, 8.0, 5])
+        # 3 minutes, 2 hours and 1 day
+        self.assertEqual(len(candles), 6)
+
+
+class TickBufferTests(TestCase):
+    def setUp(self):
+        get_redis_connection('default').flushdb()
+        self.asset = Asset.objects.create(id='btc', exchange_rate=Decimal('50000'))
+
+    def record(self, *prices, start=START):
+        for i, price in enumerate(prices):
+            record_ticks({'btc': price}, at=start + timedelta(seconds=i))
+
+    def candle(self, resolution):
+        return AssetCandle.objects.values_list(
+            'open', 'high', 'low', 'close', 'ticks'
+        ).get(asset=self.asset, resolution=resolution)
+
+    def test_ticks_are_read_oldest_first(self):
+        self.record(1, 2, 3)
+
+        ticks, count = read_ticks(['btc'])['btc']
+        self.assertEqual([price for _, price in ticks], [1, 2, 3])
+        self.assertEqual(ticks[0][0], ms(START))
+        self.assertEqual(count, 3)
+
+    @mock.patch('core.ticks.TICK_BUFFER_SIZE', 4)
+    def test_buffer_wraps_around(self):
+        self.record(1, 2, 3, 4, 5, 6)
+
+        with self.assertLogs('core.ticks', 'WARNING') as logs:
+            ticks, count = read_ticks(['btc'])['btc']
+        # The 2 oldest were overwritten before being rolled up
+        self.assertEqual([price for _, price in ticks], [3, 4, 5, 6])
+        self.assertEqual(count, 6)
+        self.assertIn('2 ticks of btc were overwritten', logs.output[0])
+
+    @mock.patch('core.ticks.TICK_BUFFER_SIZE', 4)
+    def test_rollup_resumes_after_a_wrap_around(self):
+        self.record(1, 2, 3)
+        self.assertEqual(rollup_ticks(['btc']), 3)
+        # 4 new ticks fill the buffer without overwriting unrolled ones
+        self.record(4, 5, 6, 7, start=START + timedelta(seconds=3))
+
+        ticks, _ = read_ticks(['btc'])['btc']
+        self.assertEqual([price for _, price in ticks], [4, 5, 6, 7])
+
+    def test_successive_rollups_merge_into_the_candles(self):
+        self.record(10, 15, 8)
+        self.assertEqual(rollup_ticks(), 3)
+        self.assertEqual(self.candle(CandleResolution.HOUR), (10, 15, 8, 8, 3))
+
+        self.record(20, 5, 12, start=START + timedelta(minutes=5))
+        self.assertEqual(rollup_ticks(), 3)
+        # Open kept, high and low widened, close replaced, ticks summed
+        self.assertEqual(self.candle(CandleResolution.HOUR), (10, 20, 5, 12, 6))
+        self.assertEqual(self.candle(CandleResolution.DAY), (10, 20, 5, 12, 6))
+        self.assertEqual(
+            AssetCandle.objects.filter(resolution=CandleResolution.MINUTE).count(), 2
+        )
+
+        # Nothing new to roll up
+        self.assertEqual(rollup_ticks(), 0)
+        self.assertEqual(self.candle(CandleResolution.HOUR), (10, 20, 5, 12, 6))
+
+    def test_ticks_of_deleted_assets_are_dropped(self):
+        record_ticks({'btc': 1, 'gone': 2}, at=START)
+
+        rollup_ticks()
+        self.assertEqual(
+            set(AssetCandle.objects.values_list('asset_id', flat=True)), {'btc'}
+        )
+
+    def test_rollup_is_at_least_once(self):
+        self.record(10, 15, 8)
+        rollup_ticks(['btc'])
+        # As if storing the rolled up position had failed after the commit
+        get_redis_connection('default').delete('ticks:btc:rolled')
+
+        # Merged again: same prices, tick counts doubled
+        self.assertEqual(rollup_ticks(['btc']), 3)
+        self.assertEqual(self.candle(CandleResolution.HOUR), (10, 15, 8, 8, 6))
@@ -0,0 +1,117 @@
+import csv
+import io
+import json
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal
+from django.core.cache import cache
+from django.urls import reverse
+from rest_framework.test import APITestCase
+from core.lib.columnar import read_columnar
+from core.models import Asset, KeiboUser, Transaction, Wallet, WalletUser
+from core.transaction_export import EXPORT_COLUMNS
+
+
+class TransactionExportTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = KeiboUser.objects.create_user(
+            'owner@example.com', 'password', first_name='Owner'
+        )
+        asset = Asset.objects.create(id='usd', exchange_rate=Decimal('1'))
+        self.wallet = Wallet.objects.create(asset=asset, balance=Decimal('0'))
+        WalletUser.objects.create(user=self.user, wallet=self.wallet, role=1)
+        self.first = Transaction.objects.create(
+            wallet=self.wallet,
+            executed_at=datetime(2024, 1, 1, tzinfo=dt_timezone.utc),
+            category='salary',
+            description='January, "net"',
+            amount=Decimal('2500'),
+            tags=['work', 'monthly'],
+        )
+        self.second = Transaction.objects.create(
+            wallet=self.wallet,
+            origin=self.first,
+            executed_at=datetime(2024, 1, 2, tzinfo=dt_timezone.utc),
+            settled_at=datetime(2024, 1, 3, tzinfo=dt_timezone.utc),
+            category='food',
+            amount=Decimal('-12.34567891'),
+        )
+        self.client.force_authenticate(self.user)
+
+    def export(self, file_format, wallet=None, **params):
+        response = self.client.get(
+            reverse('transaction-export', args=[(wallet or self.wallet).id]),
+            {'file_format': file_format, **params},
+        )
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content)
+
+    def test_csv(self):
+        rows = list(csv.reader(io.StringIO(self.export('csv').decode())))
+
+        self.assertEqual(rows[0], EXPORT_COLUMNS)
+        self.assertEqual(
+            rows[1],
+            [
+                str(self.first.id),
+                '',
+                '1704067200000',
+                '',
+                'salary',
+                'January, "net"',
+                '2500.00000000',
+                'work|monthly',
+            ],
+        )
+        self.assertEqual(rows[2][1], str(self.first.id))
+        self.assertEqual(rows[2][3], '1704240000000')
+        self.assertEqual(rows[2][6], '-12.34567891')
+        self.assertEqual(len(rows), 3)
+
+    def test_ndjson(self):
+        rows = [json.loads(line) for line in self.export('ndjson').splitlines()]
+
+        self.assertEqual(
+            [row['id'] for row in rows], [str(self.first.id), str(self.second.id)]
+        )
+        self.assertIsNone(rows[0]['origin'])
+        self.assertEqual(rows[0]['tags'], ['work', 'monthly'])
+        # Amounts as strings, exact
+        self.assertEqual(rows[1]['amount'], '-12.34567891')
+        self.assertEqual(rows[1]['settled_at'], 1704240000000)
+
+    def test_columnar(self):
+        rows = list(read_columnar(io.BytesIO(self.export('columnar'))))
+
+        self.assertEqual([row['id'] for row in rows], [self.first.id, self.second.id])
+        self.assertEqual(rows[1]['origin'], self.first.id)
+        self.assertEqual(rows[1]['amount'], Decimal('-12.34567891'))
+
+    def test_filters_and_empty_export(self):
+        rows = csv.reader(io.StringIO(self.export('csv', category='rent').decode()))
+        self.assertEqual(list(rows), [EXPORT_COLUMNS])
+        self.assertEqual(self.export('ndjson', category='rent'), b'')
+        self.assertEqual(
+            list(read_columnar(io.BytesIO(self.export('columnar', category='rent')))),
+            [],
+        )
+
+    def test_unsupported_format(self):
+        response = self.client.get(
+            reverse('transaction-export', args=[self.wallet.id]),
+            {'file_format': 'xlsx'},
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_wallet_of_somebody_else(self):
+        other = KeiboUser.objects.create_user(
+            'other@example.com', 'password', first_name='Other'
+        )
+        self.client.force_authenticate(other)
+
+        response = self.client.get(reverse('transaction-export', args=[self.wallet.id]))
+        self.assertEqual(response.status_code, 403)
+
+        self.wallet.is_public = True
+        self.wallet.save()
+        self.assertEqual(len(self.export('ndjson').splitlines()), 2)
@@ -0,0 +1,66 @@
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from django.core.cache import cache
+from django.urls import reverse
+from rest_framework.test import APITestCase
+from core.models import Asset, KeiboUser, Transaction, Wallet, WalletUser
+
+
+class TransactionHistoryPaginationTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = KeiboUser.objects.create_user(
+            'owner@example.com', 'password', first_name='Owner'
+        )
+        asset = Asset.objects.create(id='usd', exchange_rate=Decimal('1'))
+        self.wallet = Wallet.objects.create(asset=asset, balance=Decimal('0'))
+        WalletUser.objects.create(user=self.user, wallet=self.wallet, role=4)
+        self.client.force_authenticate(self.user)
+
+        # Runs of transactions executed at the same moment, longer than a page
+        moment = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        Transaction.objects.bulk_create(
+            Transaction(
+                wallet=self.wallet,
+                executed_at=moment + timedelta(minutes=i // 7),
+                category='food',
+                amount=Decimal(-i),
+            )
+            for i in range(30)
+        )
+        self.expected = [
+            str(transaction_id)
+            for transaction_id in Transaction.objects.order_by(
+                '-executed_at', 'id'
+            ).values_list('id', flat=True)
+        ]
+
+    def get_page(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_pages_cover_every_transaction_once(self):
+        url = reverse('get_transactions', args=[self.wallet.id]) + '?page_size=4'
+        seen, pages = [], []
+        while url:
+            page = self.get_page(url)
+            pages.append(page)
+            seen.extend(row['id'] for row in page['results'])
+            url = page['next']
+        self.assertEqual(seen, self.expected)
+
+        # And back from the last page
+        seen = []
+        url = pages[-1]['previous']
+        while url:
+            page = self.get_page(url)
+            seen[:0] = [row['id'] for row in page['results']]
+            url = page['previous']
+        self.assertEqual(seen, self.expected[: len(seen)])
+        self.assertEqual(len(seen) + len(pages[-1]['results']), len(self.expected))
+
+    def test_invalid_cursor(self):
+        url = reverse('get_transactions', args=[self.wallet.id])
+        response = self.client.get(url + '?cursor=cD1ub3QtYS1wb3NpdGlvbg==')
+        self.assertEqual(response.status_code, 404)
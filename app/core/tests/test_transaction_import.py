@@ -0,0 +1,58 @@
+from decimal import Decimal
+from django.core.cache import cache
+from django.test import SimpleTestCase
+from django.urls import reverse
+from rest_framework.test import APITestCase
+from core.models import Asset, KeiboUser, Transaction, Wallet, WalletUser
+from core.transaction_import import RowError, parse_amount
+
+
+class ParseAmountTests(SimpleTestCase):
+    def test_valid_amounts(self):
+        for value, expected in [
+            ('12.5', Decimal('12.5')),
+            ('-0.00000001', Decimal('-0.00000001')),
+            ('99999999999.99999999', Decimal('99999999999.99999999')),
+            ('1e10', Decimal('1e10')),
+            ('1.5E-7', Decimal('0.00000015')),
+            ('0e20', Decimal('0')),
+            (42, Decimal('42')),
+        ]:
+            with self.subTest(value=value):
+                self.assertEqual(parse_amount(value), expected)
+
+    def test_amounts_overflowing_the_column(self):
+        for value in ['1e20', '1E+11', '100000000000', '-123456789012.5']:
+            with self.subTest(value=value):
+                with self.assertRaisesMessage(RowError, 'too large'):
+                    parse_amount(value)
+
+    def test_invalid_amounts(self):
+        for value in ['', 'abc', 'NaN', 'Infinity', '1e-9', '0.123456789']:
+            with self.subTest(value=value):
+                with self.assertRaises(RowError):
+                    parse_amount(value)
+
+
+class TransactionImportTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = KeiboUser.objects.create_user(
+            'owner@example.com', 'password', first_name='Owner'
+        )
+        asset = Asset.objects.create(id='usd', exchange_rate=Decimal('1'))
+        self.wallet = Wallet.objects.create(asset=asset, balance=Decimal('0'))
+        WalletUser.objects.create(user=self.user, wallet=self.wallet, role=4)
+        self.client.force_authenticate(self.user)
+
+    def test_overflowing_amount_is_reported(self):
+        response = self.client.post(
+            reverse('transaction-import') + f'?wallet={self.wallet.id}',
+            'amount,category\n-12.5,food\n1e20,salary\n',
+            content_type='text/csv',
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['failed'], 1)
+        self.assertEqual(response.data['errors'][0]['row'], 2)
+        self.assertFalse(Transaction.objects.exists())
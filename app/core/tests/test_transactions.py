@@ -0,0 +1,102 @@
+import threading
+from decimal import Decimal
+from django.core.cache import cache
+from django.db import connection
+from django.test import TransactionTestCase
+from django.urls import reverse
+from rest_framework.test import APIClient
+from core.models import Asset, KeiboUser, Transaction, Wallet, WalletUser
+
+
+class ConcurrentTransactionTests(TransactionTestCase):
+    # Requests run in threads, each with its own database connection, so
+    # their writes really interleave
+    THREADS = 8
+
+    def setUp(self):
+        cache.clear()
+        self.user = KeiboUser.objects.create_user(
+            'owner@example.com', 'password', first_name='Owner'
+        )
+        asset = Asset.objects.create(id='usd', exchange_rate=Decimal('1'))
+        self.wallet = Wallet.objects.create(asset=asset, balance=Decimal('100'))
+        WalletUser.objects.create(user=self.user, wallet=self.wallet, role=4)
+
+    def run_concurrently(self, request):
+        barrier = threading.Barrier(self.THREADS)
+        statuses = []
+
+        def run(i):
+            client = APIClient()
+            client.force_authenticate(self.user)
+            try:
+                barrier.wait()
+                statuses.append(request(client, i).status_code)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return statuses
+
+    def test_parallel_creates_add_up(self):
+        statuses = self.run_concurrently(
+            lambda client, i: client.post(
+                reverse('transaction-list-create'),
+                {
+                    'wallet': str(self.wallet.id),
+                    'category': 'food',
+                    'amount': '-2.5',
+                },
+                format='json',
+            )
+        )
+
+        self.assertEqual(statuses, [201] * self.THREADS)
+        self.wallet.refresh_from_db()
+        self.assertEqual(
+            self.wallet.balance, Decimal('100') - Decimal('2.5') * self.THREADS
+        )
+
+    def test_parallel_updates_of_a_transaction_add_up(self):
+        instance = Transaction.objects.create(
+            wallet=self.wallet, category='food', amount=Decimal('-10')
+        )
+        self.wallet.balance = Decimal('90')
+        self.wallet.save()
+
+        # Every update sets a different amount: whatever their order, the
+        # balance must reflect the amount of the last one
+        statuses = self.run_concurrently(
+            lambda client, i: client.patch(
+                reverse('transaction-rud', args=[instance.id]),
+                {'amount': str(-i - 1)},
+                format='json',
+            )
+        )
+
+        self.assertEqual(statuses, [200] * self.THREADS)
+        instance.refresh_from_db()
+        self.wallet.refresh_from_db()
+        self.assertEqual(self.wallet.balance, Decimal('100') + instance.amount)
+
+    def test_create_then_delete_restores_the_balance(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.post(
+            reverse('transaction-list-create'),
+            {'wallet': str(self.wallet.id), 'category': 'food', 'amount': '-12.5'},
+            format='json',
+        )
+        self.assertEqual(response.data['new_balance'], 87.5)
+
+        response = client.delete(reverse('transaction-rud', args=[response.data['id']]))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['new_balance'], 100)
+        self.wallet.refresh_from_db()
+        self.assertEqual(self.wallet.balance, Decimal('100'))
+        self.assertFalse(Transaction.objects.exists())
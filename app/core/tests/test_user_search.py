@@ -0,0 +1,69 @@
+from functools import wraps
+from django.db import connection
+from django.urls import reverse
+from rest_framework.test import APITestCase
+from core.models import KeiboUser
+from core.user_search import SEARCH_MAX_LIMIT, escape_like, search_users
+
+
+def requires_pg_trgm(test):
+    # The similarity search needs the extension, which some local Postgres
+    # builds don't ship
+    @wraps(test)
+    def wrapper(self, *args, **kwargs):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+            if cursor.fetchone() is None:
+                self.skipTest('pg_trgm is not installed')
+        return test(self, *args, **kwargs)
+
+    return wrapper
+
+
+class SearchUsersTests(APITestCase):
+    def create_user(self, email, **fields):
+        return KeiboUser.objects.create_user(email, 'password', **fields)
+
+    def emails(self, keyword, limit=10):
+        return [user['email'] for user in search_users(keyword, limit)]
+
+    def test_escape_like(self):
+        self.assertEqual(escape_like('a%b_c\\d'), 'a\\%b\\_c\\\\d')
+
+    def test_like_wildcards_match_literally(self):
+        self.create_user('a_b@example.com')
+        self.create_user('axb@example.com')
+
+        self.assertEqual(self.emails('a_'), ['a_b@example.com'])
+        self.assertEqual(self.emails('%'), [])
+
+    def test_inactive_users_are_excluded(self):
+        self.create_user('active@example.com')
+        self.create_user('away@example.com', is_active=False)
+
+        self.assertEqual(self.emails('a'), ['active@example.com'])
+
+    def test_limit(self):
+        KeiboUser.objects.bulk_create(
+            KeiboUser(email=f'user{i:02}@example.com')
+            for i in range(SEARCH_MAX_LIMIT + 5)
+        )
+        self.assertEqual(len(self.emails('us', limit=3)), 3)
+
+        self.client.force_authenticate(KeiboUser.objects.first())
+        url = reverse('search_users', args=['us'])
+        for limit, expected in [('1000', SEARCH_MAX_LIMIT), ('0', 1), ('x', 10)]:
+            with self.subTest(limit=limit):
+                response = self.client.get(url, {'limit': limit})
+                self.assertEqual(len(response.data), expected)
+
+    @requires_pg_trgm
+    def test_prefix_matches_come_first(self):
+        self.create_user('zed@example.com', first_name='Anna')
+        self.create_user('joanna@example.com')
+        self.create_user('annie@example.com')
+
+        emails = self.emails('ANN')
+        # The first name is the closest match, the prefix still wins
+        self.assertEqual(emails[0], 'annie@example.com')
+        self.assertEqual(set(emails[1:]), {'zed@example.com', 'joanna@example.com'})
@@ -0,0 +1,52 @@
+from datetime import timedelta
+from decimal import Decimal
+from django.core.cache import cache
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APITestCase
+from core.cache import ASSETS, invalidate
+from core.models import Asset, KeiboUser, Transaction, Wallet, WalletUser
+
+
+class ValuationTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        invalidate(ASSETS)
+        self.user = KeiboUser.objects.create_user(
+            'owner@example.com', 'password', first_name='Owner'
+        )
+        Asset.objects.create(id='usd', exchange_rate=Decimal('1'))
+        Asset.objects.create(id='eur', exchange_rate=Decimal('1.1'))
+        # Never priced by the providers
+        Asset.objects.create(id='unpriced', exchange_rate=Decimal('0'))
+        self.wallets = {}
+        for asset_id, balance in [('eur', '10'), ('unpriced', '5')]:
+            wallet = Wallet.objects.create(asset_id=asset_id, balance=Decimal(balance))
+            WalletUser.objects.create(user=self.user, wallet=wallet, role=4)
+            Transaction.objects.create(
+                wallet=wallet,
+                executed_at=timezone.now() - timedelta(days=1),
+                category='food',
+                amount=Decimal('-1'),
+            )
+            self.wallets[asset_id] = str(wallet.id)
+        self.client.force_authenticate(self.user)
+
+    def test_wallets_without_exchange_rate_are_flagged(self):
+        since = (timezone.now() - timedelta(days=7)).date()
+        response = self.client.get(
+            reverse('get_valuation') + f'?real=false&from={since}'
+        )
+
+        self.assertEqual(response.status_code, 200)
+        values = {wallet['id']: wallet['value'] for wallet in response.data['wallets']}
+        self.assertAlmostEqual(values[self.wallets['eur']], 11.0)
+        self.assertIsNone(values[self.wallets['unpriced']])
+        self.assertAlmostEqual(response.data['total'], 11.0)
+        self.assertEqual(response.data['transactions']['count'], 2)
+        self.assertEqual(response.data['transactions']['unvalued'], 1)
+        self.assertAlmostEqual(response.data['transactions']['outflow'], 1.1)
+
+    def test_unknown_currency(self):
+        response = self.client.get(reverse('get_valuation') + '?currency=xyz')
+        self.assertEqual(response.status_code, 400)
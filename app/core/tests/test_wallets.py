@@ -0,0 +1,61 @@
+from decimal import Decimal
+from django.core.cache import cache
+from django.urls import reverse
+from rest_framework.test import APITestCase
+from core.models import Asset, KeiboUser, Wallet, WalletUser
+
+
+class GetWalletsTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = KeiboUser.objects.create_user(
+            'owner@example.com', 'password', first_name='Owner'
+        )
+        self.asset = Asset.objects.create(id='eur', exchange_rate=Decimal('1.1'))
+        self.client.force_authenticate(self.user)
+
+    def add_wallets(self, count, role=4):
+        for i in range(count):
+            wallet = Wallet.objects.create(asset=self.asset, balance=Decimal(i))
+            WalletUser.objects.create(user=self.user, wallet=wallet, role=role)
+
+    def test_query_count_does_not_grow_with_wallets(self):
+        url = reverse('get_wallets_no_params')
+        self.add_wallets(1)
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertEqual(len(response.data), 1)
+
+        self.add_wallets(20)
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertEqual(len(response.data), 21)
+
+    def test_wallets_are_valued_and_filtered_by_role(self):
+        self.add_wallets(2, role=1)
+        self.add_wallets(3, role=3)
+        wallet = Wallet.objects.filter(walletuser_wallet__role=3).first()
+        wallet.balance = Decimal('10')
+        wallet.save()
+
+        response = self.client.get(reverse('get_wallets_role', args=['3']))
+        self.assertEqual(len(response.data), 3)
+        row = next(row for row in response.data if row['id'] == str(wallet.id))
+        self.assertEqual(row['role'], 3)
+        self.assertEqual(row['category'], 'cash')
+        self.assertAlmostEqual(row['val_usd'], 11.0)
+
+        response = self.client.get(reverse('get_wallets_both', args=['3', -2]))
+        self.assertEqual(len(response.data), 5)
+
+    def test_other_users_wallets_are_not_listed(self):
+        other = KeiboUser.objects.create_user(
+            'other@example.com', 'password', first_name='Other'
+        )
+        wallet = Wallet.objects.create(asset=self.asset, balance=Decimal('1'))
+        WalletUser.objects.create(user=other, wallet=wallet, role=4)
+        self.add_wallets(1)
+
+        response = self.client.get(reverse('get_wallets_no_params'))
+        self.assertEqual(len(response.data), 1)
+        self.assertNotEqual(response.data[0]['id'], str(wallet.id))
@@ -0,0 +1,214 @@
+import logging
+import struct
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal
+from django.db import connection, transaction
+from django.utils import timezone
+from django_redis import get_redis_connection
+from .models import Asset, AssetCandle, CandleResolution
+
+logger = logging.getLogger(__name__)
+
+# Ticks of an asset live in a fixed size Redis string used as a ring buffer
+# of packed (epoch ms, price) records, next to the number of ticks ever
+# appended and the number already rolled up into candles
+TICK_KEY_PREFIX = 'ticks:'
+TICK_ASSETS_KEY = 'ticks:assets'
+TICK_BUFFER_SIZE = 2048  # ticks per asset
+CANDLE_BATCH_SIZE = 1000  # rows per INSERT
+
+RESOLUTION_SECONDS = {
+    CandleResolution.MINUTE: 60,
+    CandleResolution.HOUR: 60 * 60,
+    CandleResolution.DAY: 60 * 60 * 24,
+}
+
+_TICK = struct.Struct('<qd')
+
+# Increments the count and writes the tick in its slot, atomically
+_APPEND_SCRIPT = """
+local count = redis.call('incr', KEYS[2])
+local slot = (count - 1) % tonumber(ARGV[2])
+redis.call('setrange', KEYS[1], slot * tonumber(ARGV[3]), ARGV[1])
+return count
+"""
+
+_CANDLE_TABLE = AssetCandle._meta.db_table
+# The ticks of a batch all come after the ones already rolled up: the
+# stored open is kept and the close replaced
+_UPSERT_CANDLES_SQL = f"""
+INSERT INTO {_CANDLE_TABLE} (asset_id, resolution, start, open, high, low, close, ticks)
+VALUES {{values}}
+ON CONFLICT (asset_id, resolution, start) DO UPDATE SET
+    high = GREATEST({_CANDLE_TABLE}.high, EXCLUDED.high),
+    low = LEAST({_CANDLE_TABLE}.low, EXCLUDED.low),
+    close = EXCLUDED.close,
+    ticks = {_CANDLE_TABLE}.ticks + EXCLUDED.ticks
+"""
+
+
+def _buffer_key(asset_id):
+    return f'{TICK_KEY_PREFIX}{asset_id}'
+
+
+def _count_key(asset_id):
+    return f'{TICK_KEY_PREFIX}{asset_id}:count'
+
+
+def _rolled_key(asset_id):
+    return f'{TICK_KEY_PREFIX}{asset_id}:rolled'
+
+
+def record_ticks(prices: dict, at=None):
+    """
+    Append one tick per asset, in one round trip.
+    :param prices: asset id -> exchange rate.
+    """
+    if not prices:
+        return
+    at = at or timezone.now()
+    ms = int(at.timestamp() * 1000)
+    pipeline = get_redis_connection('default').pipeline(transaction=False)
+    pipeline.sadd(TICK_ASSETS_KEY, *prices)
+    for asset_id, price in prices.items():
+        pipeline.eval(
+            _APPEND_SCRIPT,
+            2,
+            _buffer_key(asset_id),
+            _count_key(asset_id),
+            _TICK.pack(ms, float(price)),
+            TICK_BUFFER_SIZE,
+            _TICK.size,
+        )
+    pipeline.execute()
+
+
+def record_ticks_on_commit(prices: dict):
+    # Ticks of rates that were stored, a lost tick must never fail a write
+    def record():
+        try:
+            record_ticks(prices)
+        except Exception as e:
+            logger.warning(f"Could not record price ticks: {e}")
+
+    if prices:
+        transaction.on_commit(record)
+
+
+def _unpack(buffer, first, count):
+    # Ticks number first to count - 1 (0 being the first ever appended)
+    ticks = []
+    for number in range(first, count):
+        offset = (number % TICK_BUFFER_SIZE) * _TICK.size
+        ticks.append(_TICK.unpack_from(buffer, offset))
+    return ticks
+
+
+def read_ticks(asset_ids) -> dict:
+    """
+    Ticks not rolled up yet, oldest first, read in one consistent snapshot.
+    :return: asset id -> (list of (epoch ms, price), number of ticks appended).
+    """
+    pipeline = get_redis_connection('default').pipeline(transaction=True)
+    for asset_id in asset_ids:
+        pipeline.get(_count_key(asset_id))
+        pipeline.get(_rolled_key(asset_id))
+        pipeline.get(_buffer_key(asset_id))
+    values = pipeline.execute()
+
+    ticks = {}
+    for i, asset_id in enumerate(asset_ids):
+        count, rolled, buffer = values[i * 3 : i * 3 + 3]
+        count = int(count or 0)
+        rolled = int(rolled or 0)
+        first = max(rolled, count - TICK_BUFFER_SIZE)
+        if first > rolled:
+            logger.warning(
+                f"{first - rolled} ticks of {asset_id} were overwritten before "
+                f"being rolled up"
+            )
+        ticks[asset_id] = (_unpack(buffer or b'', first, count), count)
+    return ticks
+
+
+def build_candles(ticks) -> dict:
+    """
+    :param ticks: (epoch ms, price), oldest first.
+    :return: (resolution, period start in epoch ms) -> [open, high, low, close, ticks]
+    """
+    candles = {}
+    for ms, price in ticks:
+        for resolution, seconds in RESOLUTION_SECONDS.items():
+            start = ms - ms % (seconds * 1000)
+            candle = candles.get((resolution, start))
+            if candle is None:
+                candles[(resolution, start)] = [price, price, price, price, 1]
+            else:
+                candle[1] = max(candle[1], price)
+                candle[2] = min(candle[2], price)
+                candle[3] = price
+                candle[4] += 1
+    return candles
+
+
+def _to_decimal(price):
+    # Rounded to the stored 12 decimal places by the database
+    return Decimal(repr(price))
+
+
+def upsert_candles(rows: list):
+    # rows: (asset id, resolution, start, open, high, low, close, ticks)
+    with connection.cursor() as cursor:
+        for i in range(0, len(rows), CANDLE_BATCH_SIZE):
+            batch = rows[i : i + CANDLE_BATCH_SIZE]
+            values = ', '.join(['(%s, %s, %s, %s, %s, %s, %s, %s)'] * len(batch))
+            cursor.execute(
+                _UPSERT_CANDLES_SQL.format(values=values),
+                [value for row in batch for value in row],
+            )
+
+
+def rollup_ticks(asset_ids=None) -> int:
+    """
+    Merge the ticks appended since the last rollup into the 1m, 1h and 1d
+    candles of their assets, in batched upserts.
+    At least once: the rolled up positions are stored in Redis after the
+    candles commit, if that fails the next rollup merges the same ticks
+    again. Open, high, low and close come out the same, only the tick
+    counts of the candles grow twice.
+    :return: The number of ticks rolled up.
+    """
+    redis = get_redis_connection('default')
+    if asset_ids is None:
+        asset_ids = sorted(
+            asset_id.decode() for asset_id in redis.smembers(TICK_ASSETS_KEY)
+        )
+    ticks = read_ticks(asset_ids)
+    # Assets deleted since their ticks were recorded are dropped
+    existing = set(
+        Asset.objects.filter(id__in=list(ticks)).values_list('id', flat=True)
+    )
+
+    rows = []
+    for asset_id, (asset_ticks, _) in ticks.items():
+        if asset_id not in existing:
+            continue
+        for (resolution, start), candle in build_candles(asset_ticks).items():
+            rows.append(
+                (
+                    asset_id,
+                    resolution,
+                    datetime.fromtimestamp(start / 1000, tz=dt_timezone.utc),
+                    *map(_to_decimal, candle[:4]),
+                    candle[4],
+                )
+            )
+    with transaction.atomic():
+        upsert_candles(rows)
+
+    # Not in the database transaction, see above
+    pipeline = redis.pipeline(transaction=False)
+    for asset_id, (_, count) in ticks.items():
+        pipeline.set(_rolled_key(asset_id), count)
+    pipeline.execute()
+    return sum(len(asset_ticks) for asset_ticks, _ in ticks.values())
@@ -1,101 +1,266 @@
 from rest_framework import generics, status
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.exceptions import NotFound, PermissionDenied, ValidationError
+from rest_framework.pagination import Cursor, CursorPagination
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
-from .models import Transaction, Wallet
+from rest_framework.views import APIView
+from .metrics import query_budget
+from .models import Transaction
+from .permissions import (
+    EDITOR,
+    TransactionPermission,
+    request_wallet_roles,
+    wallet_role,
+)
 from .serializers import TransactionSerializer
-from django.core.exceptions import ObjectDoesNotExist
+from .balance import apply_balance_delta, apply_balance_deltas
+from .snapshots import record_transaction_changes
+from .transaction_export import (
+    CSV as CSV_EXPORT,
+    EXPORT_CONTENT_TYPES,
+    EXPORT_EXTENSIONS,
+    EXPORT_STREAMS,
+    iter_export_rows,
+)
+from .transaction_import import (
+    CSV,
+    NDJSON,
+    TransactionImporter,
+    iter_csv_rows,
+    iter_lines,
+    iter_ndjson_rows,
+)
+from collections import defaultdict
+from datetime import datetime, timezone
+from decimal import Decimal
+import csv
+from django.db import transaction
 from django.db.models import Q
+from django.http import StreamingHttpResponse
 import uuid
 
 
-@api_view(['GET'])
-@permission_classes([IsAuthenticated])
-def get_transactions(request, wallet_id):
-    # Validate that wallet_id is provided and is in UUID format
+class TransactionHistoryPagination(CursorPagination):
+    # Keyset pagination on (executed_at, id): every page is an index range
+    # scan on transaction_history_idx, however deep the cursor is.
+    # DRF's cursor only holds the first ordering field and skips the rows
+    # sharing it with an offset, the position here holds both fields so it
+    # is unique and the offset is never used.
+    ordering = ('-executed_at', 'id')
+    reverse_ordering = ('executed_at', '-id')
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        cursor = self.decode_cursor(request)
+        if cursor is None:
+            reverse, current_position = False, None
+        else:
+            reverse, current_position = cursor.reverse, cursor.position
+        self.cursor = Cursor(offset=0, reverse=reverse, position=current_position)
+
+        queryset = queryset.order_by(
+            *(self.reverse_ordering if reverse else self.ordering)
+        )
+        if current_position is not None:
+            queryset = self.filter_position(queryset, current_position, reverse)
+
+        # One more row tells whether a page follows
+        results = list(queryset[: self.page_size + 1])
+        self.page = results[: self.page_size]
+        if len(results) > len(self.page):
+            following_position = self._get_position_from_instance(
+                results[-1], self.ordering
+            )
+        else:
+            following_position = None
+
+        if reverse:
+            self.page.reverse()
+            self.has_next = current_position is not None
+            self.has_previous = following_position is not None
+            self.next_position = current_position
+            self.previous_position = following_position
+        else:
+            self.has_next = following_position is not None
+            self.has_previous = current_position is not None
+            self.next_position = following_position
+            self.previous_position = current_position
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+        return self.page
+
+    def filter_position(self, queryset, position, reverse):
+        # Rows after the position in the listing order (before it when
+        # paging backwards)
+        try:
+            executed_at, transaction_id = position.split('|')
+            executed_at = datetime.fromisoformat(executed_at)
+            transaction_id = uuid.UUID(transaction_id)
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+        if reverse:
+            return queryset.filter(
+                Q(executed_at__gt=executed_at)
+                | Q(executed_at=executed_at, id__lt=transaction_id)
+            )
+        return queryset.filter(
+            Q(executed_at__lt=executed_at)
+            | Q(executed_at=executed_at, id__gt=transaction_id)
+        )
+
+    def _get_position_from_instance(self, instance, ordering):
+        return f'{instance.executed_at.isoformat()}|{instance.id}'
+
+
+def parse_timestamp_param(value, name):
+    # Timestamps are exchanged in milliseconds, like in TransactionSerializer
     try:
-        uuid.UUID(wallet_id)
-    except ValueError:
-        return Response(
-            {'detail': 'Invalid wallet_id format. It should be a UUID.'},
-            status=status.HTTP_400_BAD_REQUEST,
+        return datetime.fromtimestamp(int(value) / 1000, tz=timezone.utc)
+    except (TypeError, ValueError, OverflowError, OSError):
+        raise ValidationError({name: 'Expected a timestamp in milliseconds.'})
+
+
+def split_list_param(value):
+    return [item for item in value.split(',') if item]
+
+
+def filter_transactions(transactions_query, params):
+    # ?category=food,rent
+    categories = split_list_param(params.get('category', ''))
+    if categories:
+        transactions_query = transactions_query.filter(category__in=categories)
+    # ?from=<ms>&to=<ms> (from inclusive, to exclusive)
+    if params.get('from'):
+        transactions_query = transactions_query.filter(
+            executed_at__gte=parse_timestamp_param(params['from'], 'from')
+        )
+    if params.get('to'):
+        transactions_query = transactions_query.filter(
+            executed_at__lt=parse_timestamp_param(params['to'], 'to')
         )
+    # ?tags=a,b matches transactions carrying all the given tags
+    tags = split_list_param(params.get('tags', ''))
+    if tags:
+        transactions_query = transactions_query.filter(tags__contains=tags)
+    return transactions_query
+
+
+def check_wallet_write(request, wallet):
+    # The wallet a transaction is written to, taken from the request body
+    if wallet_role(request, wallet.id) < EDITOR:
+        raise PermissionDenied("You do not have permission to update this wallet.")
+
+
+@query_budget(3)
+class TransactionHistoryView(generics.ListAPIView):
+    serializer_class = TransactionSerializer
+    permission_classes = [IsAuthenticated, TransactionPermission]
+    pagination_class = TransactionHistoryPagination
 
-    # Get the WalletUser objects associated with the authenticated user
-    transactions_query = Transaction.objects.filter(
-        Q(recipient=wallet_id) | Q(sender=wallet_id)
-    )
+    def list(self, request, *args, **kwargs):
+        # Validate that wallet_id is provided and is in UUID format
+        try:
+            uuid.UUID(kwargs['wallet_id'])
+        except ValueError:
+            return Response(
+                {'detail': 'Invalid wallet_id format. It should be a UUID.'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        return super().list(request, *args, **kwargs)
 
-    serialized_transactions = TransactionSerializer(transactions_query, many=True).data
-    return Response(serialized_transactions)
+    def get_queryset(self):
+        return filter_transactions(
+            Transaction.objects.filter(wallet_id=self.kwargs['wallet_id']),
+            self.request.query_params,
+        )
 
 
 class TransactionCreateView(generics.ListCreateAPIView):
-    queryset = Transaction.objects.all()
     serializer_class = TransactionSerializer
     permission_classes = [IsAuthenticated]
 
+    def get_queryset(self):
+        # Transactions of the wallets shared with the user
+        return Transaction.objects.filter(
+            wallet_id__in=list(request_wallet_roles(self.request))
+        )
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        check_wallet_write(request, serializer.validated_data['wallet'])
+        new_balance = self.perform_create(serializer)
+        data = dict(serializer.data)
+        if new_balance is not None:
+            data['new_balance'] = float(new_balance)
+        headers = self.get_success_headers(serializer.data)
+        return Response(data, status=status.HTTP_201_CREATED, headers=headers)
+
     def perform_create(self, serializer):
-        instance: Transaction = serializer.save()
         retro = self.request.query_params.get('retro')
-        if retro:
-            pass
-        else:
-            if instance.recipient != None:
-                try:
-                    recipient_wallet = Wallet.objects.get(id=instance.recipient)
-                    recipient_wallet.balance += instance.net_amount
-                    recipient_wallet.save()
-                except Wallet.DoesNotExist:
-                    pass
-                except ObjectDoesNotExist:
-                    pass
-            if instance.sender != None:
-                try:
-                    sender_wallet = Wallet.objects.get(id=instance.sender)
-                    sender_wallet.balance -= instance.net_amount
-                    sender_wallet.save()
-                except Wallet.DoesNotExist:
-                    pass
-                except ObjectDoesNotExist:
-                    pass
+        # The insert and the balance delta commit (or roll back) together
+        with transaction.atomic():
+            instance: Transaction = serializer.save()
+            record_transaction_changes(added=[instance])
+            # Retroactive entries are already reflected in the wallet balance
+            if retro:
+                return None
+            return apply_balance_delta(instance.wallet_id, instance.amount)
 
 
 class TransactionUpdateView(generics.RetrieveUpdateDestroyAPIView):
-    queryset = Transaction.objects.all()
     serializer_class = TransactionSerializer
-    permission_classes = [IsAuthenticated]
+    # Viewers read, editors write (public wallets can be read by anyone)
+    permission_classes = [IsAuthenticated, TransactionPermission]
+
+    def get_queryset(self):
+        if self.request.method in ('PUT', 'PATCH', 'DELETE'):
+            # Locked until the update commits, so two concurrent updates (or
+            # an update and a delete) of a transaction can't both move the
+            # balances from the same previous amount
+            return Transaction.objects.select_for_update()
+        return Transaction.objects.all()
 
     def update(self, request, *args, **kwargs):
         partial = kwargs.pop('partial', False)
-        instance = self.get_object()
-        serializer = self.get_serializer(instance, data=request.data, partial=partial)
-        serializer.is_valid(raise_exception=True)
-
+        retro = request.query_params.get('retro')
         new_balance = None
 
-        # Before saving, check if confirmed_by_recipient or confirmed_by_sender is updated
-        if 'confirmed_by_recipient' in request.data and instance.recipient:
-            if request.data['confirmed_by_recipient']:
-                new_balance = instance.recipient.balance + instance.net_amount
-                instance.recipient.balance = new_balance
-                instance.recipient.save()
-            else:
-                new_balance = instance.recipient.balance - instance.net_amount
-                instance.recipient.balance = new_balance
-                instance.recipient.save()
-
-        if 'confirmed_by_sender' in request.data and instance.sender:
-            if request.data['confirmed_by_sender']:
-                new_balance = instance.sender.balance - instance.net_amount
-                instance.sender.balance = new_balance
-                instance.sender.save()
-            else:
-                new_balance = instance.sender.balance + instance.net_amount
-                instance.sender.balance = new_balance
-                instance.sender.save()
-
-        self.perform_update(serializer)
+        with transaction.atomic():
+            instance: Transaction = self.get_object()
+            serializer = self.get_serializer(
+                instance, data=request.data, partial=partial
+            )
+            serializer.is_valid(raise_exception=True)
+            if 'wallet' in serializer.validated_data:
+                check_wallet_write(request, serializer.validated_data['wallet'])
+
+            previous_wallet_id, previous_amount = instance.wallet_id, instance.amount
+            previous = Transaction(
+                wallet_id=instance.wallet_id,
+                executed_at=instance.executed_at,
+                category=instance.category,
+                amount=instance.amount,
+            )
+
+            self.perform_update(serializer)
+            record_transaction_changes(added=[instance], removed=[previous])
+            # Move the difference between the previous and the new amount
+            # (or the whole amount if the wallet changed) to the balances
+            if not retro:
+                deltas = defaultdict(Decimal)
+                deltas[previous_wallet_id] -= previous_amount
+                deltas[instance.wallet_id] += instance.amount
+                new_balances = apply_balance_deltas(deltas)
+                new_balance = new_balances.get(instance.wallet_id)
 
         if getattr(instance, '_prefetched_objects_cache', None):
             # If 'prefetch_related' has been applied to a queryset, we need to
@@ -108,3 +273,133 @@ class TransactionUpdateView(generics.RetrieveUpdateDestroyAPIView):
             data['new_balance'] = float(new_balance)
 
         return Response(data)
+
+    def destroy(self, request, *args, **kwargs):
+        retro = request.query_params.get('retro')
+        new_balance = None
+
+        with transaction.atomic():
+            instance: Transaction = self.get_object()
+            self.perform_destroy(instance)
+            # Take the amount back out of the balance
+            if not retro:
+                new_balance = apply_balance_delta(instance.wallet_id, -instance.amount)
+
+        if new_balance is None:
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        return Response({'new_balance': float(new_balance)})
+
+    def perform_destroy(self, instance):
+        instance.delete()
+        record_transaction_changes(removed=[instance])
+
+
+class TransactionImportView(APIView):
+    """
+    Bulk import of transactions from a CSV (with a header row) or NDJSON upload,
+    either as the raw request body or as the "file" field of a multipart form.
+    Columns: wallet, amount, category, description, executed_at, settled_at, tags
+    ?file_format=csv|ndjson (guessed from the content type by default)
+    ?wallet=<uuid> is used for the rows without a wallet
+    ?partial=1 imports the valid rows even if some fail (all or nothing by default)
+    ?retro=1 leaves the wallet balances untouched
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        params = request.query_params
+        default_wallet_id = params.get('wallet')
+        if default_wallet_id:
+            try:
+                default_wallet_id = uuid.UUID(default_wallet_id)
+            except ValueError:
+                return Response(
+                    {'detail': 'Invalid wallet format. It should be a UUID.'},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+
+        content_type = request.content_type or ''
+        if content_type.startswith('multipart/form-data'):
+            upload = request.FILES.get('file')
+            if upload is None:
+                return Response(
+                    {'detail': 'The "file" field is required.'},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            stream, content_type = upload, upload.content_type or ''
+        else:
+            # Read straight from the request, the body is never loaded at once
+            stream = request.stream
+            if stream is None:
+                return Response(
+                    {'detail': 'The request body is empty.'},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+
+        upload_format = params.get('file_format') or (
+            NDJSON if 'ndjson' in content_type or 'jsonl' in content_type else CSV
+        )
+        if upload_format not in (CSV, NDJSON):
+            return Response(
+                {'detail': 'Unsupported format. It should be csv or ndjson.'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        iter_rows = iter_csv_rows if upload_format == CSV else iter_ndjson_rows
+
+        importer = TransactionImporter(
+            request.user,
+            default_wallet_id=default_wallet_id or None,
+            retro=bool(params.get('retro')),
+            partial=bool(params.get('partial')),
+        )
+        try:
+            report = importer.run(iter_rows(iter_lines(stream)))
+        except UnicodeDecodeError:
+            return Response(
+                {'detail': 'The upload should be encoded in UTF-8.'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        except csv.Error as e:
+            return Response(
+                {'detail': f'Malformed CSV: {e}'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        return Response(
+            report.as_dict(),
+            status=(
+                status.HTTP_201_CREATED
+                if report.imported or not report.failed
+                else status.HTTP_400_BAD_REQUEST
+            ),
+        )
+
+
+class TransactionExportView(APIView):
+    """
+    Stream the history of a wallet, oldest first, without loading it in memory.
+    ?file_format=csv|ndjson|columnar (csv by default, see core.lib.columnar)
+    ("format" is taken by the renderer negotiation of DRF)
+    Accepts the same filters as TransactionHistoryView.
+    """
+
+    permission_classes = [IsAuthenticated, TransactionPermission]
+
+    def get(self, request, wallet_id, *args, **kwargs):
+        export_format = request.query_params.get('file_format', CSV_EXPORT)
+        if export_format not in EXPORT_STREAMS:
+            return Response(
+                {'detail': 'Unsupported format. It should be csv, ndjson or columnar.'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        transactions_query = filter_transactions(
+            Transaction.objects.filter(wallet_id=wallet_id), request.query_params
+        ).order_by('executed_at', 'id')
+        response = StreamingHttpResponse(
+            EXPORT_STREAMS[export_format](iter_export_rows(transactions_query)),
+            content_type=EXPORT_CONTENT_TYPES[export_format],
+        )
+        filename = f'transactions_{wallet_id}.{EXPORT_EXTENSIONS[export_format]}'
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
@@ -0,0 +1,124 @@
+import csv
+import io
+import json
+from .lib.columnar import (
+    DECIMAL,
+    DICT_STRING,
+    INT64,
+    STRING,
+    STRING_LIST,
+    UUID,
+    ColumnarWriter,
+)
+from .models import Transaction
+
+CSV = 'csv'
+NDJSON = 'ndjson'
+COLUMNAR = 'columnar'
+
+EXPORT_CONTENT_TYPES = {
+    CSV: 'text/csv; charset=utf-8',
+    NDJSON: 'application/x-ndjson',
+    COLUMNAR: 'application/octet-stream',
+}
+EXPORT_EXTENSIONS = {CSV: 'csv', NDJSON: 'ndjson', COLUMNAR: 'kbcl'}
+
+# Rows fetched per round trip of the server-side cursor
+EXPORT_FETCH_SIZE = 2000
+# Rows buffered into one chunk of the response (and one columnar block,
+# which must hold less than 65536 rows)
+EXPORT_BLOCK_SIZE = 4096
+
+EXPORT_FIELDS = [
+    'id',
+    'origin_id',
+    'executed_at',
+    'settled_at',
+    'category',
+    'description',
+    'amount',
+    'tags',
+]
+EXPORT_COLUMNS = ['id', 'origin', *EXPORT_FIELDS[2:]]
+
+COLUMNAR_COLUMNS = [
+    ('id', UUID),
+    ('origin', UUID),
+    ('executed_at', INT64),
+    ('settled_at', INT64),
+    ('category', DICT_STRING),
+    ('description', STRING),
+    ('amount', DECIMAL, Transaction._meta.get_field('amount').decimal_places),
+    ('tags', STRING_LIST),
+]
+
+
+def to_milliseconds(value):
+    # Timestamps are exchanged in milliseconds, like in TransactionSerializer
+    return None if value is None else int(value.timestamp() * 1000)
+
+
+def iter_export_rows(queryset):
+    """
+    Stream the rows of a transaction queryset through a server-side cursor,
+    as tuples in the order of EXPORT_FIELDS, with timestamps in milliseconds.
+    """
+    for id, origin_id, executed_at, settled_at, *rest in queryset.values_list(
+        *EXPORT_FIELDS
+    ).iterator(chunk_size=EXPORT_FETCH_SIZE):
+        yield (
+            id,
+            origin_id,
+            to_milliseconds(executed_at),
+            to_milliseconds(settled_at),
+            *rest,
+        )
+
+
+def _blocks(rows):
+    block = []
+    for row in rows:
+        block.append(row)
+        if len(block) >= EXPORT_BLOCK_SIZE:
+            yield block
+            block = []
+    if block:
+        yield block
+
+
+def stream_csv(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    for block in _blocks(rows):
+        # None is written as an empty value, tags use the separator of the import
+        writer.writerows((*row[:-1], '|'.join(row[-1])) for row in block)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def stream_ndjson(rows):
+    for block in _blocks(rows):
+        # Ids and amounts are written as strings, so no precision is lost
+        yield ''.join(
+            json.dumps(dict(zip(EXPORT_COLUMNS, row)), default=str) + '\n'
+            for row in block
+        ).encode('utf-8')
+
+
+def stream_columnar(rows):
+    writer = ColumnarWriter(COLUMNAR_COLUMNS)
+    yield writer.header()
+    for block in _blocks(rows):
+        yield writer.block(block)
+    yield writer.footer()
+
+
+EXPORT_STREAMS = {
+    CSV: stream_csv,
+    NDJSON: stream_ndjson,
+    COLUMNAR: stream_columnar,
+}
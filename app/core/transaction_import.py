@@ -0,0 +1,354 @@
+import codecs
+import csv
+import io
+import json
+import uuid
+from collections import defaultdict
+from datetime import datetime, timezone
+from decimal import Decimal, InvalidOperation
+from functools import partial
+from django.db import connection, transaction
+from django.utils import timezone as django_timezone
+from .balance import apply_balance_deltas
+from .permissions import EDITOR, get_wallet_roles
+from .snapshots import rebuild_wallet_snapshots
+from .models import Transaction
+
+CSV = 'csv'
+NDJSON = 'ndjson'
+
+# Rows are validated and inserted this many at a time, so memory use only
+# depends on the chunk size, not on the size of the upload
+IMPORT_CHUNK_SIZE = 2000
+READ_CHUNK_SIZE = 64 * 1024
+MAX_REPORTED_ERRORS = 1000
+# Editors and above can write transactions of a wallet
+IMPORT_MIN_ROLE = EDITOR
+
+# Limits of the Transaction fields
+AMOUNT_MAX_DIGITS = 19
+AMOUNT_DECIMAL_PLACES = 8
+CATEGORY_MAX_LENGTH = 32
+DESCRIPTION_MAX_LENGTH = 200
+TAG_MAX_LENGTH = 24
+# Separator of the tags in a CSV cell, e.g. "rent|home"
+CSV_TAG_SEPARATOR = '|'
+
+
+class RowError(Exception):
+    pass
+
+
+def iter_lines(stream, encoding='utf-8-sig'):
+    """
+    Decode a binary stream into lines (ending included) while reading it
+    in fixed-size chunks.
+    """
+    decoder = codecs.getincrementaldecoder(encoding)(errors='strict')
+    pending = ''
+    while True:
+        chunk = stream.read(READ_CHUNK_SIZE)
+        if not chunk:
+            break
+        pending += decoder.decode(chunk)
+        lines = pending.split('\n')
+        pending = lines.pop()
+        for line in lines:
+            yield line + '\n'
+    pending += decoder.decode(b'', final=True)
+    if pending:
+        yield pending
+
+
+def iter_csv_rows(lines):
+    # Yields (row number, dict), the header row gives the field names
+    for number, row in enumerate(csv.DictReader(lines), start=1):
+        if None in row:
+            yield number, RowError('Too many values for the header.')
+        else:
+            yield number, row
+
+
+def iter_ndjson_rows(lines):
+    number = 0
+    for line in lines:
+        if not line.strip():
+            continue
+        number += 1
+        try:
+            row = json.loads(line)
+        except ValueError:
+            yield number, RowError('Invalid JSON.')
+            continue
+        if not isinstance(row, dict):
+            yield number, RowError('Expected a JSON object.')
+            continue
+        yield number, row
+
+
+def parse_amount(value):
+    try:
+        amount = Decimal(str(value).strip())
+    except (InvalidOperation, ValueError):
+        raise RowError('A valid number is required.')
+    if not amount.is_finite():
+        raise RowError('A valid number is required.')
+    _, digits, exponent = amount.as_tuple()
+    if -exponent > AMOUNT_DECIMAL_PLACES:
+        raise RowError(f'At most {AMOUNT_DECIMAL_PLACES} decimal places are allowed.')
+    # Digits left of the point, counting the zeros of a positive exponent
+    if amount and len(digits) + exponent > AMOUNT_MAX_DIGITS - AMOUNT_DECIMAL_PLACES:
+        raise RowError('The number is too large.')
+    return amount
+
+
+def parse_timestamp(value):
+    # Milliseconds since the epoch, like in TransactionSerializer, or ISO 8601
+    if isinstance(value, (int, float)) or str(value).strip().lstrip('-').isdigit():
+        try:
+            return datetime.fromtimestamp(int(value) / 1000, tz=timezone.utc)
+        except (ValueError, OverflowError, OSError):
+            raise RowError('Invalid timestamp.')
+    try:
+        parsed = datetime.fromisoformat(str(value).strip())
+    except ValueError:
+        raise RowError('Expected milliseconds or an ISO 8601 date.')
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
+def parse_text(value, max_length):
+    value = '' if value is None else str(value)
+    if len(value) > max_length:
+        raise RowError(f'Ensure this field has no more than {max_length} characters.')
+    return value
+
+
+def parse_tags(value):
+    if value in (None, ''):
+        return []
+    if isinstance(value, str):
+        value = value.split(CSV_TAG_SEPARATOR)
+    if not isinstance(value, list):
+        raise RowError('Expected a list of tags.')
+    tags = [str(tag).strip() for tag in value if str(tag).strip()]
+    if any(len(tag) > TAG_MAX_LENGTH for tag in tags):
+        raise RowError(
+            f'Ensure every tag has no more than {TAG_MAX_LENGTH} characters.'
+        )
+    return tags
+
+
+def parse_wallet(value):
+    try:
+        return uuid.UUID(str(value).strip())
+    except ValueError:
+        raise RowError('Invalid wallet id format. It should be a UUID.')
+
+
+def _is_blank(value):
+    return value is None or (isinstance(value, str) and not value.strip())
+
+
+FIELD_PARSERS = {
+    'wallet': parse_wallet,
+    'amount': parse_amount,
+    'category': partial(parse_text, max_length=CATEGORY_MAX_LENGTH),
+    'description': partial(parse_text, max_length=DESCRIPTION_MAX_LENGTH),
+    'executed_at': parse_timestamp,
+    'settled_at': parse_timestamp,
+    'tags': parse_tags,
+}
+REQUIRED_FIELDS = {'wallet', 'amount', 'category'}
+
+
+def validate_row(row: dict, default_wallet_id=None):
+    """
+    Validate an imported row, unknown columns are ignored.
+    :param default_wallet_id: Used when the row has no wallet.
+    :return: The Transaction field values, with the wallet under "wallet_id".
+    :raise RowError: With the errors of the row keyed by field.
+    """
+    values = {}
+    errors = {}
+    for field, parse in FIELD_PARSERS.items():
+        value = row.get(field)
+        if _is_blank(value):
+            if field == 'wallet' and default_wallet_id is not None:
+                values[field] = default_wallet_id
+            elif field in REQUIRED_FIELDS:
+                errors[field] = 'This field is required.'
+            continue
+        try:
+            values[field] = parse(value)
+        except RowError as e:
+            errors[field] = str(e)
+
+    if errors:
+        raise RowError(errors)
+    values['wallet_id'] = values.pop('wallet')
+    return values
+
+
+# Chunks are written with COPY: building an INSERT of thousands of model
+# instances costs several times more than the database takes to store them.
+# Empty unquoted CSV values are NULL, except for the NOT NULL text columns.
+_COPY_FIELDS = [
+    'id',
+    'wallet',
+    'executed_at',
+    'settled_at',
+    'category',
+    'description',
+    'amount',
+    'tags',
+]
+_COPY_SQL = """
+COPY "{table}" ({columns}) FROM STDIN
+WITH (FORMAT csv, FORCE_NOT_NULL ({text_columns}))
+""".format(
+    table=Transaction._meta.db_table,
+    columns=', '.join(
+        f'"{Transaction._meta.get_field(field).column}"' for field in _COPY_FIELDS
+    ),
+    text_columns=', '.join(
+        f'"{Transaction._meta.get_field(field).column}"'
+        for field in ('category', 'description')
+    ),
+)
+
+
+def _array_literal(items):
+    escaped = (item.replace('\\', '\\\\').replace('"', '\\"') for item in items)
+    return '{' + ','.join(f'"{item}"' for item in escaped) + '}'
+
+
+def copy_transactions(rows: list):
+    """
+    Insert validated rows (see validate_row) with a single COPY statement.
+    """
+    now = django_timezone.now()
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for values in rows:
+        settled_at = values.get('settled_at')
+        writer.writerow(
+            [
+                uuid.uuid4(),
+                values['wallet_id'],
+                values.get('executed_at', now).isoformat(),
+                settled_at.isoformat() if settled_at else None,
+                values['category'],
+                values.get('description', ''),
+                values['amount'],
+                _array_literal(values.get('tags', [])),
+            ]
+        )
+    buffer.seek(0)
+    with connection.cursor() as cursor:
+        cursor.copy_expert(_COPY_SQL, buffer)
+
+
+class ImportReport:
+    def __init__(self):
+        self.imported = 0
+        self.failed = 0
+        self.errors = []
+        self.new_balances = {}
+
+    def add_error(self, number, errors):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'row': number, 'errors': errors})
+
+    def as_dict(self):
+        return {
+            'imported': self.imported,
+            'failed': self.failed,
+            # Only the first MAX_REPORTED_ERRORS failures are detailed
+            'errors': sorted(self.errors, key=lambda error: error['row']),
+            'new_balances': {
+                str(wallet_id): float(balance)
+                for wallet_id, balance in self.new_balances.items()
+            },
+        }
+
+
+class TransactionImporter:
+    """
+    Import transactions from an iterator of (row number, row) in chunks.
+    Every chunk is validated, checked against the roles of the user (see
+    permissions.get_wallet_roles), then inserted with a single COPY.
+    The balances get one aggregated delta per wallet at the end, and the
+    daily snapshots of the wallets are rebuilt.
+    """
+
+    def __init__(self, user, default_wallet_id=None, retro=False, partial=False):
+        self.user = user
+        self.default_wallet_id = default_wallet_id
+        self.retro = retro
+        self.partial = partial
+        self.roles = get_wallet_roles(user.id)
+        self.deltas = defaultdict(Decimal)
+        self.report = ImportReport()
+
+    def import_chunk(self, chunk):
+        validated = []
+        for number, row in chunk:
+            try:
+                if isinstance(row, RowError):
+                    raise row
+                validated.append(
+                    (
+                        number,
+                        validate_row(row, default_wallet_id=self.default_wallet_id),
+                    )
+                )
+            except RowError as e:
+                errors = e.args[0]
+                if not isinstance(errors, dict):
+                    errors = {'non_field_errors': errors}
+                self.report.add_error(number, errors)
+
+        allowed = []
+        for number, values in validated:
+            if self.roles.get(values['wallet_id'], 0) < IMPORT_MIN_ROLE:
+                self.report.add_error(
+                    number,
+                    {'wallet': 'You do not have permission to write to this wallet.'},
+                )
+                continue
+            allowed.append(values)
+            self.deltas[values['wallet_id']] += values['amount']
+
+        if allowed:
+            copy_transactions(allowed)
+            self.report.imported += len(allowed)
+
+    def run(self, rows) -> ImportReport:
+        """
+        :param rows: Iterator of (row number, row dict or RowError).
+        Without partial, nothing is written if a single row fails.
+        """
+        with transaction.atomic():
+            chunk = []
+            for item in rows:
+                chunk.append(item)
+                if len(chunk) >= IMPORT_CHUNK_SIZE:
+                    self.import_chunk(chunk)
+                    chunk = []
+            if chunk:
+                self.import_chunk(chunk)
+
+            if self.report.failed and not self.partial:
+                transaction.set_rollback(True)
+                self.report.imported = 0
+                return self.report
+            # A set-based rebuild beats thousands of per-day snapshot updates
+            if self.report.imported:
+                rebuild_wallet_snapshots(self.deltas.keys())
+            # Retroactive entries are already reflected in the wallet balances
+            if not self.retro:
+                self.report.new_balances = apply_balance_deltas(self.deltas)
+        return self.report
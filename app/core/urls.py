@@ -3,14 +3,28 @@ from core.api.users import search_users, check_user
 from core.transaction_api import (
     TransactionCreateView,
     TransactionUpdateView,
-    get_transactions,
+    TransactionHistoryView,
+    TransactionImportView,
+    TransactionExportView,
 )
 from .wallet_api import (
     get_wallets,
     get_wallet_owner,
+    get_wallet_history,
     WalletCreateView,
     WalletUpdateView,
 )
+from .market_api import (
+    get_assets,
+    get_economic_indexes,
+    get_index_history,
+    get_asset_history,
+    get_asset_candles,
+)
+from .portfolio_api import get_portfolio_summary
+from .analytics_api import get_spending
+from .valuation_api import get_valuation
+from .metrics_api import view_metrics
 from .utils import NegativeIntConverter
 from .healthcheck import ping
 from .views import (
@@ -44,11 +58,23 @@ urlpatterns = [
     #    name="get_wallets",
     # ),
     path(
-        'get_transactions/<str:wallet_id>/', get_transactions, name="get_transactions"
+        'get_transactions/<str:wallet_id>/',
+        TransactionHistoryView.as_view(),
+        name="get_transactions",
     ),
     path(
         'transaction/', TransactionCreateView.as_view(), name='transaction-list-create'
     ),
+    path(
+        'transaction/import/',
+        TransactionImportView.as_view(),
+        name='transaction-import',
+    ),
+    path(
+        'transaction/export/<uuid:wallet_id>/',
+        TransactionExportView.as_view(),
+        name='transaction-export',
+    ),
     path(
         'transaction/<uuid:pk>/',
         TransactionUpdateView.as_view(),
@@ -58,10 +84,24 @@ urlpatterns = [
     path('wallet/', WalletCreateView.as_view(), name='wallet-list-create'),
     path('wallet/<uuid:pk>/', WalletUpdateView.as_view(), name='wallet-rud'),
     path('wallet/get_owner/<uuid:pk>/', get_wallet_owner, name="get_wallet_owner"),
+    path(
+        'wallet/history/<uuid:wallet_id>/',
+        get_wallet_history,
+        name="get_wallet_history",
+    ),
     path('get_wallets/', get_wallets, name="get_wallets_no_params"),
     path('get_wallets/<str:role>/', get_wallets, name="get_wallets_role"),
     path(
         'get_wallets/<str:role>/<negint:range>/', get_wallets, name="get_wallets_both"
     ),
     path('check_user/', check_user, name="check_user"),
+    path('assets/', get_assets, name="get_assets"),
+    path('economic_indexes/', get_economic_indexes, name="get_economic_indexes"),
+    path('index_history/<str:series>/', get_index_history, name="get_index_history"),
+    path('asset_history/<str:asset_id>/', get_asset_history, name="get_asset_history"),
+    path('asset_candles/<str:asset_id>/', get_asset_candles, name="get_asset_candles"),
+    path('portfolio/', get_portfolio_summary, name="get_portfolio_summary"),
+    path('analytics/spending/', get_spending, name="get_spending"),
+    path('valuation/', get_valuation, name="get_valuation"),
+    path('metrics/', view_metrics, name="view_metrics"),
 ]
@@ -0,0 +1,70 @@
+from django.db import connection
+from .models import KeiboUser
+
+SEARCH_LIMIT = 10
+SEARCH_MAX_LIMIT = 50
+# pg_trgm can't narrow down shorter keywords with its index
+MIN_TRIGRAM_LENGTH = 3
+
+_USER_TABLE = KeiboUser._meta.db_table
+_RESULT_COLUMNS = ['id', 'email', 'first_name', 'last_name', 'avatar']
+
+# Emails are stored lowercased. Walks user_email_prefix_idx in order, so
+# it stops after `limit` rows however many users share the prefix.
+_PREFIX_SQL = f"""
+SELECT {', '.join(_RESULT_COLUMNS)} FROM "{_USER_TABLE}"
+WHERE is_active AND email COLLATE "C" LIKE %(prefix)s
+ORDER BY email COLLATE "C"
+LIMIT %(limit)s
+"""
+
+# Substring or similar matches on the email and names, each condition
+# served by a pg_trgm GIN index, best similarity first
+_RANKED_SQL = f"""
+SELECT {', '.join(_RESULT_COLUMNS)} FROM "{_USER_TABLE}"
+WHERE is_active AND (
+    email LIKE %(contains)s OR email %% %(keyword)s
+    OR first_name ILIKE %(contains)s OR first_name %% %(keyword)s
+    OR last_name ILIKE %(contains)s OR last_name %% %(keyword)s
+)
+ORDER BY GREATEST(
+    similarity(email, %(keyword)s),
+    similarity(first_name, %(keyword)s),
+    similarity(last_name, %(keyword)s)
+) DESC, email
+LIMIT %(limit)s
+"""
+
+
+def escape_like(value):
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def _fetch(sql, params) -> list:
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [dict(zip(_RESULT_COLUMNS, row)) for row in cursor.fetchall()]
+
+
+def search_users(keyword, limit=SEARCH_LIMIT) -> list:
+    """
+    Active users matching a keyword, at most `limit` of them: the ones
+    whose email starts with it in email order, then (for keywords long
+    enough) the ones containing it or close to it in email or names.
+    :return: Dicts with the columns of _RESULT_COLUMNS.
+    """
+    keyword = keyword.strip().lower()
+    if not keyword:
+        return []
+    escaped = escape_like(keyword)
+    users = _fetch(_PREFIX_SQL, {'prefix': f'{escaped}%', 'limit': limit})
+    if len(users) >= limit or len(keyword) < MIN_TRIGRAM_LENGTH:
+        return users
+
+    found = {user['id'] for user in users}
+    ranked = _fetch(
+        _RANKED_SQL,
+        {'keyword': keyword, 'contains': f'%{escaped}%', 'limit': limit},
+    )
+    users.extend(user for user in ranked if user['id'] not in found)
+    return users[:limit]
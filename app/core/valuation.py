@@ -0,0 +1,249 @@
+from datetime import date
+from typing import Optional
+import numpy as np
+from django.db import connection
+from django.utils import timezone
+from .api_index import INFLATION_BY_CURRENCY
+from .cache import ASSETS, ECONOMIC_INDEXES, get_asset, memoized
+from .models import (
+    AssetPrice,
+    EconomicIndexObservation,
+    Transaction,
+    Wallet,
+    WalletDailySnapshot,
+    WalletUser,
+)
+
+USD = 'usd'
+
+# Transactions of a user as two arrays per asset of their wallets (one round
+# trip): amount and UTC day number since the epoch
+_TRANSACTION_COLUMNS_SQL = """
+SELECT
+    w.asset_id,
+    array_agg(t.amount::float8),
+    array_agg(FLOOR(EXTRACT(EPOCH FROM t.executed_at) / 86400)::int)
+FROM "{transaction}" t
+JOIN "{wallet_user}" wu ON wu.wallet_id = t.wallet_id
+JOIN "{wallet}" w ON w.id = t.wallet_id
+WHERE wu.user_id = %s AND t.executed_at >= %s AND t.executed_at < %s
+GROUP BY w.asset_id
+""".format(
+    transaction=Transaction._meta.db_table,
+    wallet_user=WalletUser._meta.db_table,
+    wallet=Wallet._meta.db_table,
+)
+
+# Balance of the wallets of a user at the end of a day: the latest snapshot
+# up to that day, plus what the snapshots don't hold (see get_wallet_history)
+_BALANCES_SQL = """
+SELECT
+    w.id, w.asset_id,
+    (w.balance - COALESCE(latest.closing_balance, 0)
+        + COALESCE(on_day.closing_balance, 0))::float8
+FROM "{wallet}" w
+JOIN "{wallet_user}" wu ON wu.wallet_id = w.id
+LEFT JOIN LATERAL (
+    SELECT s.closing_balance FROM "{snapshot}" s
+    WHERE s.wallet_id = w.id ORDER BY s.date DESC LIMIT 1
+) latest ON TRUE
+LEFT JOIN LATERAL (
+    SELECT s.closing_balance FROM "{snapshot}" s
+    WHERE s.wallet_id = w.id AND s.date <= %s ORDER BY s.date DESC LIMIT 1
+) on_day ON TRUE
+WHERE wu.user_id = %s
+ORDER BY w.id
+""".format(
+    wallet=Wallet._meta.db_table,
+    wallet_user=WalletUser._meta.db_table,
+    snapshot=WalletDailySnapshot._meta.db_table,
+)
+
+
+def day_number(day: date) -> int:
+    # Days since 1970-01-01
+    return int(np.datetime64(day, 'D').astype(np.int64))
+
+
+class StepTable:
+    """
+    Values of a series between its observation dates: the value at a day is
+    the one of the latest observation up to that day, or the first one
+    before the first observation. Looked up with a binary search.
+    """
+
+    def __init__(self, days: np.ndarray, values: np.ndarray):
+        self.days = days
+        self.values = values
+
+    @classmethod
+    def from_rows(cls, rows):
+        # rows: (date, value) ordered by date
+        return cls(
+            np.array([day_number(day) for day, _ in rows], dtype=np.int64),
+            np.array([float(value) for _, value in rows], dtype=np.float64),
+        )
+
+    def at(self, days):
+        positions = np.searchsorted(self.days, days, side='right') - 1
+        return self.values[np.clip(positions, 0, None)]
+
+
+def _build_deflator(series) -> Optional[StepTable]:
+    rates = StepTable.from_rows(
+        EconomicIndexObservation.objects.filter(series=series)
+        .order_by('date')
+        .values_list('date', 'value')
+    )
+    if not len(rates.days):
+        return None
+    # Price level at the end of each observed year, the first one being 1 + rate
+    return StepTable(rates.days, np.cumprod(1 + rates.values / 100))
+
+
+def get_deflator(series) -> Optional[StepTable]:
+    """
+    Cumulative price level of an annual inflation series (in %), built once
+    per process until the economic indexes change.
+    :return: None when the series has no observation.
+    """
+    return memoized(
+        ECONOMIC_INDEXES, f'deflator:{series}', lambda: _build_deflator(series)
+    )
+
+
+def _build_fx(asset_id) -> Optional[StepTable]:
+    if asset_id == USD:
+        return StepTable(np.zeros(1, dtype=np.int64), np.ones(1))
+    prices = StepTable.from_rows(
+        AssetPrice.objects.filter(asset_id=asset_id)
+        .order_by('date')
+        .values_list('date', 'exchange_rate')
+    )
+    if len(prices.days):
+        return prices
+    # No history yet, the current rate applies to any day
+    asset = get_asset(asset_id)
+    if asset is None or not asset['exchange_rate']:
+        return None
+    return StepTable(
+        np.zeros(1, dtype=np.int64), np.array([float(asset['exchange_rate'])])
+    )
+
+
+def get_fx(asset_id) -> Optional[StepTable]:
+    """
+    Daily closing USD value of one unit of an asset, built once per process
+    until the exchange rates change.
+    :return: None for an unknown asset.
+    """
+    return memoized(ASSETS, f'fx:{asset_id}', lambda: _build_fx(asset_id))
+
+
+class MissingRate(ValueError):
+    pass
+
+
+class Valuation:
+    """
+    Converts amounts of an asset, each at its own day, into a currency at
+    the exchange rates of that day, in one vectorized pass per asset. In real terms, the results are then
+    expressed in prices of `prices_of` with the inflation series of the
+    currency.
+    :raise ValueError: For an unknown currency, or real terms in a currency
+    without inflation series.
+    """
+
+    def __init__(self, currency=USD, real=True, prices_of: date = None):
+        self.currency = currency
+        self.fx = get_fx(currency)
+        if self.fx is None:
+            raise ValueError(f'Unsupported currency: {currency}.')
+        self.deflator = None
+        if real:
+            series = INFLATION_BY_CURRENCY.get(currency)
+            self.deflator = get_deflator(series) if series else None
+            if self.deflator is None:
+                raise ValueError(f'No inflation series for {currency}.')
+        self.prices_of = prices_of or timezone.now().date()
+
+    def convert(self, amounts, days, asset_id) -> np.ndarray:
+        """
+        :param amounts: Amounts in units of the asset.
+        :param days: Day number (see day_number) of each amount.
+        :raise MissingRate: When the asset has no exchange rate.
+        """
+        days = np.asarray(days, dtype=np.int64)
+        values = np.array(amounts, dtype=np.float64)
+        if asset_id != self.currency:
+            fx = get_fx(asset_id)
+            if fx is None:
+                raise MissingRate(f'No exchange rate for {asset_id}.')
+            values *= fx.at(days) / self.fx.at(days)
+        if self.deflator is not None:
+            price_level = self.deflator.at(day_number(self.prices_of))
+            values *= price_level / self.deflator.at(days)
+        return values
+
+
+def load_transaction_columns(user_id, since: date, until: date) -> dict:
+    # asset id -> (amounts, day numbers) of the transactions in [since, until)
+    with connection.cursor() as cursor:
+        cursor.execute(_TRANSACTION_COLUMNS_SQL, [user_id, since, until])
+        return {
+            asset_id: (
+                np.array(amounts, dtype=np.float64),
+                np.array(days, dtype=np.int64),
+            )
+            for asset_id, amounts, days in cursor.fetchall()
+        }
+
+
+def value_transactions(user_id, valuation: Valuation, since: date, until: date):
+    """
+    Inflow and outflow of the transactions of a user executed between two
+    days (both inclusive), each valued on the day it was executed.
+    Transactions in an asset without exchange rate are only counted as
+    "unvalued".
+    """
+    columns = load_transaction_columns(
+        user_id, since, date.fromordinal(until.toordinal() + 1)
+    )
+    totals = {'count': 0, 'unvalued': 0, 'inflow': 0.0, 'outflow': 0.0}
+    for asset_id, (amounts, days) in columns.items():
+        totals['count'] += len(amounts)
+        try:
+            values = valuation.convert(amounts, days, asset_id)
+        except MissingRate:
+            totals['unvalued'] += len(amounts)
+            continue
+        totals['inflow'] += float(values[values > 0].sum())
+        totals['outflow'] -= float(values[values < 0].sum())
+    return totals
+
+
+def _value_balance(valuation: Valuation, balance, day, asset_id):
+    try:
+        return float(valuation.convert([balance], [day], asset_id)[0])
+    except MissingRate:
+        return None
+
+
+def value_balances(user_id, valuation: Valuation, day: date) -> list:
+    """
+    Balances of the wallets of a user at the end of a day, valued that day
+    (None for a wallet in an asset without exchange rate).
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(_BALANCES_SQL, [day, user_id])
+        rows = cursor.fetchall()
+    day = day_number(day)
+    return [
+        {
+            'id': str(wallet_id),
+            'asset': asset_id,
+            'balance': balance,
+            'value': _value_balance(valuation, balance, day, asset_id),
+        }
+        for wallet_id, asset_id, balance in rows
+    ]
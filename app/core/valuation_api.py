@@ -0,0 +1,59 @@
+from datetime import date
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.decorators import (
+    api_view,
+    authentication_classes,
+    permission_classes,
+)
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from .authentication import TokenUserJWTAuthentication
+from .valuation import USD, Valuation, value_balances, value_transactions
+
+
+def date_param(params, name, default=None):
+    value = params.get(name)
+    return date.fromisoformat(value) if value else default
+
+
+@api_view(['GET'])
+@authentication_classes([TokenUserJWTAuthentication])
+@permission_classes([IsAuthenticated])
+def get_valuation(request):
+    # ?currency=eur&date=YYYY-MM-DD&from=YYYY-MM-DD&prices_of=YYYY-MM-DD&real=false
+    params = request.query_params
+    currency = params.get('currency', USD).lower()
+    real = params.get('real', 'true').lower() not in ('0', 'false')
+    try:
+        day = date_param(params, 'date', timezone.now().date())
+        since = date_param(params, 'from')
+        prices_of = date_param(params, 'prices_of', day)
+    except ValueError:
+        return Response(
+            {'detail': 'Invalid date format. It should be YYYY-MM-DD.'},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    try:
+        valuation = Valuation(currency, real=real, prices_of=prices_of)
+    except ValueError as e:
+        return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    wallets = value_balances(request.user.id, valuation, day)
+    data = {
+        'currency': currency,
+        'date': day.isoformat(),
+        # Values are in prices of this day, or nominal
+        'prices_of': prices_of.isoformat() if real else None,
+        # Of the wallets that could be valued, the others have a null value
+        'total': sum(
+            wallet['value'] for wallet in wallets if wallet['value'] is not None
+        ),
+        'wallets': wallets,
+    }
+    if since is not None:
+        # Flows between from and date, each valued on the day it happened
+        data['transactions'] = value_transactions(
+            request.user.id, valuation, since, day
+        )
+    return Response(data)
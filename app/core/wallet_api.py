@@ -1,19 +1,32 @@
 from rest_framework import generics, status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
-from rest_framework.exceptions import PermissionDenied
+from rest_framework.exceptions import NotFound
 from rest_framework.response import Response
-from .serializers import KeiboUserSerializer, WalletSerializer
-from .models import KeiboUser, Wallet, WalletUser
+from .serializers import KeiboUserSerializer, WalletSerializer, WalletListSerializer
+from .models import KeiboUser, Wallet, WalletUser, WalletDailySnapshot
+from .market_api import filter_date_range
+from .live import publish_wallet_changes
+from .metrics import query_budget
+from .cache import invalidate_wallet_users_on_commit
+from .permissions import (
+    OWNER,
+    WalletPermission,
+    WalletRolePermission,
+    invalidate_memberships,
+    wallet_role,
+)
 import uuid
 import time
 
 
+@query_budget(2)
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_wallets(request, role=None, range=None):
-    # Get the WalletUser objects associated with the authenticated user
-    wallet_users_query = WalletUser.objects.filter(user=request.user)
+    # Wallets of the authenticated user with role, category and val_usd
+    # resolved in one joined query
+    wallets_query = Wallet.objects.for_user(request.user).with_valuation()
 
     # Convert role and range to integer if present
     role = int(role) if role is not None else None
@@ -22,30 +35,13 @@ def get_wallets(request, role=None, range=None):
     # Apply role and range filters if needed
     if role is not None:
         if range is None or range == 0:
-            wallet_users_query = wallet_users_query.filter(role=role)
+            wallets_query = wallets_query.filter(role=role)
         elif range < 0:
-            wallet_users_query = wallet_users_query.filter(
-                role__lte=role, role__gte=role + range
-            )
+            wallets_query = wallets_query.filter(role__lte=role, role__gte=role + range)
         else:
-            wallet_users_query = wallet_users_query.filter(
-                role__gte=role, role__lte=role + range
-            )
-
-    # Get the Wallet objects associated with the wallet_users
-    wallets = [wallet_user.wallet for wallet_user in wallet_users_query]
-    serialized_wallets = WalletSerializer(wallets, many=True).data
-
-    # Attach the role property from the corresponding WalletUser model
-    serialized_wallets = []
-    for wallet_user in wallet_users_query:
-        wallet = wallet_user.wallet
-        asset = wallet.asset
-        wallet_data = WalletSerializer(wallet).data
-        wallet_data['role'] = wallet_user.role
-        wallet_data['category'] = asset.category
-        wallet_data['val_usd'] = float(wallet.balance * asset.exchange_rate)
-        serialized_wallets.append(wallet_data)
+            wallets_query = wallets_query.filter(role__gte=role, role__lte=role + range)
+
+    serialized_wallets = WalletListSerializer(wallets_query, many=True).data
     return Response(serialized_wallets)
 
 
@@ -72,6 +68,56 @@ def get_wallet_owner(request, id=None):
         )
 
 
+@query_budget(6)
+@api_view(['GET'])
+@permission_classes([IsAuthenticated, WalletRolePermission])
+def get_wallet_history(request, wallet_id):
+    # Daily balances of a wallet for charts, ?from=YYYY-MM-DD&to=YYYY-MM-DD
+    wallet = Wallet.objects.filter(id=wallet_id).only('balance').first()
+    if wallet is None:
+        raise NotFound()
+
+    snapshots = WalletDailySnapshot.objects.filter(wallet=wallet)
+    try:
+        days = filter_date_range(snapshots, request)
+    except ValueError:
+        return Response(
+            {'detail': 'Invalid date format. It should be YYYY-MM-DD.'},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    # Snapshots sum the transactions only. The difference with the wallet
+    # balance (initial balance, retroactive entries) is carried by every day.
+    latest = snapshots.order_by('-date').values_list('closing_balance', flat=True)
+    offset = wallet.balance - (latest.first() or 0)
+    rows = days.order_by('date').values_list(
+        'date', 'closing_balance', 'inflow', 'outflow', 'category_totals'
+    )
+    opening = None
+    if request.query_params.get('from'):
+        opening = (
+            latest.filter(date__lt=request.query_params['from']).first() or 0
+        ) + offset
+
+    return Response(
+        {
+            # Balance at the end of the day before the range
+            'opening_balance': float(opening) if opening is not None else None,
+            'days': [
+                {
+                    'date': day.isoformat(),
+                    'balance': float(closing_balance + offset),
+                    'inflow': float(inflow),
+                    'outflow': float(outflow),
+                    'categories': category_totals,
+                }
+                for day, closing_balance, inflow, outflow, category_totals in rows
+            ],
+        }
+    )
+
+
+@query_budget(4)
 class WalletCreateView(generics.ListCreateAPIView):
     queryset = Wallet.objects.all()
     serializer_class = WalletSerializer
@@ -82,51 +128,49 @@ class WalletCreateView(generics.ListCreateAPIView):
         WalletUser.objects.create(
             user=self.request.user,
             wallet=wallet,
-            role=4,
+            role=OWNER,
             granted_at=int(time.time() * 1000),
         )
 
 
 class WalletUpdateView(generics.RetrieveUpdateDestroyAPIView):
-    queryset = Wallet.objects.all()
+    queryset = Wallet.objects.select_related('asset')
     serializer_class = WalletSerializer
-    permission_classes = [IsAuthenticated]
+    # Viewers read, managers update and the owner deletes (public wallets
+    # can be read by anyone)
+    permission_classes = [IsAuthenticated, WalletPermission]
 
     def retrieve(self, request, *args, **kwargs):
         instance: Wallet = self.get_object()
-        # Check if the authenticated user is related to this wallet through a WalletUser
-        wallet_user = WalletUser.objects.filter(
-            user=request.user, wallet=instance
-        ).first()  # exists()
-
-        # If the wallet is not public and the user doesn't have access via WalletUser, raise PermissionDenied
-        if not instance.is_public and not wallet_user:
-            raise PermissionDenied("You do not have permission to access this wallet.")
         serializer = self.get_serializer(instance)
         data = serializer.data
-        if wallet_user:
-            data['role'] = wallet_user.role
-        else:
-            data['role'] = 0
+        data['role'] = wallet_role(request, instance.id)
         data['category'] = instance.asset.category
         data['val_usd'] = float(instance.balance * instance.asset.exchange_rate)
         return Response(data)
 
-    def update(self, request, *args, **kwargs):
-        instance = self.get_object()
-        wallet_user = WalletUser.objects.filter(
-            user=request.user, wallet=instance
-        ).first()
-        if not wallet_user or wallet_user.role < 3:
-            raise PermissionDenied("You do not have permission to update this wallet.")
-        return super().update(request, *args, **kwargs)
-
-    def destroy(self, request, *args, **kwargs):
-        instance = self.get_object()
-        wallet_user = WalletUser.objects.filter(
-            user=request.user, wallet=instance
-        ).first()
-        if not wallet_user or wallet_user.role != 4:
-            raise PermissionDenied("You do not have permission to delete this wallet.")
-        return super().destroy(request, *args, **kwargs)
+    def perform_update(self, serializer):
+        # Push only the fields whose value changed
+        fields = list(WalletSerializer.Meta.fields)
+        previous = {
+            field: serializer.instance.serializable_value(field) for field in fields
+        }
+        wallet = serializer.save()
+        invalidate_wallet_users_on_commit([wallet.id])
+        publish_wallet_changes(
+            {
+                wallet.id: {
+                    field: wallet.serializable_value(field)
+                    for field in fields
+                    if wallet.serializable_value(field) != previous[field]
+                }
+            }
+        )
 
+    def perform_destroy(self, instance):
+        # The users are looked up before their WalletUser rows are deleted
+        user_ids = list(
+            WalletUser.objects.filter(wallet=instance).values_list('user_id', flat=True)
+        )
+        instance.delete()
+        invalidate_memberships(user_ids)
@@ -0,0 +1,46 @@
+from channels.db import database_sync_to_async
+from channels.middleware import BaseMiddleware
+from django.conf import settings
+from rest_framework_simplejwt.exceptions import (
+    AuthenticationFailed,
+    InvalidToken,
+    TokenError,
+)
+from .authentication import CustomJWTAuthentication
+
+
+def get_raw_token(scope):
+    # Browsers send the auth cookie with the websocket handshake, other
+    # clients can use the same "Authorization: Bearer <token>" header as the API
+    for name, value in scope.get('headers', []):
+        if name == b'authorization':
+            parts = value.split()
+            if len(parts) == 2:
+                return parts[1].decode('latin1')
+    return scope.get('cookies', {}).get(settings.AUTH_COOKIE)
+
+
+@database_sync_to_async
+def get_token_user(raw_token):
+    authentication = CustomJWTAuthentication()
+    try:
+        validated_token = authentication.get_validated_token(raw_token)
+        return authentication.get_user(validated_token)
+    except (AuthenticationFailed, InvalidToken, TokenError):
+        return None
+
+
+class JWTAuthMiddleware(BaseMiddleware):
+    """
+    Authenticate websocket connections with the same JWT as the REST API.
+    Must be wrapped by a CookieMiddleware (AuthMiddlewareStack does it), the
+    session user is left in scope["user"] when there is no valid token.
+    """
+
+    async def __call__(self, scope, receive, send):
+        raw_token = get_raw_token(scope)
+        if raw_token:
+            user = await get_token_user(raw_token)
+            if user is not None:
+                scope = dict(scope, user=user)
+        return await super().__call__(scope, receive, send)
@@ -0,0 +1,61 @@
+import logging
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+from .live import asset_group, wallet_group
+from .models import Wallet
+
+logger = logging.getLogger(__name__)
+
+
+@database_sync_to_async
+def get_subscription_groups(user) -> set:
+    # The wallets of the user and the assets they hold, in one query
+    groups = set()
+    for wallet_id, asset_id in Wallet.objects.for_user(user).values_list(
+        'id', 'asset_id'
+    ):
+        groups.add(wallet_group(wallet_id))
+        groups.add(asset_group(asset_id))
+    return groups
+
+
+class LiveWSConsumer(AsyncJsonWebsocketConsumer):
+    """
+    Pushes balance and exchange rate changes of the wallets of the user.
+    Messages only carry the changed fields:
+    {"kind": "wallet", "id": <wallet id>, "balance": 12.5}
+    {"kind": "asset", "id": <asset id>, "exchange_rate": 1.0001}
+    Clients send "ping" to keep the connection alive, and {"action": "resync"}
+    after creating or joining a wallet to subscribe to it.
+    """
+
+    async def connect(self):
+        self.groups_joined = set()
+        user = self.scope.get("user")
+        if user is None or not user.is_authenticated:
+            await self.close()
+            return
+        await self.accept()
+        await self.subscribe()
+
+    async def subscribe(self):
+        groups = await get_subscription_groups(self.scope["user"])
+        for group in groups - self.groups_joined:
+            await self.channel_layer.group_add(group, self.channel_name)
+        for group in self.groups_joined - groups:
+            await self.channel_layer.group_discard(group, self.channel_name)
+        self.groups_joined = groups
+        await self.send_json({"kind": "subscribed", "groups": len(groups)})
+
+    async def receive_json(self, content, **kwargs):
+        if content == "ping":
+            await self.send_json({"message": "pong"})
+        elif isinstance(content, dict) and content.get("action") == "resync":
+            await self.subscribe()
+
+    async def live_update(self, event):
+        await self.send_json(event["data"])
+
+    async def disconnect(self, close_code):
+        for group in getattr(self, "groups_joined", ()):
+            await self.channel_layer.group_discard(group, self.channel_name)
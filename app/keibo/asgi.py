@@ -9,7 +9,6 @@ https://docs.djangoproject.com/en/4.1/howto/deployment/asgi/
 
 import os
 import django
-import core.routing
 from django.core.asgi import get_asgi_application
 from channels.routing import ProtocolTypeRouter, URLRouter  # get_default_application
 from django.core.asgi import get_asgi_application
@@ -18,12 +17,18 @@ from channels.auth import AuthMiddlewareStack
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'keibo.settings')
 django.setup()
 
+# Imported once the apps are loaded, the consumers use the models
+import core.routing  # noqa: E402
+from core.ws_auth import JWTAuthMiddleware  # noqa: E402
+
 application = ProtocolTypeRouter(
     {
         "http": get_asgi_application(),
         "websocket": AuthMiddlewareStack(
-            URLRouter(
-                core.routing.websocket_urlpatterns  # Replace with your actual WebSocket URL patterns
+            JWTAuthMiddleware(
+                URLRouter(
+                    core.routing.websocket_urlpatterns  # Replace with your actual WebSocket URL patterns
+                )
             )
         ),
     }
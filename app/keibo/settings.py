@@ -63,6 +63,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.metrics.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -73,6 +74,11 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Per view metrics in Redis, see core.metrics
+REQUEST_METRICS = getenv('REQUEST_METRICS', 'True') == 'True'
+# Views going over their query budget fail instead of logging a warning
+QUERY_BUDGETS_STRICT = getenv('QUERY_BUDGETS_STRICT', 'False') == 'True'
+
 ROOT_URLCONF = 'keibo.urls'
 
 TEMPLATES = [
@@ -144,7 +150,11 @@ API_CRYPTO_PRICES_HOST = getenv('API_CRYPTO_PRICES_HOST')
 API_CRYPTO_PRICES = getenv('API_CRYPTO_PRICES')
 # Dynamic API - Indexes
 API_FRED_KEY = getenv('API_FRED_KEY')
+API_FRED_URL = getenv(
+    'API_FRED_URL', 'https://api.stlouisfed.org/fred/series/observations'
+)
 API_ECOS_BOK_KR_KEY = getenv('API_ECOS_BOK_KR_KEY')
+API_ECOS_URL = getenv('API_ECOS_URL', 'https://ecos.bok.or.kr/api/StatisticSearch')
 
 # Logging configuration
 LOGGING = {